@@ -4,12 +4,10 @@ import argparse
 import time
 import os
 import sys
-from split_fa import Splitter
-from filter_contigs import Filter
-from index import index_file
+from prepare_fasta import Preparer
 
 
-def index_fasta(name, filepath, out_dir, type_f, dofilter = True):
+def index_fasta(name, filepath, out_dir, type_f, dofilter = True, compress_level=6, compress_threads=1):
     """
     Index and filter fasta
 
@@ -17,42 +15,16 @@ def index_fasta(name, filepath, out_dir, type_f, dofilter = True):
     :param filepath: full path of the fasta file
     :param out_dir: output folder
     :param type_f: type of fasta (query or target)
+    :param compress_level: compression level of gzipped fasta
+    :param compress_threads: number of threads used to compress gzipped fasta
     """
-    uncompressed = None
-    if filepath.endswith(".gz") and dofilter:
-        uncompressed = filepath[:-3]
     index = os.path.join(out_dir, type_f + ".idx")
-    success, nb_contigs, error = index_file(filepath, name, index, uncompressed)
-    if success:
-        is_filtered = False
-        if dofilter:
-            in_fasta = filepath
-            if uncompressed is not None:
-                in_fasta = uncompressed
-            filtered_fasta = os.path.join(os.path.dirname(in_fasta), "filtered_" + os.path.basename(in_fasta))
-            filter_f = Filter(fasta=in_fasta,
-                              index_file=index,
-                              type_f=type_f,
-                              min_filtered=nb_contigs / 4,
-                              split=False,
-                              out_fasta=filtered_fasta,
-                              replace_fa=True)
-            is_filtered = filter_f.filter()
-        if uncompressed is not None:
-            if is_filtered:
-                os.remove(filepath)
-                with open(os.path.join(out_dir, "." + type_f), "w") as save_file:
-                    save_file.write(uncompressed)
-            else:
-                os.remove(uncompressed)
-
-    else:
+    # Filtered fasta replaces the input one. A gzipped fasta is kept compressed, in BGZF format:
+    preparer = Preparer(fasta=filepath, name=name, index_file=index, type_f=type_f, out_fasta=filepath,
+                        do_filter=dofilter, compress_level=compress_level, compress_threads=compress_threads)
+    success, error = preparer.prepare()
+    if not success:
         print("###ERR### %s fasta  file is not valid:<br/> %s" % (type_f[0].upper() + type_f[1:], error), file=sys.stderr)
-        if uncompressed is not None:
-            try:
-                os.remove(uncompressed)
-            except FileNotFoundError:
-                pass
         exit(1)
 
 
@@ -69,6 +41,10 @@ parser.add_argument('--split', type=bool, const=True, nargs="?", required=False,
                         help="Split query")
 parser.add_argument('--index-only', type=bool, const=True, nargs="?", required=False, default=False,
                         help="Index files only. No split, no filter.")
+parser.add_argument('-l', '--compress-level', type=int, required=False, default=6,
+                    help="Compression level of gzipped fasta files")
+parser.add_argument('-@', '--compress-threads', type=int, required=False, default=1,
+                    help="Number of threads used to compress gzipped fasta files")
 args = parser.parse_args()
 
 if args.index_only and args.split:
@@ -81,33 +57,24 @@ with open(args.preptime_file, "w") as ptime:
     if args.query is not None:
         if args.split:
             print("Splitting query...")
-            fasta_in = args.query
-            index_split = os.path.join(out_dir, "query_split.idx")
-            splitter = Splitter(input_f=fasta_in, name_f=args.query_name, output_f=args.query_split,
-                                query_index=index_split)
-            success, error = splitter.split()
-            if success:
-                filtered_fasta = os.path.join(os.path.dirname(args.query_split), "filtered_" +
-                                              os.path.basename(args.query_split))
-                filter_f = Filter(fasta=args.query_split,
-                                  index_file=index_split,
-                                  type_f="query",
-                                  min_filtered=splitter.nb_contigs / 4,
-                                  split=True,
-                                  out_fasta=filtered_fasta,
-                                  replace_fa=True)
-                filter_f.filter()
-            else:
+            preparer = Preparer(fasta=args.query, name=args.query_name,
+                                index_file=os.path.join(out_dir, "query_split.idx"), type_f="query",
+                                out_fasta=args.query_split, split=True, compress_level=args.compress_level,
+                                compress_threads=args.compress_threads)
+            success, error = preparer.prepare()
+            if not success:
                 print("###ERR### Query fasta file is not valid:<br/> %s" % error, file=sys.stderr)
                 exit(1)
         else:
             print("Indexing query...")
             index_fasta(name=args.query_name, filepath=args.query, out_dir=out_dir, type_f="query",
-                        dofilter=not args.index_only)
+                        dofilter=not args.index_only, compress_level=args.compress_level,
+                        compress_threads=args.compress_threads)
     if args.target is not None:
         print("Indexing target...")
         index_fasta(name=args.target_name, filepath=args.target, out_dir=out_dir, type_f="target",
-                    dofilter=not args.index_only)
+                    dofilter=not args.index_only, compress_level=args.compress_level,
+                    compress_threads=args.compress_threads)
 
     ptime.write(str(round(time.time())) + "\n")
 
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+import os
+import zlib
+import struct
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BgzfWriter:
+
+    """
+    Write a BGZF file (blocked gzip, as written by bgzip): a series of small gzip members, so the file can be read by
+    any gzip reader and accessed randomly with its index (.gzi).
+
+    The .gzi index is the samtools one: number of entries, then compressed and uncompressed offsets of each block
+    (except the first one), as little-endian unsigned 64 bits integers.
+
+    Blocks are independent, so they can be compressed by several threads (zlib releases the GIL). They are written in
+    order, and only a few blocks by thread are kept in memory.
+    """
+
+    # Max size of uncompressed data in a block: the compressed block always fits in 64 kb (same as bgzip)
+    block_size = 65280
+    # Gzip header with the BGZF extra field (BC), followed by the size of the block minus 1
+    header = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+    eof = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+
+    def __init__(self, path, level=6, gzi=None, threads=1):
+        """
+
+        :param path: output file path
+        :type path: str
+        :param level: compression level (0-9)
+        :type level: int
+        :param gzi: path of the index file to write. If None, no index is written
+        :type gzi: str
+        :param threads: number of compression threads
+        :type threads: int
+        """
+        self.path = path
+        self.level = level
+        self.gzi = gzi
+        self.threads = threads
+        self.index = []  # (compressed offset, uncompressed offset) of each block, except the first one
+        self._file = open(path, "wb")
+        self._buffer = bytearray()
+        self._c_offset = 0
+        self._u_offset = 0
+        self._pool = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+        self._pending = deque()  # (uncompressed size, future of the compressed block) of blocks not written yet
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, data):
+        """
+        Write data
+
+        :param data: uncompressed data
+        :type data: bytes
+        """
+        self._buffer += data
+        if len(self._buffer) >= self.block_size:
+            nb_blocks = len(self._buffer) // self.block_size
+            for i in range(nb_blocks):
+                self._add_block(bytes(self._buffer[i * self.block_size:(i + 1) * self.block_size]))
+            del self._buffer[:nb_blocks * self.block_size]
+
+    def _add_block(self, data):
+        """
+        Compress a block and write it. With several threads, the block is written once it is compressed and all
+        previous blocks are written
+
+        :param data: uncompressed data of the block
+        :type data: bytes
+        """
+        if self._pool is None:
+            self._write_block(len(data), self.compress_block(data, self.level))
+            return
+        self._pending.append((len(data), self._pool.submit(self.compress_block, data, self.level)))
+        while len(self._pending) > 4 * self.threads:
+            u_size, block = self._pending.popleft()
+            self._write_block(u_size, block.result())
+
+    @classmethod
+    def compress_block(cls, data, level):
+        """
+        Build a BGZF block
+
+        :param data: uncompressed data of the block
+        :type data: bytes
+        :param level: compression level
+        :type level: int
+        :return: the block
+        :rtype: bytes
+        """
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        deflated = compressor.compress(data) + compressor.flush()
+        return b"".join((cls.header, struct.pack("<H", len(deflated) + len(cls.header) + 9), deflated,
+                         struct.pack("<II", zlib.crc32(data), len(data))))
+
+    def _write_block(self, u_size, block):
+        """
+        Write a compressed block
+
+        :param u_size: uncompressed size of the block
+        :type u_size: int
+        :param block: the block
+        :type block: bytes
+        """
+        if self._u_offset > 0:
+            self.index.append((self._c_offset, self._u_offset))
+        self._file.write(block)
+        self._c_offset += len(block)
+        self._u_offset += u_size
+
+    def close(self):
+        """
+        Write remaining data and the end of file marker, then write the index
+        """
+        if self._file.closed:
+            return
+        try:
+            if len(self._buffer) > 0:
+                self._add_block(bytes(self._buffer))
+                self._buffer = bytearray()
+            while len(self._pending) > 0:
+                u_size, block = self._pending.popleft()
+                self._write_block(u_size, block.result())
+            self._file.write(self.eof)
+        finally:
+            self._file.close()
+            if self._pool is not None:
+                self._pool.shutdown()
+        if self.gzi is not None:
+            write_gzi(self.gzi, self.index)
+
+
+class BgzfReader:
+
+    """
+    Read ranges of the uncompressed content of a BGZF file, by decompressing only the blocks which contain them
+    """
+
+    def __init__(self, path, gzi=None):
+        """
+
+        :param path: BGZF file path
+        :type path: str
+        :param gzi: index file path. If None or if the file does not exist, blocks are located by reading their headers
+        :type gzi: str
+        """
+        self.path = path
+        index = load_gzi(gzi) if gzi is not None and os.path.exists(gzi) else scan_blocks(path)
+        self._c_offsets = [0] + [offsets[0] for offsets in index]
+        self._u_offsets = [0] + [offsets[1] for offsets in index]
+
+    def read_range(self, start, end):
+        """
+        Read a range of the uncompressed content
+
+        :param start: start of the range (uncompressed offset)
+        :type start: int
+        :param end: end of the range (uncompressed offset, excluded)
+        :type end: int
+        :return: generator of data chunks (at most one by block)
+        :rtype: generator
+        """
+        i = bisect_right(self._u_offsets, start) - 1
+        pos = self._u_offsets[i]
+        with open(self.path, "rb") as bgzf:
+            bgzf.seek(self._c_offsets[i])
+            while pos < end:
+                block_size = read_block_size(bgzf)
+                if block_size is None:
+                    break
+                data = bgzf.read(block_size)
+                raw = zlib.decompress(data[:-8], -15)
+                if pos + len(raw) > start:
+                    yield raw[max(start - pos, 0):end - pos]
+                pos += len(raw)
+
+
+def read_block_size(bgzf):
+    """
+    Read header of a BGZF block
+
+    :param bgzf: BGZF file, at the start of a block
+    :type bgzf: file
+    :return: size of the block after its header, or None at end of file or if it is not a BGZF block
+    :rtype: int
+    """
+    header = bgzf.read(12)
+    if len(header) < 12 or header[:4] != b"\x1f\x8b\x08\x04":
+        return None
+    x_len = struct.unpack("<H", header[10:12])[0]
+    extra = bgzf.read(x_len)
+    pos = 0
+    while pos + 4 <= len(extra):
+        sub_len = struct.unpack("<H", extra[pos + 2:pos + 4])[0]
+        if extra[pos:pos + 2] == b"BC" and sub_len == 2:
+            return struct.unpack("<H", extra[pos + 4:pos + 6])[0] + 1 - 12 - x_len
+        pos += 4 + sub_len
+    return None
+
+
+def is_bgzf(path):
+    """
+    Check if a file is compressed in BGZF format
+
+    :param path: file path
+    :type path: str
+    :return: True if the file is a BGZF file, else False
+    :rtype: bool
+    """
+    with open(path, "rb") as bgzf:
+        return read_block_size(bgzf) is not None
+
+
+def scan_blocks(path):
+    """
+    Build the index of a BGZF file by reading headers and sizes of its blocks (blocks are not decompressed)
+
+    :param path: BGZF file path
+    :type path: str
+    :return: (compressed offset, uncompressed offset) of each block, except the first one
+    :rtype: list
+    """
+    index = []
+    u_offset = 0
+    with open(path, "rb") as bgzf:
+        while True:
+            c_offset = bgzf.tell()
+            block_size = read_block_size(bgzf)
+            if block_size is None:
+                break
+            bgzf.seek(block_size - 4, os.SEEK_CUR)
+            i_size = struct.unpack("<I", bgzf.read(4))[0]
+            if i_size > 0:  # Skip empty blocks (end of file marker)
+                if u_offset > 0:
+                    index.append((c_offset, u_offset))
+                u_offset += i_size
+    return index
+
+
+def write_gzi(gzi, index):
+    """
+    Write index of a BGZF file
+
+    :param gzi: index file path
+    :type gzi: str
+    :param index: (compressed offset, uncompressed offset) of each block, except the first one
+    :type index: list
+    """
+    with open(gzi, "wb") as gzi_f:
+        gzi_f.write(struct.pack("<Q", len(index)))
+        for offsets in index:
+            gzi_f.write(struct.pack("<QQ", *offsets))
+
+
+def load_gzi(gzi):
+    """
+    Load index of a BGZF file
+
+    :param gzi: index file path
+    :type gzi: str
+    :return: (compressed offset, uncompressed offset) of each block, except the first one
+    :rtype: list
+    """
+    with open(gzi, "rb") as gzi_f:
+        nb_entries = struct.unpack("<Q", gzi_f.read(8))[0]
+        data = gzi_f.read(nb_entries * 16)
+    return [struct.unpack_from("<QQ", data, i * 16) for i in range(nb_entries)]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compress a file in BGZF format and index it")
+    parser.add_argument('-i', '--input', type=str, required=True, help="Input file (can be gzipped)")
+    parser.add_argument('-o', '--output', type=str, required=True, help="Output BGZF file (index: <output>.gzi)")
+    parser.add_argument('-l', '--level', type=int, required=False, default=6, help="Compression level")
+    parser.add_argument('-@', '--threads', type=int, required=False, default=1, help="Number of compression threads")
+    args = parser.parse_args()
+
+    from xopen import xopen
+    with xopen(args.input, "rb") as in_f, BgzfWriter(args.output, args.level, args.output + ".gzi",
+                                                     args.threads) as out_f:
+        while True:
+            chunk = in_f.read(16 * 1024 * 1024)
+            if len(chunk) == 0:
+                break
+            out_f.write(chunk)
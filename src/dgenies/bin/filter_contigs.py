@@ -1,14 +1,12 @@
 #!/usr/bin/env python3
 
 import os
-import re
 import shutil
 try:
-    from dgenies.bin.index import Index
+    from dgenies.bin.index import Index, FastaIndexer, copy_ranges
 except ImportError:
-    from index import Index
+    from index import Index, FastaIndexer, copy_ranges
 from pathlib import Path
-from Bio import SeqIO
 
 
 class Filter:
@@ -53,15 +51,16 @@ class Filter:
         :return: True if success, else False
         :rtype: bool
         """
-        f_outs = self._check_filter()
+        f_outs = self.check_filter()
         if len(f_outs) > 0:
             self._filter_out(f_outs=f_outs)
             return True
         return False
 
-    def _check_filter(self):
+    def check_filter(self):
         """
-        Load index of fasta file, and determine contigs which must be removed. Remove them only in the index
+        Load index of fasta file, and determine contigs which must be removed. Remove them only in the index: the fasta
+        file is not modified (see :func:`filter`)
 
         :return: list of contigs which must be removed
         :rtype: list
@@ -71,7 +70,7 @@ class Filter:
                                                                         merge_splits=self.split)
 
         # Sort contigs:
-        contigs_order = sorted(order, key=lambda x: -contigs[x])
+        contigs_order = sorted(order, key=contigs.get, reverse=True)
 
         # Find the N90:
         sum_l = 0
@@ -114,19 +113,23 @@ class Filter:
                     f_outs = []
                     name, contigs_order_split, contigs, reversed_c, abs_start_split, c_len_split = \
                         Index.load(index_file=self.index_file, merge_splits=False)
+                    kept_set = set(kept)
                     kept_s = []
                     for contig in contigs_order_split:
-                        match = re.match(r"(.+)_###_\d+", contig)
+                        match = Index.split_pattern.match(contig) if "_###_" in contig else None
                         contig_name = contig
                         if match is not None:
                             contig_name = match.group(1)
-                        if contig_name in kept:
+                        if contig_name in kept_set:
                             kept_s.append(contig)
                         else:
                             f_outs.append(contig)
                     kept = kept_s
                 else:
-                    kept.sort(key=lambda k: order.index(k))
+                    positions = {}
+                    for i, contig in enumerate(order):
+                        positions.setdefault(contig, i)
+                    kept.sort(key=positions.get)
                 Index.save(index_file=self.index_file,
                            name=name,
                            contigs=contigs,
@@ -137,17 +140,72 @@ class Filter:
 
         return f_outs
 
+    def _get_records(self):
+        """
+        Get byte range of each contig in the fasta file. Ranges are read from the samtools index (.fai) of the fasta
+        file if it exists and is up to date, else the fasta file is indexed
+
+        :return:
+            * [0] name, start and end of each contig in the fasta file
+            * [1] True if ranges can be copied directly from the fasta file, False if it must be read through
+                :class:`dgenies.bin.index.FastaIndexer` (gzipped file or Windows line endings)
+            * [2] indexer used to read the fasta file, if any
+        :rtype: (list, bool, FastaIndexer)
+        """
+        fai = self.fasta + ".fai"
+        if not self.fasta.endswith(".gz") and os.path.exists(fai) and \
+                os.path.getmtime(fai) >= os.path.getmtime(self.fasta):
+            names = []
+            starts = []
+            seq_end = 0
+            with open(fai, "r") as fai_f, open(self.fasta, "rb") as fasta_f:
+                for line in fai_f:
+                    name, length, seq_offset, line_bases, line_width = line.rstrip("\n").split("\t")[:5]
+                    length, seq_offset, line_bases, line_width = int(length), int(seq_offset), int(line_bases), \
+                        int(line_width)
+                    # Header is the last line between the end of the previous sequence and this one:
+                    gap = os.pread(fasta_f.fileno(), seq_offset - seq_end, seq_end)
+                    names.append(name)
+                    starts.append(seq_end + gap.rstrip(b"\r\n").rfind(b"\n") + 1)
+                    nb_lines = -(-length // line_bases) if line_bases > 0 else 0
+                    seq_end = seq_offset + length + nb_lines * (line_width - line_bases)
+            if len(starts) > 0:
+                starts[0] = 0
+            ends = starts[1:] + [os.path.getsize(self.fasta)]
+            return list(zip(names, starts, ends)), True, None
+
+        indexer = FastaIndexer()
+        for block in indexer.read_blocks(self.fasta):
+            indexer.feed(block)
+        indexer.close()
+        ends = indexer.starts[1:] + [indexer.offset]
+        records = [(contig[0], start, end) for contig, start, end in zip(indexer.contigs, indexer.starts, ends)]
+        return records, not indexer.has_cr and not self.fasta.endswith(".gz"), indexer
+
     def _filter_out(self, f_outs):
         """
-        Remove too small contigs from Fasta file
+        Remove too small contigs from Fasta file. Byte ranges of kept contigs are copied from the input fasta file,
+        without parsing sequences
 
         :param f_outs: contigs which must be filtered out
         :type f_outs: list
         """
-        sequences = SeqIO.parse(open(self.fasta), "fasta")
-        keeped = (record for record in sequences if record.name not in f_outs)
-        with open(self.out_fasta, "w") as out_fa:
-            SeqIO.write(keeped, out_fa, "fasta")
+        f_outs = set(f_outs)
+        records, raw_copy, indexer = self._get_records()
+        ranges = []
+        for name, start, end in records:
+            if name not in f_outs:
+                if len(ranges) > 0 and ranges[-1][1] == start:
+                    ranges[-1][1] = end  # Consecutive contigs are copied at once
+                else:
+                    ranges.append([start, end])
+
+        with open(self.out_fasta, "wb") as out_fa:
+            if raw_copy:
+                copy_ranges(self.fasta, ranges, out_fa)
+            else:
+                for i, data in indexer.read_ranges(self.fasta, ranges):
+                    out_fa.write(data)
 
         if self.replace_fa:
             os.remove(self.fasta)
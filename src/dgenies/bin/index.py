@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 
-import io
+import os
 import re
 from xopen import xopen
+try:
+    from dgenies.bin.bgzf import BgzfReader
+except ImportError:
+    from bgzf import BgzfReader
 
 
 class Index:
@@ -11,6 +15,9 @@ class Index:
     Manage Fasta Index
     """
 
+    # Name of a part of a split contig: <contig>_###_<part number>
+    split_pattern = re.compile(r"(.+)_###_\d+")
+
     def __init__(self):
         pass
 
@@ -44,8 +51,8 @@ class Index:
                 parts = line.strip("\n").split("\t")
                 id_c = parts[0]
                 is_split = False
-                if merge_splits:
-                    match = re.match(r"(.+)_###_\d+", id_c)
+                if merge_splits and "_###_" in id_c:
+                    match = Index.split_pattern.match(id_c)
                     if match is not None:
                         id_c = match.group(1)
                         is_split = True
@@ -54,7 +61,7 @@ class Index:
                     reversed_c[id_c] = parts[2] == "1"
                 else:
                     reversed_c[id_c] = False
-                if not is_split or (is_split and id_c not in order):
+                if not is_split or (is_split and id_c not in contigs):
                     order.append(id_c)
                     abs_start[id_c] = abs_current_start
                     contigs[id_c] = len_c
@@ -87,7 +94,334 @@ class Index:
                           + "\n")
 
 
-def index_file(fasta_path, fasta_name, out, write_fa=None):
+class FastaIndexer:
+
+    """
+    Index a fasta file read by large binary blocks.
+
+    Blocks are split on headers only: sequence lines between two headers are validated and counted at once with
+    bytes methods (translate, count, find), and line-by-line parsing is only done to locate an error. Line endings are
+    normalized (CRLF and CR to LF), like when the file is read in text mode.
+
+    Besides contigs sizes, positions of sequences in the (normalized) fasta are collected to build a samtools
+    compatible fasta index (.fai): offset of the first base, number of bases per line and number of bytes per line.
+    """
+
+    block_size = 16 * 1024 * 1024
+    # Allowed sequence chars, plus newline: remaining chars after deleting them are invalid
+    seq_chars = b"ATGCKMRYSWBVHDXN.-atgckmryswbvhdxn\n"
+
+    def __init__(self):
+        self.contigs = []  # List of (name, length)
+        self.fai = []  # List of (name, length, offset, line bases, line width), same order as contigs
+        self.starts = []  # Offset of the header line of each contig, same order as contigs
+        self.fai_valid = True
+        self.has_header = False
+        self.has_cr = False  # True if the file has CR line endings
+        self.error = None
+        self.nb_line = 0
+        self.offset = 0  # Offset of the next block in the normalized fasta
+        self._next_header = False  # True if next line must be a header line
+        self._contig = None
+        self._len_c = 0
+        self._start = 0
+        self._seq_offset = 0
+        self._line_bases = None
+        self._last_line_short = False  # True if a line shorter than previous ones has been read for the current contig
+
+    def feed(self, block):
+        """
+        Index a block of the fasta file. Blocks must end with a newline, except the last one, and use LF line endings
+
+        :param block: block of the fasta file
+        :type block: bytes
+        :return: True if the block is valid, else False (see error attribute)
+        :rtype: bool
+        """
+        if self.error is not None:
+            return False
+        if len(block) > 0 and block[-1] != 10:
+            block += b"\n"
+        pos = 0
+        end_block = len(block)
+        while pos < end_block:
+            if block[pos] == 62:  # ">"
+                end = block.index(b"\n", pos)
+                if end - pos > 1:
+                    if not self._header(block[pos + 1:end], self.offset + pos, self.offset + end + 1):
+                        return False
+                    pos = end + 1
+                    continue
+            end = block.find(b">", pos + 1)
+            while end != -1 and block[end - 1] != 10:
+                end = block.find(b">", end + 1)
+            end = end_block if end == -1 else end
+            if not self._sequence(block, pos, end):
+                return False
+            pos = end
+        self.offset += end_block
+        return True
+
+    def _header(self, header, start, seq_offset):
+        """
+        Start a new contig
+
+        :param header: header line, without ">" and newline
+        :type header: bytes
+        :param start: offset of the header line
+        :type start: int
+        :param seq_offset: offset of the first base of the contig
+        :type seq_offset: int
+        :return: True if the previous contig is valid, else False
+        :rtype: bool
+        """
+        self.nb_line += 1
+        self.has_header = True
+        self._next_header = False
+        if not self._end_contig():
+            return False
+        self._contig = re.split(r"\s", header.decode("utf-8"))[0]
+        self._len_c = 0
+        self._start = start
+        self._seq_offset = seq_offset
+        self._line_bases = None
+        self._last_line_short = False
+        return True
+
+    def _end_contig(self):
+        """
+        Save the current contig
+
+        :return: True if the contig is valid, else False
+        :rtype: bool
+        """
+        if self._contig is not None:
+            if self._len_c == 0:
+                self.error = "Error: contig is empty: %s" % self._contig
+                return False
+            self._save_contig()
+        return True
+
+    def _save_contig(self):
+        """
+        Add the current contig to the index
+        """
+        self.contigs.append((self._contig, self._len_c))
+        self.starts.append(self._start)
+        self.fai.append((self._contig, self._len_c, self._seq_offset, self._line_bases, self._line_bases + 1))
+
+    def _sequence(self, block, start, end):
+        """
+        Index sequence lines of a block
+
+        :param block: block of the fasta file
+        :type block: bytes
+        :param start: start of the lines in the block
+        :type start: int
+        :param end: end of the lines in the block (after the last newline)
+        :type end: int
+        :return: True if lines are valid, else False
+        :rtype: bool
+        """
+        # Empty lines at the end (before the next header) are allowed:
+        core_end = end
+        while core_end > start and block[core_end - 1] == 10 and (core_end - 1 == start or block[core_end - 2] == 10):
+            core_end -= 1
+        if core_end > start:
+            core = block[start:core_end]
+            if self._next_header or core[0] == 10 or len(core.translate(None, self.seq_chars)) > 0:
+                return self._sequence_lines(core)
+            nb_lines = core.count(b"\n")
+            # Lines of same width can't be empty:
+            if not self._check_lines_width(core, nb_lines) and b"\n\n" in core:
+                return self._sequence_lines(core)
+            self._len_c += len(core) - nb_lines
+            self.nb_line += nb_lines
+        if end > core_end:
+            self._next_header = True
+            self.nb_line += end - core_end
+        return True
+
+    def _sequence_lines(self, lines):
+        """
+        Index sequence lines one by one, to find the invalid one
+
+        :param lines: sequence lines, without empty lines at the end
+        :type lines: bytes
+        :return: True if lines are valid, else False
+        :rtype: bool
+        """
+        for line in lines[:-1].split(b"\n"):
+            self.nb_line += 1
+            if len(line) == 0:
+                self._next_header = True
+            elif self._next_header:
+                self.error = "Error: new header line expected at line %d" % self.nb_line
+                return False
+            elif len(line.translate(None, self.seq_chars)) > 0:
+                self.error = "Error: invalid sequence at line %d" % self.nb_line
+                return False
+            else:
+                self._len_c += len(line)
+                self._check_lines_width(line + b"\n", 1)
+        return True
+
+    def _check_lines_width(self, lines, nb_lines):
+        """
+        Check that sequence lines can be described in a fasta index: all lines of a contig, except the last one, must
+        have the same length
+
+        :param lines: sequence lines, each one ending with a newline
+        :type lines: bytes
+        :param nb_lines: number of lines
+        :type nb_lines: int
+        :return: True if all lines have the same length as previous ones, except the last one which can be shorter
+        :rtype: bool
+        """
+        if self._line_bases is None:
+            self._line_bases = lines.index(b"\n")
+        if self._last_line_short or self._contig is None:
+            self.fai_valid = False
+            return False
+        width = self._line_bases + 1
+        nb_full = nb_lines if len(lines) == nb_lines * width else nb_lines - 1
+        # Newlines of full lines must be at each line width, and the last line must have the only other one:
+        if lines[self._line_bases:nb_full * width:width].count(b"\n") != nb_full or \
+                (nb_full < nb_lines and (len(lines) - nb_full * width > width or
+                                         lines.count(b"\n", nb_full * width) != 1)):
+            self.fai_valid = False
+            return False
+        # If the last line is shorter than others, no other line is allowed for this contig:
+        self._last_line_short = nb_full < nb_lines
+        return True
+
+    def close(self):
+        """
+        End the index: save the last contig
+
+        :return: True if the fasta file is valid, else False
+        :rtype: bool
+        """
+        if self.error is not None:
+            return False
+        if self._contig is not None and self._len_c > 0:
+            self._save_contig()
+        self._contig = None
+        return True
+
+    def read_blocks(self, fasta_path, block_size=None):
+        """
+        Read a fasta file by blocks ending with a newline (except the last one). Line endings are normalized to LF
+
+        :param fasta_path: fasta file path (can be gzipped)
+        :type fasta_path: str
+        :param block_size: size of read blocks
+        :type block_size: int
+        :return: generator of blocks
+        :rtype: generator
+        """
+        block_size = block_size or self.block_size
+        with (xopen(fasta_path, "rb") if fasta_path.endswith(".gz") else open(fasta_path, "rb")) as fasta:
+            while True:
+                block = fasta.read(block_size)
+                if len(block) == 0:
+                    break
+                # Complete the last line (a CR followed by a LF is completed too):
+                block += fasta.readline()
+                if b"\r" in block:
+                    self.has_cr = True
+                    block = block.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+                yield block
+
+    def read_ranges(self, fasta_path, ranges):
+        """
+        Read byte ranges of a fasta file (offsets are given in the normalized fasta, see :func:`read_blocks`). Reading
+        stops after the last range.
+
+        A gzipped fasta file with a BGZF index (.gzi, written with the BGZF copy of the normalized fasta, see
+        :class:`dgenies.bin.prepare_fasta.Preparer`) is read randomly: only blocks containing the ranges are
+        decompressed.
+
+        :param fasta_path: fasta file path (can be gzipped)
+        :type fasta_path: str
+        :param ranges: byte ranges, as (start, end, ...), sorted and not overlapping
+        :type ranges: list
+        :return: generator of (index of the range, data). Data of a range can be given in several chunks
+        :rtype: generator
+        """
+        if len(ranges) == 0:
+            return
+        if fasta_path.endswith(".gz") and os.path.exists(fasta_path + ".gzi"):
+            reader = BgzfReader(fasta_path, fasta_path + ".gzi")
+            for i, r in enumerate(ranges):
+                for data in reader.read_range(r[0], r[1]):
+                    yield i, data
+            return
+        i = 0
+        offset = 0
+        for block in self.read_blocks(fasta_path):
+            b_end = offset + len(block)
+            while i < len(ranges) and ranges[i][0] < b_end:
+                start, end = ranges[i][:2]
+                yield i, block[max(start - offset, 0):min(end, b_end) - offset]
+                if end > b_end:
+                    break
+                i += 1
+            if i == len(ranges):
+                break
+            offset = b_end
+
+    def write_fai(self, fai_file, fai=None):
+        """
+        Write samtools fasta index
+
+        :param fai_file: fai file path
+        :type fai_file: str
+        :param fai: index entries to write, as in the fai attribute (default: the fai attribute)
+        :type fai: list
+        """
+        with open(fai_file, "w") as fai_f:
+            for contig in (fai if fai is not None else self.fai):
+                fai_f.write("%s\t%d\t%d\t%d\t%d\n" % contig)
+
+
+def copy_ranges(fasta_path, ranges, out_file):
+    """
+    Copy byte ranges of an uncompressed file into another file. Copy is done by the kernel (copy_file_range) if
+    possible, else by large buffered reads
+
+    :param fasta_path: input file path
+    :type fasta_path: str
+    :param ranges: byte ranges, as (start, end, ...)
+    :type ranges: list
+    :param out_file: output file, opened in binary mode
+    :type out_file: file
+    """
+    out_file.flush()
+    with open(fasta_path, "rb") as in_f:
+        in_fd = in_f.fileno()
+        out_fd = out_file.fileno()
+        use_kernel = hasattr(os, "copy_file_range")
+        for r in ranges:
+            start, end = r[:2]
+            while start < end:
+                if use_kernel:
+                    try:
+                        copied = os.copy_file_range(in_fd, out_fd, end - start, start)
+                    except OSError:  # Not supported between these files
+                        use_kernel = False
+                        continue
+                else:
+                    in_f.seek(start)
+                    data = in_f.read(min(end - start, FastaIndexer.block_size))
+                    os.write(out_fd, data)
+                    copied = len(data)
+                if copied == 0:  # End of file
+                    break
+                start += copied
+
+
+def index_file(fasta_path, fasta_name, out, write_fa=None, fai=None):
     """
     Index fasta file
 
@@ -99,58 +433,44 @@ def index_file(fasta_path, fasta_name, out, write_fa=None):
     :type out: str
     :param write_fa: file path of the new fasta file to write, None to don't save fasta in a new file
     :type write_fa: str
+    :param fai: output samtools fasta index (.fai) file path, None to don't write it. Offsets are given in the written
+        fasta file if write_fa is set, else in the (uncompressed) input file. Not written if lines of a contig don't
+        have the same length
+    :type fai: str
     :return:
         * [0] True if success, else False
         * [1] Number of contigs
         * [2] Error message
     :rtype: (bool, int, str)
     """
-    has_header = False
-    next_header = False  # True if next line must be a header line
-    compressed = fasta_path.endswith(".gz")
-    nb_contigs = 0
+    indexer = FastaIndexer()
     write_f = None
     if write_fa is not None:
-        write_f = open(write_fa, "w")
-    with (xopen(fasta_path) if compressed else open(fasta_path)) as fasta, \
-            open(out, "w") as out_file:
-        out_file.write(fasta_name + "\n")
-        contig = None
-        len_c = 0
-        nb_line = 0
-        for line in fasta:
-            nb_line += 1
+        write_f = open(write_fa, "wb")
+    try:
+        for block in indexer.read_blocks(fasta_path):
             if write_f is not None:
-                write_f.write(line)
-            line = line.strip("\n")
-            if re.match(r"^>.+", line) is not None:
-                has_header = True
-                next_header = False
-                if contig is not None:
-                    if len_c > 0:
-                        nb_contigs += 1
-                        out_file.write("%s\t%d\n" % (contig, len_c))
-                    else:
-                        return False, 0, "Error: contig is empty: %s" % contig
-                contig = re.split(r"\s", line[1:])[0]
-                len_c = 0
-            elif len(line) > 0:
-                if next_header or re.match(r"^[ATGCKMRYSWBVHDXN.\-]+$", line.upper()) is None:
-                    if next_header:
-                        return False, 0, "Error: new header line expected at line %d" % nb_line
-                    return False, 0, "Error: invalid sequence at line %d" % nb_line
-                len_c += len(line)
-            elif len(line) == 0:
-                next_header = True
-
-        if contig is not None and len_c > 0:
-            nb_contigs += 1
-            out_file.write("%s\t%d\n" % (contig, len_c))
-
-    if write_f is not None:
-        write_f.close()
-
-    return has_header, nb_contigs, ""
+                write_f.write(block)
+            if not indexer.feed(block):
+                return False, 0, indexer.error
+        indexer.close()
+    finally:
+        if write_f is not None:
+            write_f.close()
+
+    with open(out, "w") as out_file:
+        out_file.write(fasta_name + "\n")
+        for contig in indexer.contigs:
+            out_file.write("%s\t%d\n" % contig)
+
+    if fai is not None:
+        # Offsets are computed on normalized line endings:
+        if indexer.fai_valid and (write_fa is not None or not indexer.has_cr):
+            indexer.write_fai(fai)
+        elif os.path.exists(fai):
+            os.remove(fai)
+
+    return indexer.has_header, len(indexer.contigs), ""
 
 
 if __name__ == '__main__':
@@ -160,9 +480,10 @@ if __name__ == '__main__':
     parser.add_argument('-i', '--input', type=str, required=True, help="Input fasta file")
     parser.add_argument('-n', '--name', type=str, required=True, help="Input name")
     parser.add_argument('-o', '--output', type=str, required=True, help="Output index file")
+    parser.add_argument('-f', '--fai', type=str, required=False, help="Output samtools fasta index file")
     args = parser.parse_args()
 
-    success, nb_contigs, message = index_file(args.input, args.name, args.output)
+    success, nb_contigs, message = index_file(args.input, args.name, args.output, fai=args.fai)
     if success:
         print("Success!")
     else:
@@ -15,9 +15,6 @@ import dgenies.database as database
 from dgenies.database import Job, Session
 from dgenies.lib.job_manager import JobManager
 
-# Allow only one instance:
-me = singleton.SingleInstance()
-
 config_reader = AppConfigReader()
 DRMAA_SESSION = None
 NB_RUN = config_reader.local_nb_runs  # Max number of jobs running locally
@@ -412,6 +409,8 @@ def parse_args():
 
 
 if __name__ == '__main__':
+    # Allow only one instance (checked here, as processes preparing fasta files import this module again):
+    me = singleton.SingleInstance()
     parse_args()
     logger = logging.getLogger(__name__)
     logger.debug("DEBUG")
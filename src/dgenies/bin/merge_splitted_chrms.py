@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-import re
+from functools import partial
 from collections import OrderedDict
 
 
@@ -55,6 +55,55 @@ class Merger:
 
         self._printer("DONE!")
 
+    def merge_stream(self):
+        """
+        Write the new query index, and get the function which merges split contigs in lines of the PAF file, so the
+        merge can be done while lines are read by another step (see :class:`dgenies.bin.sort_paf.Sorter`)
+
+        :return: function taking PAF lines (bytes) and returning a generator of merged lines
+        :rtype: functools.partial
+        """
+        contigs, contigs_split, q_name = self.load_query_index(self.query_in)
+        self.write_query_index(self.query_out, contigs, q_name)
+        return partial(self.merge_lines, splits=self.get_splits_offsets(contigs, contigs_split))
+
+    @staticmethod
+    def parse_split_name(name):
+        """
+        Get the contig name and the split number of a split contig (named <contig>_###_<split number> by the
+        splitter)
+
+        :param name: contig name
+        :type name: str
+        :return: contig name and split number, or None if the contig is not split
+        :rtype: (str, str)|None
+        """
+        contig_name, sep, nb_split = name.rpartition("_###_")
+        if sep == "" or contig_name == "" or not nb_split.isdecimal():
+            return None
+        return contig_name, nb_split
+
+    @staticmethod
+    def get_splits_offsets(contigs, contigs_split):
+        """
+        Build the table used to merge split contigs in PAF lines
+
+        :param contigs: contigs size
+        :type contigs: dict
+        :param contigs_split: split contigs, with what must be added to positions of each split contig
+        :type contigs_split: dict
+        :return: for each split contig name (as bytes): merged contig name, merged contig size (as bytes), and what
+            must be added to positions
+        :rtype: dict
+        """
+        splits = {}
+        for contig_name, splits_d in contigs_split.items():
+            name = contig_name.encode("utf-8")
+            size = str(contigs[contig_name]).encode("utf-8")
+            for nb_split, offset in splits_d.items():
+                splits[name + b"_###_" + nb_split.encode("utf-8")] = (name, size, offset)
+        return splits
+
     @staticmethod
     def _get_sorted_splits(contigs_split, all_contigs):
         """
@@ -100,12 +149,11 @@ class Merger:
                 parts = line.strip("\n").split("\t")
                 contig_name = parts[0]
                 contig_len = int(parts[1])
-                match_split = re.match(r"^(.+)_###_(\d+)$", contig_name)
-                if match_split is not None:
-                    contig_name = match_split.group(1)
+                split = self.parse_split_name(contig_name)
+                if split is not None:
+                    contig_name, nb_split = split
                     if contig_name not in contigs_split:
                         contigs_split[contig_name] = {}
-                    nb_split = match_split.group(2)
                     contigs_split[contig_name][nb_split] = contig_len
                     contigs[contig_name] = None  # Will be filled after
                 else:
@@ -146,20 +194,33 @@ class Merger:
         :param contigs_split: split contigs size
         :type contigs_split: dict
         """
-        with open(paf_in) as paf_i, open(paf_out, "w") as paf_o:
-            for line in paf_i:
-                parts = line.strip("\n").split("\t")
-                match_split = re.match(r"^(.+)_###_(\d+)$", parts[0])
-                if match_split is None:
-                    paf_o.write(line)
-                else:
-                    contig_name = match_split.group(1)
-                    nb_split = match_split.group(2)
-                    parts[0] = contig_name
-                    parts[1] = str(contigs[contig_name])
-                    parts[2] = str(int(parts[2]) + contigs_split[contig_name][nb_split])
-                    parts[3] = str(int(parts[3]) + contigs_split[contig_name][nb_split])
-                    paf_o.write("\t".join(parts) + "\n")
+        with open(paf_in, "rb") as paf_i, open(paf_out, "wb") as paf_o:
+            paf_o.writelines(Merger.merge_lines(paf_i, Merger.get_splits_offsets(contigs, contigs_split)))
+
+    @staticmethod
+    def merge_lines(lines, splits):
+        """
+        Merge split contigs in PAF lines
+
+        :param lines: lines of PAF with split contigs
+        :type lines: iterable
+        :param splits: for each split contig, merged contig name and size, and what must be added to positions (see
+            :func:`get_splits_offsets`)
+        :type splits: dict
+        :return: generator of lines where split contigs are now merged together
+        :rtype: generator
+        """
+        get_split = splits.get
+        for line in lines:
+            split = get_split(line[:line.find(b"\t")])
+            if split is None:
+                yield line
+            else:
+                contig_name, contig_len, offset = split
+                name, q_len, q_start, q_end, end = line.split(b"\t", 4)
+                if not end.endswith(b"\n"):
+                    end += b"\n"
+                yield b"%s\t%s\t%d\t%d\t%s" % (contig_name, contig_len, int(q_start) + offset, int(q_end) + offset, end)
 
 
 def parse_args():
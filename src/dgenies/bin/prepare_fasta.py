@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+try:
+    from dgenies.bin.index import FastaIndexer, copy_ranges
+    from dgenies.bin.split_fa import Splitter
+    from dgenies.bin.filter_contigs import Filter
+    from dgenies.bin.bgzf import BgzfWriter, is_bgzf, scan_blocks, write_gzi
+except ImportError:
+    from index import FastaIndexer, copy_ranges
+    from split_fa import Splitter
+    from filter_contigs import Filter
+    from bgzf import BgzfWriter, is_bgzf, scan_blocks, write_gzi
+
+
+class Preparer:
+
+    """
+    Prepare a fasta file for mapping in a single streaming pass: check and index it, split huge contigs (query only)
+    and remove too small contigs.
+
+    The input fasta (which can be gzipped) is read once to build the index. Contigs to remove are chosen from the
+    index (see :class:`dgenies.bin.filter_contigs.Filter`), then the output fasta is written in a second pass which
+    only copies byte ranges of the input, except for contigs which must be split.
+
+    Gzipped fasta files are kept compressed: the input is recompressed in BGZF format during the first pass, and the
+    output is written in BGZF format too. A samtools index (.fai) of the kept fasta file and a BGZF index (.gzi) are
+    written next to it, so contigs can then be extracted without decompressing the whole file.
+    """
+
+    def __init__(self, fasta, name, index_file, type_f, out_fasta, split=False, split_size=10000000, do_filter=True,
+                 compress_level=6, compress_threads=1):
+        """
+
+        :param fasta: input fasta file path (can be gzipped)
+        :type fasta: str
+        :param name: sample name
+        :type name: str
+        :param index_file: output index file path
+        :type index_file: str
+        :param type_f: type of sample (query or target)
+        :type type_f: str
+        :param out_fasta: output fasta file path. Without split, it is written only if contigs are removed. Can be the
+            input fasta file, which is then replaced. Compressed in BGZF format if it ends with .gz
+        :type out_fasta: str
+        :param split: if True, split huge contigs
+        :type split: bool
+        :param split_size: size of split contigs
+        :type split_size: int
+        :param do_filter: if True, remove too small contigs
+        :type do_filter: bool
+        :param compress_level: compression level of BGZF files
+        :type compress_level: int
+        :param compress_threads: number of threads used to compress BGZF files
+        :type compress_threads: int
+        """
+        self.fasta = fasta
+        self.name = name
+        self.index_file = index_file
+        self.type_f = type_f
+        self.out_fasta = out_fasta
+        self.split = split
+        self.split_size = split_size
+        self.do_filter = do_filter
+        self.compress_level = compress_level
+        self.compress_threads = compress_threads
+        self.nb_contigs = 0
+        self.is_filtered = False
+
+    def prepare(self):
+        """
+        Run the preparation
+
+        :return:
+            * [0] True if the input fasta is valid, else False
+            * [1] Error message
+        :rtype: (bool, str)
+        """
+        indexer = FastaIndexer()
+        # A gzipped fasta is recompressed in BGZF format, so it can be read randomly without decompressing it:
+        bgzf_out = None
+        if self.fasta.endswith(".gz") and not is_bgzf(self.fasta):
+            bgzf_out = BgzfWriter(os.path.join(os.path.dirname(self.fasta), "bgzf_" + os.path.basename(self.fasta)),
+                                  level=self.compress_level, threads=self.compress_threads)
+        is_valid = False
+        try:
+            for block in indexer.read_blocks(self.fasta):
+                if bgzf_out is not None:
+                    bgzf_out.write(block)
+                if not indexer.feed(block):
+                    return False, indexer.error
+            indexer.close()
+            is_valid = indexer.has_header
+        finally:
+            if bgzf_out is not None:
+                bgzf_out.close()
+                if not is_valid:
+                    os.remove(bgzf_out.path)
+        if not indexer.has_header:
+            return False, ""
+        self.nb_contigs = len(indexer.contigs)
+
+        # BGZF index (offsets are valid only if the BGZF file contains the normalized fasta):
+        if bgzf_out is not None:
+            os.replace(bgzf_out.path, self.fasta)
+            write_gzi(self.fasta + ".gzi", bgzf_out.index)
+        elif self.fasta.endswith(".gz"):
+            if not indexer.has_cr:
+                write_gzi(self.fasta + ".gzi", scan_blocks(self.fasta))
+            elif os.path.exists(self.fasta + ".gzi"):
+                os.remove(self.fasta + ".gzi")
+        is_normalized = bgzf_out is not None or not indexer.has_cr
+
+        # Index of contigs, as they will be in the output fasta:
+        parts = []
+        for contig, length in indexer.contigs:
+            sizes = Splitter.split_sizes(length, self.split_size) if self.split else None
+            if sizes is None:
+                parts.append([(contig, length)])
+            else:
+                parts.append([(contig + ("_###_%d" % n), size) for n, size in enumerate(sizes, start=1)])
+        with open(self.index_file, "w") as index_f:
+            index_f.write(self.name + "\n")
+            for contig_parts in parts:
+                for part in contig_parts:
+                    index_f.write("%s\t%d\n" % part)
+
+        f_outs = []
+        if self.do_filter:
+            filter_f = Filter(fasta=self.out_fasta,
+                              index_file=self.index_file,
+                              type_f=self.type_f,
+                              min_filtered=round(self.nb_contigs / 4),
+                              split=self.split)
+            f_outs = filter_f.check_filter()
+        self.is_filtered = len(f_outs) > 0
+
+        fai = indexer.fai
+        fai_file = self.fasta + ".fai"
+        if self.is_filtered or self.split:
+            f_outs = set(f_outs)
+            ranges = []
+            out_fai = []  # Samtools index of the output fasta, if contigs are not split
+            removed = 0  # Size of contigs removed before the current one
+            ends = indexer.starts[1:] + [indexer.offset]
+            for i, contig_parts in enumerate(parts):
+                kept = [part for part in contig_parts if part[0] not in f_outs]
+                if len(kept) == 0:
+                    removed += ends[i] - indexer.starts[i]
+                    continue
+                if len(contig_parts) == 1:
+                    name, length, seq_offset, line_bases, line_width = indexer.fai[i]
+                    out_fai.append((name, length, seq_offset - removed, line_bases, line_width))
+                    if len(ranges) > 0 and ranges[-1][2] is None and ranges[-1][1] == indexer.starts[i]:
+                        ranges[-1][1] = ends[i]  # Consecutive contigs are copied at once
+                    else:
+                        ranges.append([indexer.starts[i], ends[i], None])
+                else:
+                    ranges.append([indexer.fai[i][2], ends[i], contig_parts])
+            self._write(indexer, ranges, f_outs)
+            if not self.split:
+                # Written fasta has normalized line endings:
+                fai = out_fai
+                fai_file = self.out_fasta + ".fai"
+                is_normalized = True
+        if indexer.fai_valid and is_normalized:
+            indexer.write_fai(fai_file, fai)
+        elif os.path.exists(fai_file):
+            os.remove(fai_file)
+        return True, ""
+
+    def _write(self, indexer, ranges, f_outs):
+        """
+        Write the output fasta file: copy byte ranges of the input fasta, and split huge contigs
+
+        :param indexer: indexer used to read the input fasta
+        :type indexer: FastaIndexer
+        :param ranges: byte ranges to copy (sorted, not overlapping), as [start, end, parts]. Parts are the name and
+            size of each part if the sequence must be split, else None (the range is copied as is)
+        :type ranges: list
+        :param f_outs: names of removed contigs (parts of split contigs are not written if they are in it)
+        :type f_outs: set
+        """
+        out_fasta = self.out_fasta
+        if out_fasta == self.fasta:
+            out_fasta = os.path.join(os.path.dirname(self.fasta), "filtered_" + os.path.basename(self.fasta))
+        is_bgzf_out = self.out_fasta.endswith(".gz")
+        with (BgzfWriter(out_fasta, level=self.compress_level, threads=self.compress_threads) if is_bgzf_out else
+              open(out_fasta, "wb")) as out:
+            if not is_bgzf_out and not indexer.has_cr and not self.fasta.endswith(".gz") and \
+                    all(r[2] is None for r in ranges):
+                copy_ranges(self.fasta, ranges, out)
+            else:
+                seq_parts = None
+                current = None
+                for i, data in indexer.read_ranges(self.fasta, ranges):
+                    if i != current:
+                        if seq_parts is not None:
+                            seq_parts.close()
+                            seq_parts = None
+                        current = i
+                    contig_parts = ranges[i][2]
+                    if contig_parts is None:
+                        out.write(data)
+                    else:
+                        if seq_parts is None:
+                            seq_parts = self._split_sequence(contig_parts, f_outs, out)
+                            next(seq_parts)
+                        seq_parts.send(data)
+                if seq_parts is not None:
+                    seq_parts.close()
+        if out_fasta != self.out_fasta:
+            os.remove(self.fasta)
+            shutil.move(out_fasta, self.out_fasta)
+        if is_bgzf_out:
+            write_gzi(self.out_fasta + ".gzi", out.index)
+
+    def _split_sequence(self, contig_parts, f_outs, out):
+        """
+        Write parts of a split contig. Generator: sequence data of the contig is sent by chunks, parts are written as
+        soon as they are complete, so only one part is kept in memory
+
+        :param contig_parts: name and size of each part
+        :type contig_parts: list
+        :param f_outs: names of removed parts
+        :type f_outs: set
+        :param out: output file
+        :type out: file
+        """
+        parts = iter(contig_parts)
+        name, size = next(parts)
+        sequence = bytearray()
+        try:
+            while True:
+                sequence += (yield).replace(b"\n", b"")
+                while name is not None and len(sequence) >= size:
+                    self._write_part(name, sequence[:size], f_outs, out)
+                    del sequence[:size]
+                    name, size = next(parts, (None, None))
+        except GeneratorExit:
+            if name is not None and len(sequence) > 0:
+                self._write_part(name, sequence, f_outs, out)
+
+    @staticmethod
+    def _write_part(name, sequence, f_outs, out):
+        """
+        Write a part of a split contig
+
+        :param name: part name
+        :type name: str
+        :param sequence: part sequence
+        :type sequence: bytearray
+        :param f_outs: names of removed parts
+        :type f_outs: set
+        :param out: output file
+        :type out: file
+        """
+        if name not in f_outs:
+            Splitter.write_contig(name, sequence, out)
+
+
+def prepare(preparer):
+    """
+    Run a preparer. Entry point of the processes which prepare fasta files at the same time: it is picklable, so
+    processes can be spawned
+
+    :param preparer: preparer to run
+    :type preparer: Preparer
+    :return: result of the preparer (see :func:`Preparer.prepare`)
+    :rtype: (bool, str)
+    """
+    return preparer.prepare()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Index, split and filter a fasta file")
+    parser.add_argument('-i', '--input', type=str, required=True, help="Input fasta file")
+    parser.add_argument('-n', '--name', type=str, required=True, help="Input name")
+    parser.add_argument('-x', '--index', type=str, required=True, help="Output index file")
+    parser.add_argument('-t', '--type', type=str, required=True, choices=["query", "target"],
+                        help="Type of fasta: query or target")
+    parser.add_argument('-o', '--output', type=str, required=True, help="Output fasta file")
+    parser.add_argument('-s', '--size', type=int, required=False, default=10, help="Max size of contigs (Mb)")
+    parser.add_argument('--split', action='store_const', const=True, default=False, help="Split huge contigs")
+    parser.add_argument('-l', '--compress-level', type=int, required=False, default=6,
+                        help="Compression level of gzipped files")
+    parser.add_argument('-@', '--compress-threads', type=int, required=False, default=1,
+                        help="Number of threads used to compress gzipped files")
+    args = parser.parse_args()
+
+    preparer = Preparer(fasta=args.input, name=args.name, index_file=args.index, type_f=args.type,
+                        out_fasta=args.output, split=args.split, split_size=args.size * 1000000,
+                        compress_level=args.compress_level, compress_threads=args.compress_threads)
+    success, message = preparer.prepare()
+    if success:
+        print("Success!")
+    else:
+        print(message)
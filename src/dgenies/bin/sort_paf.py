@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
 
 import os
+import shutil
+import struct
+import tempfile
+import multiprocessing
 from math import sqrt
+from heapq import heappush, heapreplace, merge
+from itertools import islice
 
 __NAME__ = "Sort_paf"
 __VERSION__ = 0.1
@@ -9,85 +15,249 @@ __VERSION__ = 0.1
 
 class Sorter:
     """
-    Sort PAF file by match size
+    Sort PAF file by match size (length x identity), in descending order.
+
+    Only the max_lines best matches are kept. The PAF file is read once, and best lines are selected with a heap of
+    fixed capacity, so memory usage depends on max_lines, not on the size of the PAF file.
+
+    With several processes, the PAF file is split in byte ranges (aligned on lines), the best lines of each range
+    are selected in parallel and saved in temporary files, then merged. Lines of same score are kept in order of the
+    file in both cases, so the output does not depend on the number of processes. As sorts may be launched from
+    threads, processes are started by a fork server (or spawned), never forked.
+
+    Transforms (merge of split contigs, conversion to PAF, ...) can be applied to lines while they are read, so the
+    raw alignment file is read only once and no intermediate file is written. As byte ranges are transformed
+    separately, transforms must convert lines one by one.
     """
 
-    def __init__(self, input_f, output_f):
+    max_lines = 2000000  # Max number of lines kept in the sorted PAF file
+    min_chunk_size = 16 * 1024 * 1024  # Min size of byte ranges read by each process
+    record = struct.Struct("<dqI")  # Score, -position and length of a line, in temporary files
+    chunk_shift = 40  # Position of a line is (index of the byte range << chunk_shift) + index of the line in the range
+
+    def __init__(self, input_f, output_f, max_lines=None, processes=1, transforms=None):
         """
 
-        :param input_f: input fasta file path
+        :param input_f: input PAF file path
         :type input_f: str
-        :param output_f: output fasta file path
+        :param output_f: output PAF file path
         :type output_f: str
+        :param max_lines: max number of lines kept (if None, use the default one)
+        :type max_lines: int
+        :param processes: number of processes used to select the best lines
+        :type processes: int
+        :param transforms: functions applied to lines of the input file (in order) before they are sorted. Each one
+            takes an iterable of lines (bytes) and returns an iterable of lines. They must be picklable
+        :type transforms: list
         """
         self.input_f = input_f
         self.output_f = output_f
+        if max_lines is not None:
+            self.max_lines = max_lines
+        self.processes = processes
+        self.transforms = transforms if transforms is not None else []
 
     def sort(self):
         """
         Launch sort staff
         """
-        paf_lines = self._get_sorted_paf_lines()
-        with open(self.output_f, "w") as out:
-            out.write("\n".join(["\t".join(x[:-1]) for x in paf_lines]))
+        nb_chunks = min(self.processes, os.path.getsize(self.input_f) // self.min_chunk_size)
+        if nb_chunks > 1:
+            self._sort_parallel(nb_chunks)
+        else:
+            self._write(self._get_sorted_paf_lines())
+
+    def _write(self, records):
+        """
+        Write the sorted PAF file
 
-    def _sort_lines(self, lines):
+        :param records: (score, -position, line) of lines to write, in order
+        :type records: iterable
         """
-        Sort lines stuff
+        records = iter(records)
+        with open(self.output_f, "wb") as out:
+            first = True
+            for batch in iter(lambda: list(islice(records, 10000)), []):
+                if not first:
+                    out.write(b"\n")
+                out.write(b"\n".join([record[2] for record in batch]))
+                first = False
+
+    @staticmethod
+    def _transform(lines, transforms):
+        """
+        Apply transforms to lines
+
+        :param lines: lines
+        :type lines: iterable
+        :param transforms: functions applied to lines, in order
+        :type transforms: list
+        :return: transformed lines
+        :rtype: iterable
+        """
+        for transform in transforms:
+            lines = transform(lines)
+        return lines
+
+    @staticmethod
+    def _sort_lines(lines, max_lines, position=0):
+        """
+        Select the best lines, and sort them
 
         :param lines: lines of PAF file to be sorted
-        :type lines: _io.TextIO
-        :return: sorted lines
+        :type lines: iterable
+        :param max_lines: max number of lines kept
+        :type max_lines: int
+        :param position: position of the first line
+        :type position: int
+        :return: (score, -position, line) of the best lines (without line break), in descending order
         :rtype: list
         """
-        paf_lines = []
-        nb_lines = 0
-        min_len = 0
-        for line in lines:
-            parts = line.strip("\n").split("\t")
-            # len_line is length (euclidean distance) x similarity score
-            len_line = sqrt(pow(int(parts[3]) - int(parts[2]), 2) +
-                            pow(int(parts[8]) - int(parts[7]), 2)) * (int(parts[9]) / int(parts[10]))
-            # len_line is "added" as a new column
-            parts.append(len_line)
-            nb_lines += 1
-            # We add the first 1_000_000 lines
-            if nb_lines <= 1000000:
-                paf_lines.append(parts)
-                if nb_lines == 1000000:
-                    # When line limit is reached, we switch to the most representative strategy
-                    # We will drop the smallest ones from current selection and only add long ones
-                    print("Sorting lines...")
-                    # We sort them by len_line in desc. order
-                    paf_lines.sort(key=lambda x: -x[-1])
-                    # We look at the input file in order to know the proportion of lines in % to keep
-                    with open(self.input_f, 'r') as paf:
-                        num_lines = sum(1 for line in paf)
-                    pct_to_keep = 2000000 / num_lines
-                    # We remove small lines
-                    limit = int(nb_lines * pct_to_keep)
-                    paf_lines = paf_lines[:limit]
-                    # We set a min length for next lines
-                    min_len = paf_lines[-1][-1]
-                    print("Sorting done!")
-            elif len_line >= min_len:
-                # We only keep long enough lines
-                print("Processing line %d..." % nb_lines)
-                paf_lines.append(parts)
-        paf_lines.sort(key=lambda x: -x[-1])
-
-        return paf_lines
+        # Min-heap of the best lines: the root is the worst kept line (the last one in the file if scores are equal,
+        # so lines of same score are kept in order of the file)
+        heap = []
+        for line_position, line in enumerate(lines, start=position):
+            parts = line.split(b"\t", 11)
+            if len(parts) < 11:
+                continue
+            # score is length (euclidean distance) x similarity score
+            score = sqrt(pow(int(parts[3]) - int(parts[2]), 2) +
+                         pow(int(parts[8]) - int(parts[7]), 2)) * (int(parts[9]) / int(parts[10]))
+            if len(heap) < max_lines:
+                heappush(heap, (score, -line_position, line.rstrip(b"\r\n")))
+            elif len(heap) > 0 and score > heap[0][0]:
+                heapreplace(heap, (score, -line_position, line.rstrip(b"\r\n")))
+        heap.sort(reverse=True)
+        return heap
 
     def _get_sorted_paf_lines(self):
         """
         Get sorted PAF
 
-        :return: sorted PAF lines
+        :return: (score, -position, line) of sorted PAF lines
         """
-        with open(self.input_f, "r") as lines:
-            paf_lines = self._sort_lines(lines)
+        with open(self.input_f, "rb") as lines:
+            paf_lines = self._sort_lines(self._transform(lines, self.transforms), self.max_lines)
         return paf_lines
 
+    def _chunks(self, nb_chunks):
+        """
+        Split the PAF file in byte ranges of same size, aligned on lines
+
+        :param nb_chunks: number of ranges
+        :type nb_chunks: int
+        :return: (start, end) of each range
+        :rtype: list
+        """
+        size = os.path.getsize(self.input_f)
+        bounds = [0]
+        with open(self.input_f, "rb") as paf:
+            for i in range(1, nb_chunks):
+                paf.seek(max(size * i // nb_chunks - 1, bounds[-1]))
+                paf.readline()
+                if paf.tell() > bounds[-1]:
+                    bounds.append(paf.tell())
+        if bounds[-1] < size:
+            bounds.append(size)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    @staticmethod
+    def _read_range(paf, start, end):
+        """
+        Read lines of a byte range of the PAF file
+
+        :param paf: PAF file, opened in binary mode
+        :type paf: _io.BufferedReader
+        :param start: start of the range (start of a line)
+        :type start: int
+        :param end: end of the range (excluded, start of a line or end of file)
+        :type end: int
+        :return: generator of lines
+        :rtype: generator
+        """
+        paf.seek(start)
+        while start < end:
+            line = paf.readline()
+            if len(line) == 0:
+                break
+            start += len(line)
+            yield line
+
+    @classmethod
+    def _sort_chunk(cls, input_f, start, end, max_lines, transforms, position, out_f):
+        """
+        Select the best lines of a byte range of the PAF file, and save them sorted in a temporary file
+
+        :param input_f: PAF file path
+        :type input_f: str
+        :param start: start of the range (start of a line)
+        :type start: int
+        :param end: end of the range (excluded, start of a line or end of file)
+        :type end: int
+        :param max_lines: max number of lines kept
+        :type max_lines: int
+        :param transforms: functions applied to lines, in order
+        :type transforms: list
+        :param position: position of the first line of the range
+        :type position: int
+        :param out_f: temporary file path
+        :type out_f: str
+        """
+        with open(input_f, "rb") as paf:
+            records = cls._sort_lines(cls._transform(cls._read_range(paf, start, end), transforms), max_lines,
+                                      position)
+        with open(out_f, "wb") as out:
+            for score, neg_position, line in records:
+                out.write(cls.record.pack(score, neg_position, len(line)))
+                out.write(line)
+
+    @classmethod
+    def _read_chunk(cls, chunk_f):
+        """
+        Read sorted lines of a temporary file
+
+        :param chunk_f: temporary file path
+        :type chunk_f: str
+        :return: generator of (score, -position, line)
+        :rtype: generator
+        """
+        with open(chunk_f, "rb") as chunk:
+            while True:
+                header = chunk.read(cls.record.size)
+                if len(header) < cls.record.size:
+                    break
+                score, neg_position, length = cls.record.unpack(header)
+                yield score, neg_position, chunk.read(length)
+
+    def _sort_parallel(self, nb_chunks):
+        """
+        Select the best lines of byte ranges of the PAF file in parallel, then merge them
+
+        :param nb_chunks: number of ranges, each one read by a process
+        :type nb_chunks: int
+        """
+        tmp_dir = tempfile.mkdtemp(prefix="sort_", dir=os.path.dirname(os.path.abspath(self.output_f)))
+        try:
+            chunks = [(self.input_f, start, end, self.max_lines, self.transforms, i << self.chunk_shift,
+                       os.path.join(tmp_dir, "chunk_%d" % i)) for i, (start, end) in enumerate(self._chunks(nb_chunks))]
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            with multiprocessing.get_context(start_method).Pool(len(chunks)) as pool:
+                pool.starmap(sort_chunk, chunks)
+            records = merge(*[self._read_chunk(chunk[-1]) for chunk in chunks], reverse=True)
+            self._write(islice(records, self.max_lines))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def sort_chunk(*args):
+    """
+    Select the best lines of a byte range of the PAF file. Entry point of sort processes: it is picklable, so processes
+    can be spawned
+
+    :param args: arguments of :func:`Sorter._sort_chunk`
+    """
+    Sorter._sort_chunk(*args)
+
 
 if __name__ == '__main__':
     import argparse
@@ -95,12 +265,14 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Sort PAF file with size of matches (DESC)")
     parser.add_argument('-i', '--input', type=str, required=True, help="Input PAF file")
     parser.add_argument('-o', '--output', type=str, required=True, help="Output PAF file")
+    parser.add_argument('-n', '--max-lines', type=int, required=False, default=Sorter.max_lines,
+                        help="Max number of lines kept")
+    parser.add_argument('-p', '--processes', type=int, required=False, default=1,
+                        help="Number of processes used to select the best lines")
+    parser.add_argument('-v', '--version', action='version', version="%s %s" % (__NAME__, __VERSION__))
 
     args = parser.parse_args()
-    if args["--version"]:
-        print(__NAME__, __VERSION__)
-    else:
-        if not os.path.exists(args.input):
-            raise Exception("Input PAF file %s does not exists" % args.input)
-        sorter = Sorter(args.input, args.output)
-        sorter.sort()
+    if not os.path.exists(args.input):
+        raise Exception("Input PAF file %s does not exists" % args.input)
+    sorter = Sorter(args.input, args.output, args.max_lines, args.processes)
+    sorter.sort()
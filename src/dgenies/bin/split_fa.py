@@ -4,8 +4,11 @@ import sys
 import os
 import re
 from xopen import xopen
-import io
 from collections import OrderedDict
+try:
+    from dgenies.bin.index import FastaIndexer
+except ImportError:
+    from index import FastaIndexer
 
 
 class Splitter:
@@ -43,87 +46,169 @@ class Splitter:
 
     def split(self):
         """
-        Split contigs in smaller ones staff
+        Split contigs in smaller ones staff. The input fasta is read by blocks, and parts of contigs are written as soon
+        as they are complete: only one part of a contig (at most 110% of the split size) is kept in memory
 
         :return: True if the input Fasta is correct, else False
         """
-        has_header = False
-        next_header = False  # True if next line must be a header line
-        with (xopen(self.input_f, mode="r") if self.input_gz else open(self.input_f, mode="r")) as fasta, \
-            (xopen(self.output_f, mode="w") if self.output_gz else open(self.output_f, mode="w")) as enc, \
+        indexer = FastaIndexer()
+        with (xopen(self.output_f, mode="wb") if self.output_gz else open(self.output_f, mode="wb")) as enc, \
                 open(self.index_file, mode="w") as index_f:
             index_f.write(self.name_f + "\n")
-            chr_name = None
-            fasta_str = ""
-            nb_line = 0
-            for line in fasta:
-                nb_line += 1
-                line = line.strip("\n")
-                if re.match(r"^>.+", line) is not None:
-                    has_header = True
-                    next_header = False
-                    if chr_name is not None and len(fasta_str) > 0:
-                        self.nb_contigs += 1
-                        self.flush_contig(fasta_str, chr_name, self.size_c, enc, index_f)
-                    elif chr_name is not None:
-                        return False, "Error: contig is empty: %s" % chr_name
-                    chr_name = re.split(r"\s", line[1:])[0]
-                    fasta_str = ""
-                    if self.debug:
-                        print("Parsing contig \"%s\"... " % chr_name, end="")
-                elif len(line) > 0:
-                    if next_header or re.match(r"^[ATGCKMRYSWBVHDXN.\-]+$", line.upper()) is None:
-                        if next_header:
-                            return False, "Error: new header line expected at line %d" % nb_line
-                        return False, "Error: invalid sequence at line %d" % nb_line
-                    fasta_str += line
-                elif len(line) == 0:
-                    next_header = True
+            self._contig = None
+            for block in indexer.read_blocks(self.input_f):
+                # Block is checked before any write:
+                if not indexer.feed(block):
+                    return False, indexer.error
+                pos = 0
+                end_block = len(block)
+                while pos < end_block:
+                    end = block.find(b"\n", pos)
+                    end = end_block if end == -1 else end
+                    if block[pos] == 62 and end - pos > 1:  # Header line
+                        if self._contig is not None:
+                            self.nb_contigs += 1
+                            self._end_contig(enc, index_f)
+                        self._start_contig(re.split(r"\s", block[pos + 1:end].decode("utf-8"))[0])
+                        pos = end + 1
+                        continue
+                    end = block.find(b">", pos + 1)
+                    while end != -1 and block[end - 1] != 10:
+                        end = block.find(b">", end + 1)
+                    end = end_block if end == -1 else end
+                    if self._contig is not None:
+                        self._add_sequence(block[pos:end].replace(b"\n", b""), enc, index_f)
+                    pos = end
+            indexer.close()
             self.nb_contigs += 1
-            self.flush_contig(fasta_str, chr_name, self.size_c, enc, index_f)
-        return has_header, ""
+            if self._contig is not None:
+                self._end_contig(enc, index_f)
+        return indexer.has_header, ""
+
+    def _start_contig(self, name):
+        """
+        Start a new contig
+
+        :param name: contig name
+        :type name: str
+        """
+        self._contig = name
+        self._sequence = bytearray()
+        self._nb_parts = 0  # Number of written parts, if the contig is split
+        if self.debug:
+            print("Parsing contig \"%s\"... " % name, end="")
+
+    def _add_sequence(self, sequence, enc, index_f):
+        """
+        Add sequence to the current contig. Once the contig is known to be split (its size reaches the block size +
+        10%), each part is written as soon as it is followed by more sequence
+
+        :param sequence: sequence, without newlines
+        :type sequence: bytes
+        :param enc: output fasta file
+        :type enc: file
+        :param index_f: output index file
+        :type index_f: file
+        """
+        self._sequence += sequence
+        if self._nb_parts == 0 and len(self._sequence) < self.size_c + self.size_c * 0.1:
+            return
+        while len(self._sequence) > self.size_c:
+            self._write_part(self._sequence[:self.size_c], enc, index_f)
+            del self._sequence[:self.size_c]
+
+    def _write_part(self, sequence, enc, index_f):
+        """
+        Write the next part of the current contig
+
+        :param sequence: sequence of the part
+        :type sequence: bytearray
+        :param enc: output fasta file
+        :type enc: file
+        :param index_f: output index file
+        :type index_f: file
+        """
+        self._nb_parts += 1
+        name = self._contig + ("_###_%d" % self._nb_parts)
+        self.write_contig(name, sequence, enc)
+        index_f.write("%s\t%d\n" % (name, len(sequence)))
+
+    def _end_contig(self, enc, index_f):
+        """
+        Write the end of the current contig
+
+        :param enc: output fasta file
+        :type enc: file
+        :param index_f: output index file
+        :type index_f: file
+        """
+        if len(self._sequence) == 0:
+            return
+        if self._nb_parts > 0:
+            self._write_part(self._sequence, enc, index_f)
+        else:
+            self.write_contig(self._contig, self._sequence, enc)
+            index_f.write("%s\t%d\n" % (self._contig, len(self._sequence)))
+        if self.debug:
+            if self._nb_parts == 0:
+                print("Keeped!")
+            else:
+                print("Splited in %d contigs!" % self._nb_parts)
+        self._sequence = bytearray()
 
     @staticmethod
     def write_contig(name, fasta, o_file):
-        o_file.write(">%s\n" % name)
-        f_len = len(fasta)
-        i = 0
-        while i<f_len:
-            j = min (i+60, f_len)
-            o_file.write(fasta[i:j] + "\n")
-            i = j
-        o_file.write("\n")
+        """
+        Write a contig, with lines of 60 bases
+
+        :param name: contig name
+        :type name: str
+        :param fasta: sequence
+        :type fasta: bytes|bytearray
+        :param o_file: output fasta file, opened in binary mode
+        :type o_file: file
+        """
+        o_file.write(b">" + name.encode("utf-8") + b"\n")
+        o_file.write(b"".join(fasta[i:i + 60] + b"\n" for i in range(0, len(fasta), 60)))
+        o_file.write(b"\n")
 
     @staticmethod
-    def split_contig(name, sequence, block_sizes):
-        seq_len = len(sequence)
-        contigs = OrderedDict()
+    def split_sizes(seq_len, block_sizes):
+        """
+        Get sizes of the parts of a contig: contigs larger than the block size (+10%) are split in blocks, the last one
+        can be smaller
+
+        :param seq_len: contig size
+        :type seq_len: int
+        :param block_sizes: size of split contigs
+        :type block_sizes: int
+        :return: size of each part, or None if the contig must not be split
+        :rtype: list|None
+        """
         if seq_len < block_sizes + block_sizes * 0.1:  # Only one block size
-            contigs[name] = sequence
-            return contigs
+            return None
+        sizes = []
         i = 0
-        n = 1
         while i < seq_len:
             j = i + block_sizes
             if (j > seq_len) or ((i + (block_sizes * 0.1)) >= seq_len):
                 j = seq_len
-            contigs[name + ("_###_%d" % n)] = sequence[i:j]
+            sizes.append(j - i)
             i = j
-            n += 1
-        return contigs
+        return sizes
 
-    def flush_contig(self, fasta_str, chr_name, size_c, enc, index_f):
-        if len(fasta_str) > 0 and chr_name is not None:
-            contigs = self.split_contig(chr_name, fasta_str, size_c)
-            for name, seq in contigs.items():
-                self.write_contig(name, seq, enc)
-                index_f.write("%s\t%d\n" % (name, len(seq)))
-            nb_contigs = len(contigs)
-            if self.debug:
-                if nb_contigs == 1:
-                    print("Keeped!")
-                else:
-                    print("Splited in %d contigs!" % nb_contigs)
+    @staticmethod
+    def split_contig(name, sequence, block_sizes):
+        contigs = OrderedDict()
+        sizes = Splitter.split_sizes(len(sequence), block_sizes)
+        if sizes is None:
+            contigs[name] = sequence
+            return contigs
+        i = 0
+        for n, size in enumerate(sizes, start=1):
+            contigs[name + ("_###_%d" % n)] = sequence[i:i + size]
+            i += size
+        return contigs
 
 
 def parse_args():
@@ -155,6 +155,53 @@ class AppConfigReader:
         except NoOptionError:
             return 100000
 
+    def _get_paf_cache_size(self):
+        try:
+            cache_size_b = self._replace_vars(self.reader.get("global", "paf_cache_size"))
+            if cache_size_b == "0":
+                return 0
+            size_v = float(cache_size_b[:-1])
+            size_unit = cache_size_b[-1].upper()
+            if size_unit not in ["M", "G"]:
+                raise ValueError("Cache size unit must be M or G")
+            cache_size = int(size_v * 1024 * 1024)
+            if size_unit == "G":
+                cache_size *= 1024
+            return cache_size
+        except NoOptionError:
+            return 512 * 1024 * 1024
+
+    def _get_paf_cache_stats_ips(self):
+        allowed_ip = set()
+        try:
+            allowed_ip_txt = self.reader.get("global", "paf_cache_stats_ips").strip()
+            if allowed_ip_txt != "":
+                allowed_ip.update(re.split(r"\s*,\s*", allowed_ip_txt))
+        except NoOptionError:
+            pass
+        return allowed_ip
+
+    def _get_compress_level(self):
+        try:
+            level = int(self.reader.get("global", "compress_level"))
+            if level < 0 or level > 9:
+                raise ValueError("Compression level must be between 0 and 9")
+            return level
+        except NoOptionError:
+            return 6
+
+    def _get_compress_threads(self):
+        try:
+            return max(int(self.reader.get("global", "compress_threads")), 1)
+        except NoOptionError:
+            return 4
+
+    def _get_sort_processes(self):
+        try:
+            return max(int(self.reader.get("global", "sort_processes")), 1)
+        except NoOptionError:
+            return 4
+
     def _get_max_nb_jobs_in_batch_mode(self):
         try:
             return int(self._replace_vars(self.reader.get("global", "max_nb_jobs_in_batch_mode")))
@@ -309,6 +356,12 @@ class AppConfigReader:
         except (NoOptionError, NoSectionError):
             return 2
 
+    def _get_prepare_processes(self):
+        try:
+            return max(int(self.reader.get("jobs", "prepare_processes")), 1)
+        except (NoOptionError, NoSectionError):
+            return 2 * self._get_nb_data_prepare()
+
     def _get_max_concurrent_dl(self):
         try:
             return int(self.reader.get("jobs", "max_concurrent_dl"))
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+import os
+import gzip
+import json
+import hashlib
+import threading
+from dgenies.lib.paf import Paf
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional: gzip only
+    brotli = None
+
+
+class Artifacts:
+    """
+    Pre-computed responses of a job (dot plot data, summary, query/target association), saved compressed in the
+    ``artifacts`` folder of the job.
+
+    Each artifact is saved gzipped (and brotli-compressed if the ``brotli`` module is available), with a meta file
+    containing its ETag (hash of the uncompressed content) and the stamp of the job files it was built from. If one of
+    these files changes (sort, reverse of a contig, ...), the artifact is outdated and ignored.
+    """
+
+    folder = "artifacts"
+    version = 1
+
+    def __init__(self, data_dir: str):
+        """
+
+        :param data_dir: job folder
+        :type data_dir: str
+        """
+        self.data_dir = data_dir
+        self.artifacts_dir = os.path.join(data_dir, self.folder)
+        self.paf = os.path.join(data_dir, "map.paf")
+        self.idx_q = os.path.join(data_dir, "query.idx")
+        self.idx_t = os.path.join(data_dir, "target.idx")
+
+    def _source_stamp(self):
+        """
+        Get the stamp of job files used to build artifacts
+
+        :return: name, size and modification time (ns) of each file (None if the file does not exist)
+        :rtype: list
+        """
+        idx_q = self.idx_q
+        if os.path.exists(os.path.join(self.data_dir, ".sorted")):
+            idx_q += ".sorted"
+        stamp = []
+        for path in (self.paf, idx_q, self.idx_t):
+            try:
+                stat = os.stat(path)
+                stamp.append([os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+            except OSError:
+                stamp.append([os.path.basename(path), None, None])
+        return stamp
+
+    def _path(self, name, encoding=None):
+        """
+        Get path of an artifact file
+
+        :param name: artifact name
+        :type name: str
+        :param encoding: content encoding (br, gzip), or None for meta file
+        :type encoding: str|None
+        :return: file path
+        :rtype: str
+        """
+        if encoding is None:
+            return os.path.join(self.artifacts_dir, name + ".meta")
+        return os.path.join(self.artifacts_dir, "%s.%s" % (name, "br" if encoding == "br" else "gz"))
+
+    def save(self, name: str, content: bytes, mimetype: str):
+        """
+        Save an artifact. Files are written with a temporary name, then moved in place. The meta file is written last.
+
+        :param name: artifact name
+        :type name: str
+        :param content: uncompressed content
+        :type content: bytes
+        :param mimetype: mimetype of the content
+        :type mimetype: str
+        :return: ETag of the artifact
+        :rtype: str
+        """
+        stamp = self._source_stamp()
+        etag = hashlib.sha1(content).hexdigest()
+        os.makedirs(self.artifacts_dir, exist_ok=True)
+        compressed = {"gzip": gzip.compress(content, compresslevel=6, mtime=0)}
+        if brotli is not None:
+            compressed["br"] = brotli.compress(content, quality=9)
+        suffix = ".tmp.%d.%d" % (os.getpid(), threading.get_ident())
+        for encoding, data in compressed.items():
+            with open(self._path(name, encoding) + suffix, "wb") as out:
+                out.write(data)
+            os.replace(self._path(name, encoding) + suffix, self._path(name, encoding))
+        with open(self._path(name) + suffix, "w") as meta_f:
+            json.dump({"version": self.version, "etag": etag, "mimetype": mimetype, "source": stamp,
+                       "encodings": list(compressed)}, meta_f)
+        os.replace(self._path(name) + suffix, self._path(name))
+        return etag
+
+    def get(self, name: str):
+        """
+        Get meta data of an artifact, if it exists and is up to date
+
+        :param name: artifact name
+        :type name: str
+        :return: meta data (etag, mimetype, encodings), or None if the artifact can't be used
+        :rtype: dict|None
+        """
+        try:
+            with open(self._path(name), "r") as meta_f:
+                meta = json.load(meta_f)
+        except (IOError, ValueError):
+            return None
+        if meta.get("version") != self.version or meta.get("source") != self._source_stamp():
+            return None
+        return meta
+
+    def read(self, name: str, encoding: str):
+        """
+        Read content of an artifact
+
+        :param name: artifact name
+        :type name: str
+        :param encoding: content encoding (br, gzip), or None to get uncompressed content
+        :type encoding: str|None
+        :return: content
+        :rtype: bytes
+        """
+        with open(self._path(name, encoding or "gzip"), "rb") as in_f:
+            content = in_f.read()
+        if encoding is None:
+            return gzip.decompress(content)
+        return content
+
+    @classmethod
+    def build(cls, data_dir: str):
+        """
+        Build all artifacts of a job: default dot plot data (JSON and binary), summary and query/target association
+
+        :param data_dir: job folder
+        :type data_dir: str
+        """
+        artifacts = cls(data_dir)
+        paf = Paf(artifacts.paf, artifacts.idx_q, artifacts.idx_t, auto_parse=False)
+        paf.parse_paf()
+        if not paf.parsed:
+            return
+        res = paf.get_d3js_data()
+        res["success"] = True
+        artifacts.save("graph", json.dumps(res).encode("utf-8"), "application/json")
+        artifacts.save("graph.bin", paf.get_d3js_binary_data(), "application/octet-stream")
+
+        percents = paf.get_summary_stats()
+        if percents is None:
+            status_file = os.path.join(data_dir, ".summarize")
+            try:
+                open(status_file, "x").close()
+            except FileExistsError:
+                # Summary is being built for a request, which saves the artifact (see views.summary)
+                pass
+            else:
+                percents = paf.build_summary_stats(status_file=status_file)
+        if percents is not None:
+            artifacts.save("summary", json.dumps({"success": True, "percents": percents, "status": "done"})
+                           .encode("utf-8"), "application/json")
+
+        paf = Paf(artifacts.paf, artifacts.idx_q, artifacts.idx_t, auto_parse=False)
+        paf.parse_paf(merge_index=False)
+        if paf.parsed:
+            artifacts.save("qt-assoc", paf.build_query_on_target_association_file().encode("utf-8"), "text/plain")
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+from dgenies.bin.index import FastaIndexer
+from dgenies.bin.bgzf import BgzfReader, is_bgzf
+
+
+class FastaExtractor:
+    """
+    Extract contigs of a fasta file by random access, using its samtools index (.fai).
+
+    The index is built (and saved, if lines of each contig have the same length) if it does not exist. Sequences are
+    read by chunks from the plain fasta file, or from the BGZF file through its .gzi index, and written with fixed
+    width lines as they are read, so memory usage does not depend on the size of contigs. Reverse complement is done
+    by chunks too.
+
+    Files which can't be read randomly (gzipped but not in BGZF format, or with CR line endings) are first copied in a
+    temporary uncompressed file with normalized line endings, removed by :func:`close`.
+    """
+
+    chunk_size = 4 * 1024 * 1024
+    line_width = 60
+    # Complement of nucleotides, with IUPAC codes (as Biopython). Other chars are kept as is:
+    complement = bytes.maketrans(b"ACGTMKRYWSBVDHNXacgtmkrywsbvdhnx", b"TGCAKMYRWSVBHDNXtgcakmyrwsvbhdnx")
+
+    def __init__(self, fasta: str):
+        """
+
+        :param fasta: fasta file path (can be gzipped)
+        :type fasta: str
+        """
+        self.fasta = fasta
+        # For each contig: offset from which the header line is searched, start and end of the sequence:
+        self.records = {}
+        self._tmp = None
+        self._reader = None
+        self._file = None
+        self._load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _load(self):
+        """
+        Load index of the fasta file, build it if needed, and open the file
+        """
+        fasta = self.fasta
+        fai = fasta + ".fai"
+        is_gz = fasta.endswith(".gz")
+        if is_gz and not (os.path.exists(fasta + ".gzi") and is_bgzf(fasta)):
+            self._load_copy()
+            return
+        if os.path.exists(fai) and os.path.getmtime(fai) >= os.path.getmtime(fasta):
+            self._load_fai(fai)
+        else:
+            indexer = self._index()
+            if indexer.has_cr and not is_gz:
+                # Offsets are given in the normalized fasta:
+                self._load_copy()
+                return
+            self._load_indexer(indexer)
+            if indexer.fai_valid:
+                try:
+                    indexer.write_fai(fai)
+                except OSError:
+                    pass
+        self._open(fasta)
+
+    def _index(self, copy=None):
+        """
+        Index the fasta file
+
+        :param copy: file into which normalized content of the fasta file is copied, if not None
+        :type copy: file
+        :return: the indexer
+        :rtype: FastaIndexer
+        """
+        indexer = FastaIndexer()
+        for block in indexer.read_blocks(self.fasta):
+            if copy is not None:
+                copy.write(block)
+            if not indexer.feed(block):
+                raise ValueError(indexer.error)
+        indexer.close()
+        return indexer
+
+    def _load_copy(self):
+        """
+        Copy the fasta file in a temporary file with normalized line endings, and index it
+        """
+        fd, self._tmp = tempfile.mkstemp(prefix="extract_", suffix=".fasta", dir=os.path.dirname(self.fasta))
+        try:
+            with os.fdopen(fd, "wb") as copy:
+                indexer = self._index(copy)
+        except Exception:
+            self.close()
+            raise
+        self._load_indexer(indexer)
+        self._open(self._tmp)
+
+    def _load_fai(self, fai):
+        """
+        Load contigs positions from a samtools index
+
+        :param fai: fai file path
+        :type fai: str
+        """
+        seq_end = 0
+        with open(fai, "r") as fai_f:
+            for line in fai_f:
+                name, length, seq_offset, line_bases, line_width = line.rstrip("\n").split("\t")[:5]
+                length, seq_offset, line_bases, line_width = int(length), int(seq_offset), int(line_bases), \
+                    int(line_width)
+                nb_lines = -(-length // line_bases) if line_bases > 0 else 0
+                header_search = seq_end
+                seq_end = seq_offset + length + nb_lines * (line_width - line_bases)
+                self.records[name] = (header_search, seq_offset, seq_end)
+
+    def _load_indexer(self, indexer):
+        """
+        Load contigs positions from an indexer
+
+        :param indexer: indexer of the fasta file
+        :type indexer: FastaIndexer
+        """
+        ends = indexer.starts[1:] + [indexer.offset]
+        for (name, length), start, fai, end in zip(indexer.contigs, indexer.starts, indexer.fai, ends):
+            self.records[name] = (start, fai[2], end)
+
+    def _open(self, path):
+        """
+        Open the fasta file to read
+
+        :param path: fasta file path (BGZF file with its .gzi index, or uncompressed file)
+        :type path: str
+        """
+        if path.endswith(".gz"):
+            self._reader = BgzfReader(path, path + ".gzi")
+        else:
+            self._file = open(path, "rb")
+
+    def close(self):
+        """
+        Close the fasta file, and remove the temporary copy, if any
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._tmp is not None:
+            os.remove(self._tmp)
+            self._tmp = None
+
+    def _read(self, start, end):
+        """
+        Read a range of the fasta file
+
+        :param start: start offset
+        :type start: int
+        :param end: end offset (excluded)
+        :type end: int
+        :return: generator of chunks
+        :rtype: generator
+        """
+        if self._reader is not None:
+            yield from self._reader.read_range(start, end)
+            return
+        while start < end:
+            data = os.pread(self._file.fileno(), min(self.chunk_size, end - start), start)
+            if len(data) == 0:
+                break
+            yield data
+            start += len(data)
+
+    def header(self, name: str):
+        """
+        Get header of a contig
+
+        :param name: contig name
+        :type name: str
+        :return: header line, without ">"
+        :rtype: str
+        """
+        header_search, seq_start, seq_end = self.records[name]
+        lines = b"".join(self._read(header_search, seq_start)).rstrip(b"\r\n")
+        return lines[lines.rfind(b"\n") + 1:][1:].decode("utf-8").rstrip()
+
+    def sequence(self, name: str, reverse: bool=False):
+        """
+        Read sequence of a contig by chunks
+
+        :param name: contig name
+        :type name: str
+        :param reverse: if True, get the reverse complement of the sequence
+        :type reverse: bool
+        :return: generator of sequence chunks, without newlines
+        :rtype: generator
+        """
+        header_search, seq_start, seq_end = self.records[name]
+        if not reverse:
+            for data in self._read(seq_start, seq_end):
+                yield data.translate(None, b"\r\n")
+            return
+        pos = seq_end
+        while pos > seq_start:
+            chunk_start = max(seq_start, pos - self.chunk_size)
+            data = b"".join(self._read(chunk_start, pos)).translate(None, b"\r\n")
+            yield data[::-1].translate(self.complement)
+            pos = chunk_start
+
+    def write(self, out, title: str, contigs: list, spacer: bytes=b""):
+        """
+        Write a fasta record, made of one or several contigs
+
+        :param out: output file, opened in binary mode
+        :type out: file
+        :param title: header of the record, without ">"
+        :type title: str
+        :param contigs: contigs to write, as (name, reverse). Reverse complement of the contig is written if reverse
+            is True
+        :type contigs: list
+        :param spacer: sequence added between contigs
+        :type spacer: bytes
+        """
+        out.write(b">" + title.encode("utf-8") + b"\n")
+        line = bytearray()
+        for i, (name, reverse) in enumerate(contigs):
+            if i > 0:
+                self._write_lines(out, line, spacer)
+            for chunk in self.sequence(name, reverse):
+                self._write_lines(out, line, chunk)
+        if len(line) > 0:
+            out.write(line + b"\n")
+
+    def _write_lines(self, out, line, data):
+        """
+        Add data to the current line, and write all complete lines
+
+        :param out: output file
+        :type out: file
+        :param line: current line (incomplete), updated
+        :type line: bytearray
+        :param data: sequence to add
+        :type data: bytes
+        """
+        line += data
+        width = self.line_width
+        nb_lines = len(line) // width
+        if nb_lines > 0:
+            out.write(b"\n".join([line[i * width:(i + 1) * width] for i in range(nb_lines)]) + b"\n")
+            del line[:nb_lines * width]
@@ -7,11 +7,12 @@ import re
 import traceback
 from collections import OrderedDict
 from datetime import datetime
-from Bio import SeqIO
 from jinja2 import Template
 from xopen import xopen
 from dgenies.config_reader import AppConfigReader
 from dgenies.allowed_extensions import AllowedExtensions
+from dgenies.bin.bgzf import BgzfWriter
+from dgenies.lib.fasta_extractor import FastaExtractor
 
 
 class Functions:
@@ -21,6 +22,8 @@ class Functions:
     """
 
     config = AppConfigReader()
+    # Size of chunks read when files are compressed or uncompressed:
+    chunk_size = 16 * 1024 * 1024
 
     @staticmethod
     def hardlink_or_copy(src, dest):
@@ -167,7 +170,7 @@ class Functions:
                 uncompressed = "%s/%d_%s" % (file_path, n, basename)
                 n += 1
             with xopen(filename, "rb") as infile, open(uncompressed, "wb") as outfile:
-                outfile.write(infile.read())
+                shutil.copyfileobj(infile, outfile, Functions.chunk_size)
             return uncompressed
         except Exception as e:
             print(traceback.format_exc())
@@ -176,7 +179,8 @@ class Functions:
     @staticmethod
     def compress(filename, overwrite=False, remove=True):
         """
-        Compress a file with gzip
+        Compress a file with gzip, in BGZF format (blocks are compressed in parallel, see compress_threads and
+        compress_level options)
 
         :param filename: file to compress
         :type filename: str
@@ -197,8 +201,10 @@ class Functions:
                 while not overwrite and os.path.exists(compressed):
                     compressed = "%s/%d_%s" % (file_path, n, basename)
                     n += 1
-                with open(filename, "rb") as infile, xopen(compressed, mode="wb", format="gz") as outfile:
-                    shutil.copyfileobj(infile, outfile)
+                with open(filename, "rb") as infile, \
+                        BgzfWriter(compressed, level=Functions.config.compress_level,
+                                   threads=Functions.config.compress_threads) as outfile:
+                    shutil.copyfileobj(infile, outfile, Functions.chunk_size)
                 if remove:
                     os.remove(filename)
                 return compressed
@@ -313,29 +319,13 @@ class Functions:
         :type mode: str
         """
         index, sample_name = Functions.read_index(index_file)
-        is_compressed = fasta_file.endswith(".gz")
-        if is_compressed:
-            fasta_file = Functions.uncompress(fasta_file)
         if with_date:
             sample_name = datetime.utcnow().strftime('%Y%m%d%H%M%S') + "_" + sample_name
         fasta_file_o = os.path.join(os.path.dirname(fasta_file), sample_name + ".fasta")
         print(fasta_file_o)
-        seq = SeqIO.index(fasta_file, "fasta")
-        with open(fasta_file_o, "w") as fasta_out:
+        with FastaExtractor(fasta_file) as seq, open(fasta_file_o, "wb") as fasta_out:
             for name, props in index.items():
-                sequence = seq[name]
-                if props["to_reverse"]:
-                    s_id = sequence.id
-                    s_name = sequence.name
-                    s_description = sequence.description
-                    sequence = sequence.reverse_complement()
-                    sequence.id = s_id
-                    sequence.name = s_name
-                    sequence.description = s_description
-                SeqIO.write(sequence, fasta_out, "fasta")
-        seq.close()
-        if is_compressed:
-            os.remove(fasta_file)
+                seq.write(fasta_out, seq.header(name), [(name, props["to_reverse"])])
         if compress:
             fasta_file_o = Functions.compress(fasta_file_o, overwrite)
         if dot_file:
@@ -8,6 +8,9 @@ import subprocess
 from datetime import datetime
 import time
 import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 import re
 from dgenies.config_reader import AppConfigReader
 from dgenies.tools import Tools
@@ -24,12 +27,14 @@ import traceback
 from pathlib import Path
 from urllib import request, parse
 import tarfile
-from dgenies.bin.split_fa import Splitter
-from dgenies.bin.index import index_file, Index
-from dgenies.bin.filter_contigs import Filter
+from dgenies.bin.index import Index
 from dgenies.bin.merge_splitted_chrms import Merger
+from dgenies.bin.prepare_fasta import Preparer, prepare as run_preparer
 from dgenies.bin.sort_paf import Sorter
 from dgenies.lib.paf import Paf
+from dgenies.lib.match_store import MatchStore
+from dgenies.lib.match_index import MatchIndex
+from dgenies.lib.artifacts import Artifacts
 from dgenies.lib.exceptions import DGeniesFileCheckError, DGeniesNotGzipFileError, DGeniesUploadedFileSizeLimitError, \
     DGeniesAlignmentFileUnsupported, DGeniesAlignmentFileInvalid, DGeniesIndexFileInvalid, DGeniesFastaFileInvalid, \
     DGeniesURLError, DGeniesURLInvalid, DGeniesDistantFileTypeUnsupported, DGeniesDownloadError, \
@@ -55,6 +60,10 @@ class JobManager:
     Jobs management
     """
 
+    # Pool of processes preparing fasta files of jobs launched locally, shared by all jobs (see _run_preparers):
+    _prepare_pool = None
+    _prepare_pool_lock = threading.Lock()
+
     def __init__(self, id_job, email=None, query: DataFile = None, target: DataFile = None, mailer=None,
                  tool="minimap2", align: DataFile = None, backup: DataFile = None, batch=None, options=None):
         """
@@ -1233,7 +1242,9 @@ class JobManager:
         args = [self.config.cluster_prepare_script,
                 "-t", self.target.get_path(),
                 "-m", self.target.get_name(),
-                "-p", self.preptime_file]
+                "-p", self.preptime_file,
+                "-l", str(self.config.compress_level),
+                "-@", str(self.config.compress_threads)]
         if self.query is not None:
             args += ["-q", self.query.get_path(),
                      "-u", self.get_query_split(),
@@ -1262,91 +1273,137 @@ class JobManager:
         except DGeniesClusterRunError as e:
             raise e
 
+    def _fasta_preparer(self, datafile, type_f, index_file, do_filter=True):
+        """
+        Get the preparer which indexes a fasta file and removes too small contigs. Filtered fasta replaces the input
+        file. A gzipped file is kept compressed, in BGZF format
+
+        :param datafile: fasta file
+        :type datafile: DataFile
+        :param type_f: type of fasta (query or target)
+        :type type_f: str
+        :param index_file: output index file path
+        :type index_file: str
+        :param do_filter: if True, remove too small contigs
+        :type do_filter: bool
+        :return: the preparer
+        :rtype: Preparer
+        """
+        fasta = datafile.get_path()
+        self.logger.info("{} - {} {} file: {}".format(self.id_job, "Index and filter" if do_filter else "Index", type_f,
+                                                    fasta))
+        return Preparer(fasta=fasta,
+                        name=datafile.get_name(),
+                        index_file=index_file,
+                        type_f=type_f,
+                        out_fasta=fasta,
+                        do_filter=do_filter,
+                        compress_level=self.config.compress_level,
+                        compress_threads=self.config.compress_threads)
+
+    def _prepare_fasta(self, datafile, type_f, index_file, do_filter=True):
+        """
+        Index a fasta file and remove too small contigs. Filtered fasta replaces the input file. A gzipped file is kept
+        compressed, in BGZF format
+
+        :param datafile: fasta file
+        :type datafile: DataFile
+        :param type_f: type of fasta (query or target)
+        :type type_f: str
+        :param index_file: output index file path
+        :type index_file: str
+        :param do_filter: if True, remove too small contigs
+        :type do_filter: bool
+        :return:
+            * [0] True if the fasta file is valid, else False
+            * [1] Error message
+        :rtype: (bool, str)
+        """
+        return self._fasta_preparer(datafile, type_f, index_file, do_filter).prepare()
+
+    def _run_preparers(self, preparers):
+        """
+        Run preparers of fasta files at the same time, in the pool of processes shared by all jobs. The pool has
+        prepare_processes processes (by default, two for each of the data_prepare jobs launched locally).
+        Preparers are run one after the other if only one process is allowed.
+
+        Jobs are run in threads: workers are started by a fork server (or spawned), never forked from this
+        multithreaded process. Must not be called while a database connection is open, as preparing may be long.
+
+        :param preparers: preparers to run
+        :type preparers: list
+        :return: result of each preparer (see :func:`dgenies.bin.prepare_fasta.Preparer.prepare`)
+        :rtype: list
+        """
+        nb_processes = self.config.prepare_processes
+        if len(preparers) < 2 or nb_processes < 2:
+            return [preparer.prepare() for preparer in preparers]
+        with JobManager._prepare_pool_lock:
+            if JobManager._prepare_pool is None:
+                start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                JobManager._prepare_pool = ProcessPoolExecutor(max_workers=nb_processes,
+                                                               mp_context=multiprocessing.get_context(start_method))
+            pool = JobManager._prepare_pool
+        futures = [pool.submit(run_preparer, preparer) for preparer in preparers]
+        wait(futures)
+        try:
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            # A worker has been killed: a new pool will be created for next jobs
+            with JobManager._prepare_pool_lock:
+                if JobManager._prepare_pool is pool:
+                    JobManager._prepare_pool = None
+            raise
+
     def prepare_align_local(self):
         """
-        Prepare align data locally. On standalone mode, launch job after, if success.
+        Prepare align data locally: query and target are prepared at the same time, without keeping a database
+        connection open. On standalone mode, launch job after, if success.
         :return: True if job succeed, else False
         :rtype: bool
         """
         with open(self.logs, "a") as logs:
             logs.write("Prepare files\n")
-        with open(self.preptime_file, "w") as ptime, Job.connect():
-            self.set_job_status("preparing")
+        with open(self.preptime_file, "w") as ptime:
+            with Job.connect():
+                self.set_job_status("preparing")
             ptime.write(str(round(time.time())) + "\n")
+            preparers = []
             if self.query is not None:
-                fasta_in = self.query.get_path()
                 if self.tool.split_before:
-                    self.logger.info("{} - Split query file: {}".format(self.id_job, fasta_in))
-                    split = True
-                    splitter = Splitter(input_f=fasta_in, name_f=self.query.get_name(), output_f=self.get_query_split(),
-                                        query_index=self.query_index_split, debug=DEBUG)
-                    success, error = splitter.split()
-                    nb_contigs = splitter.nb_contigs
-                    in_fasta = self.get_query_split()
-                else:
-                    split = False
-                    uncompressed = None
-                    if self.query.get_path().endswith(".gz"):
-                        uncompressed = self.query.get_path()[:-3]
-                    self.logger.info("{} - Index query file: {}".format(self.id_job, self.query.get_path()))
-                    success, nb_contigs, error = index_file(self.query.get_path(), self.query.get_name(), self.idx_q,
-                                                            uncompressed)
-                    in_fasta = self.query.get_path()
-                    if uncompressed is not None:
-                        in_fasta = uncompressed
-                if success:
-                    self.logger.info("{} - Filter query file: {}".format(self.id_job, self.query.get_path()))
-                    filtered_fasta = os.path.join(os.path.dirname(self.get_query_split()), "filtered_" +
-                                                  os.path.basename(self.get_query_split()))
-                    filter_f = Filter(fasta=in_fasta,
-                                      index_file=self.query_index_split if split else self.idx_q,
-                                      type_f="query",
-                                      min_filtered=round(nb_contigs / 4),
-                                      split=True,
-                                      out_fasta=filtered_fasta,
-                                      replace_fa=True)
-                    filter_f.filter()
+                    self.logger.info("{} - Split and filter query file: {}".format(self.id_job, self.query.get_path()))
+                    preparers.append(("Query", Preparer(fasta=self.query.get_path(),
+                                                        name=self.query.get_name(),
+                                                        index_file=self.query_index_split,
+                                                        type_f="query",
+                                                        out_fasta=self.get_query_split(),
+                                                        split=True,
+                                                        compress_level=self.config.compress_level,
+                                                        compress_threads=self.config.compress_threads)))
                 else:
-                    raise DGeniesFastaFileInvalid("Query", error)
-            uncompressed = None
-            if self.target.get_path().endswith(".gz"):
-                uncompressed = self.target.get_path()[:-3]
-            success, nb_contigs, error = index_file(self.target.get_path(), self.target.get_name(), self.idx_t,
-                                                    uncompressed)
-            if success:
-                in_fasta = self.target.get_path()
-                if uncompressed is not None:
-                    in_fasta = uncompressed
-                self.logger.info("{} - Filter target file: {}".format(self.id_job, in_fasta))
-                filtered_fasta = os.path.join(os.path.dirname(in_fasta), "filtered_" + os.path.basename(in_fasta))
-                filter_f = Filter(fasta=in_fasta,
-                                  index_file=self.idx_t,
-                                  type_f="target",
-                                  min_filtered=round(nb_contigs / 4),
-                                  split=False,
-                                  out_fasta=filtered_fasta,
-                                  replace_fa=True)
-                is_filtered = filter_f.filter()
-                if uncompressed is not None:
-                    if is_filtered:
-                        # replace original fasta file with filtered one
-                        os.remove(self.target.get_path())
-                        self.target.set_path(uncompressed)
-                        with open(os.path.join(self.output_dir, ".target"), "w") as save_file:
-                            save_file.write(uncompressed)
-                    else:
-                        os.remove(uncompressed)
-            else:
-                if uncompressed is not None:
-                    try:
-                        os.remove(uncompressed)
-                    except FileNotFoundError:
-                        pass
-                raise DGeniesFastaFileInvalid("Target", error)
+                    preparers.append(("Query", self._fasta_preparer(self.query, "query", self.idx_q)))
+            preparers.append(("Target", self._fasta_preparer(self.target, "target", self.idx_t)))
+            results = self._run_preparers([preparer for type_f, preparer in preparers])
+            for (type_f, preparer), (success, error) in zip(preparers, results):
+                if not success:
+                    raise DGeniesFastaFileInvalid(type_f, error)
             ptime.write(str(round(time.time())) + "\n")
-            self.set_job_status("prepared")
-            if MODE != "webserver":
-                self.run_align("local")
+            with Job.connect():
+                self.set_job_status("prepared")
+        if MODE != "webserver":
+            self.run_align("local")
+
+    def build_artifacts(self):
+        """
+        Pre-compute responses of the result page (dot plot data, summary, query/target association). Called once the
+        job is marked as successful, so it does not delay the result. Errors are only logged: artifacts which are
+        missing are built on demand, by the first request
+        """
+        self.logger.info("{} - Build result artifacts".format(self.id_job))
+        try:
+            Artifacts.build(self.output_dir)
+        except Exception:
+            self.logger.warning("{} - Build result artifacts failed:\n{}".format(self.id_job, traceback.format_exc()))
 
     def _end_of_prepare_dotplot(self):
         """
@@ -1366,9 +1423,11 @@ class JobManager:
 
         # Sort paf lines:
         self.logger.info("{} - Sort PAF file".format(self.id_job))
-        sorter = Sorter(self.paf_raw, self.paf)
+        sorter = Sorter(self.paf_raw, self.paf, processes=self.config.sort_processes)
         sorter.sort()
         os.remove(self.paf_raw)
+        self.logger.info("{} - Build match store and index".format(self.id_job))
+        MatchIndex.build(MatchStore.build(self.paf))
         if self.target is not None and os.path.exists(self.target.get_path()) and not \
                 self.target.get_path().endswith(".idx"):
             os.remove(self.target.get_path())
@@ -1376,6 +1435,7 @@ class JobManager:
         self.align.set_path(self.paf)
         self.set_job_status("success")
         self.send_mail_post_if_allowed()
+        self.build_artifacts()
 
     def prepare_dotplot_cluster(self, runner_type):
         """
@@ -1387,7 +1447,9 @@ class JobManager:
         """
 
         args = [self.config.cluster_prepare_script,
-                "-p", self.preptime_file, "--index-only"]
+                "-p", self.preptime_file, "--index-only",
+                "-l", str(self.config.compress_level),
+                "-@", str(self.config.compress_threads)]
 
         target_format = os.path.splitext(self.target.get_path())[1][1:]
         all_is_index = target_format == "idx"
@@ -1452,7 +1514,7 @@ class JobManager:
             self.logger.info("{} - Index target file: {}".format(self.id_job, self.target.get_path()))
             with open(self.logs, "a") as logs:
                 logs.write("Index target file: {}\n".format(self.target.get_path()))
-            index_file(self.target.get_path(), self.target.get_name(), self.idx_t)
+            self._prepare_fasta(self.target, "target", self.idx_t, do_filter=False)
 
         # Prepare query index:
         if self.query is not None:
@@ -1464,7 +1526,7 @@ class JobManager:
                 self.logger.info("{} - Index query file: {}".format(self.id_job, self.query.get_path()))
                 with open(self.logs, "a") as logs:
                     logs.write("Index target file: {}\n".format(self.query.get_path()))
-                index_file(self.query.get_path(), self.query.get_name(), self.idx_q)
+                self._prepare_fasta(self.query, "query", self.idx_q, do_filter=False)
         else:
             shutil.copy(self.idx_t, self.idx_q)
 
@@ -1562,13 +1624,15 @@ class JobManager:
             try:
                 if MODE == "webserver":
                     with Job.connect():
-                        job = Job.get(Job.id_job == self.id_job)
-                        if job.runner_type == "local":
-                            self.logger.info("{} - Run prepare align: local mode".format(self.id_job))
-                            self.prepare_align_local()
-                        else:
-                            self.logger.info("{} - Run prepare align: cluster mode".format(self.id_job))
-                            self.prepare_align_cluster(job.runner_type)
+                        runner_type = Job.get(Job.id_job == self.id_job).runner_type
+                    if runner_type == "local":
+                        # Fasta files are prepared without keeping the database connection open:
+                        self.logger.info("{} - Run prepare align: local mode".format(self.id_job))
+                        self.prepare_align_local()
+                    else:
+                        self.logger.info("{} - Run prepare align: cluster mode".format(self.id_job))
+                        with Job.connect():
+                            self.prepare_align_cluster(runner_type)
                 else:
                     self.prepare_align_local()
 
@@ -1676,20 +1740,15 @@ class JobManager:
                         job.save()
                     else:
                         self.set_status_standalone(status)
+                    # Merge of split contigs and conversion to PAF are done while lines are read by the sort:
+                    transforms = []
                     if self.tool.split_before and self.query is not None:
                         # If split and not ava, we merge back files
-                        start = time.time()
-                        paf_raw = self.paf_raw + ".split"
                         os.remove(self.get_query_split())
-                        merger = Merger(self.paf_raw, paf_raw, self.query_index_split,
+                        merger = Merger(self.paf_raw, None, self.query_index_split,
                                         self.idx_q, debug=DEBUG)
-                        merger.merge()
-                        os.remove(self.paf_raw)
+                        transforms.append(merger.merge_stream())
                         os.remove(self.query_index_split)
-                        self.paf_raw = paf_raw
-                        end = time.time()
-                        if MODE == "webserver":
-                            job.time_elapsed += end - start
                     elif self.query is None:
                         self.logger.debug("{} - No merge needed in ava mode".format(self.id_job))
                         # If ava, we copy target index to query index
@@ -1697,18 +1756,29 @@ class JobManager:
                         Path(os.path.join(self.output_dir, ".all-vs-all")).touch()
                     if self.tool.parser is not None:
                         # The align file needs to be transformed to paf
-                        self.logger.debug("{} - Transform align file to PAF...".format(self.id_job))
-                        paf_raw = self.paf_raw + ".parsed"
-                        getattr(parsers, self.tool.parser)(self.paf_raw, paf_raw)
-                        os.remove(self.paf_raw)
-                        self.paf_raw = paf_raw
-                        self.logger.debug("{} - Transform align file to PAF: OK".format(self.id_job))
+                        if hasattr(parsers, self.tool.parser + "_lines"):
+                            transforms.append(getattr(parsers, self.tool.parser + "_lines"))
+                        else:
+                            self.logger.debug("{} - Transform align file to PAF...".format(self.id_job))
+                            paf_raw = self.paf_raw + ".parsed"
+                            getattr(parsers, self.tool.parser)(self.paf_raw, paf_raw)
+                            os.remove(self.paf_raw)
+                            self.paf_raw = paf_raw
+                            self.logger.debug("{} - Transform align file to PAF: OK".format(self.id_job))
                     # Matches form paf file are sorted by desc. matching size
                     self.logger.info("{} - Sorting PAF file...".format(self.id_job))
-                    sorter = Sorter(self.paf_raw, self.paf)
+                    start = time.time()
+                    sorter = Sorter(self.paf_raw, self.paf, processes=self.config.sort_processes,
+                                    transforms=transforms)
                     sorter.sort()
                     os.remove(self.paf_raw)
+                    if MODE == "webserver":
+                        # Split contigs are merged by the sort: its time is counted for all jobs
+                        job.time_elapsed += round(time.time() - start)
+                        job.save()
                     self.logger.info("{} - Sorting PAF file: OK".format(self.id_job))
+                    # Matches are saved in a binary store with a spatial index, used by the result page
+                    MatchIndex.build(MatchStore.build(self.paf))
                     # Cleanup target
                     if self.target is not None and os.path.exists(self.target.get_path()):
                         os.remove(self.target.get_path())
@@ -1747,6 +1817,8 @@ class JobManager:
                         else:
                             self.logger.info("{} - Run align: OK".format(self.id_job))
                             self.set_status_standalone(status)
+                if success:
+                    self.build_artifacts()
 
         except DGeniesRunError as e:
             with Job.connect():
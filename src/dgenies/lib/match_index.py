@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import shutil
+import numpy as np
+
+
+class MatchIndex:
+    """
+    Spatial index of the matches of a match store, saved inside the store directory.
+
+    Matches are grouped by contig pair (target contig, query contig): the grid defined by contigs boundaries. Inside
+    each pair, matches are sorted by their start on the target contig, so a query only reads the matches of the pairs
+    it intersects, and only the part of these pairs which can overlap the searched positions.
+    Coordinates are local to contigs: absolute positions of the dot plot are translated with the ``abs_start`` of
+    contigs (see :func:`dgenies.bin.index.Index.load`), so the index is still valid when contigs are sorted.
+    """
+
+    folder = "index"
+    version = 1
+    arrays = ("rows", "x_lo", "pair_q", "pair_starts", "pair_ends", "pair_max_len", "t_ptr")
+
+    def __init__(self, store):
+        """
+
+        :param store: match store of the job
+        :type store: dgenies.lib.match_store.MatchStore
+        """
+        self.store = store
+        self.index_dir = os.path.join(store.store_dir, self.folder)
+        self.rows = None
+        self.x_lo = None
+        self.pair_q = None
+        self.pair_starts = None
+        self.pair_ends = None
+        self.pair_max_len = None
+        self.t_ptr = None
+
+    def _compute(self):
+        """
+        Compute index arrays from the store columns
+        """
+        store = self.store
+        nb_q = max(len(store.q_names), 1)
+        q_id = np.asarray(store["q_id"])
+        t_id = np.asarray(store["t_id"])
+        x_lo = np.minimum(store["t_start"], store["t_end"])
+        x_len = np.abs(store["t_end"] - store["t_start"])
+
+        order = np.lexsort((x_lo, q_id, t_id))
+        pair_keys = t_id[order].astype(np.int64) * nb_q + q_id[order]
+        pair_starts = np.flatnonzero(np.diff(pair_keys)) + 1
+        if len(order) > 0:
+            pair_starts = np.concatenate(([0], pair_starts))
+
+        self.rows = order.astype(np.int64)
+        self.x_lo = x_lo[order]
+        self.pair_q = pair_keys[pair_starts] % nb_q
+        self.pair_starts = pair_starts.astype(np.int64)
+        self.pair_ends = np.concatenate((pair_starts[1:], [len(order)])).astype(np.int64)
+        self.pair_max_len = np.maximum.reduceat(x_len[order], pair_starts) if len(order) > 0 else \
+            np.zeros(0, dtype=np.int64)
+        # Pairs of target contig t are pairs t_ptr[t] to t_ptr[t+1] (excluded):
+        self.t_ptr = np.searchsorted(pair_keys[pair_starts] // nb_q, np.arange(len(store.t_names) + 1))
+
+    def is_valid(self):
+        """
+        Check if the saved index exists and matches the store
+
+        :return: True if the index can be used, else False
+        :rtype: bool
+        """
+        try:
+            with open(os.path.join(self.index_dir, "meta.json"), "r") as meta_f:
+                meta = json.load(meta_f)
+            with open(os.path.join(self.store.store_dir, "meta.json"), "r") as meta_f:
+                store_meta = json.load(meta_f)
+        except (IOError, ValueError):
+            return False
+        return meta.get("version") == self.version and meta.get("source") == store_meta.get("source")
+
+    @classmethod
+    def build(cls, store):
+        """
+        Build the index of a store and save it. The index is written in a temporary folder, then moved in place.
+
+        :param store: match store of the job
+        :type store: dgenies.lib.match_store.MatchStore
+        :return: the index
+        :rtype: MatchIndex
+        """
+        index = cls(store)
+        index._compute()
+        with open(os.path.join(store.store_dir, "meta.json"), "r") as meta_f:
+            source = json.load(meta_f)["source"]
+
+        tmp_dir = "%s.tmp.%d" % (index.index_dir, os.getpid())
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        for name in cls.arrays:
+            np.save(os.path.join(tmp_dir, name + ".npy"), getattr(index, name))
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as meta_f:
+            json.dump({"version": cls.version, "source": source}, meta_f)
+
+        if os.path.exists(index.index_dir):
+            shutil.rmtree(index.index_dir, ignore_errors=True)
+        try:
+            os.rename(tmp_dir, index.index_dir)
+        except OSError:
+            # Another process has built the index at the same time
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return index
+
+    @classmethod
+    def load(cls, store, build=True):
+        """
+        Load the index of a store
+
+        :param store: match store of the job
+        :type store: dgenies.lib.match_store.MatchStore
+        :param build: if True, build the index if it does not exist or is outdated
+        :type build: bool
+        :return: the index, or None if not available and build is False
+        :rtype: MatchIndex
+        """
+        index = cls(store)
+        if index.is_valid():
+            for name in cls.arrays:
+                setattr(index, name, np.load(os.path.join(index.index_dir, name + ".npy"), mmap_mode="r"))
+            return index
+        if build:
+            return cls.build(store)
+        return None
+
+    def get_memory_size(self):
+        """
+        Get memory used by the index. Memory-mapped arrays are not counted: they are shared through the page cache.
+
+        :return: size in bytes
+        :rtype: int
+        """
+        return sum(getattr(self, name).nbytes for name in self.arrays
+                   if not isinstance(getattr(self, name), np.memmap))
+
+    def _pair_rows(self, pair, start, end):
+        """
+        Get rows of matches of a pair which may overlap an interval on the target contig
+
+        :param pair: pair index
+        :type pair: int
+        :param start: interval start (local position on target contig)
+        :type start: int
+        :param end: interval end (local position on target contig)
+        :type end: int
+        :return: rows of the matches in the store
+        :rtype: numpy.ndarray
+        """
+        p_start = int(self.pair_starts[pair])
+        p_end = int(self.pair_ends[pair])
+        x_lo = self.x_lo[p_start:p_end]
+        first = p_start + np.searchsorted(x_lo, start - self.pair_max_len[pair], side="left")
+        last = p_start + np.searchsorted(x_lo, end, side="right")
+        return self.rows[first:last]
+
+    def _find_pair(self, t_id, q_id):
+        """
+        Find a contig pair
+
+        :param t_id: target contig id
+        :type t_id: int
+        :param q_id: query contig id
+        :type q_id: int
+        :return: pair index, or None if there is no match between these contigs
+        :rtype: int|None
+        """
+        first = int(self.t_ptr[t_id])
+        last = int(self.t_ptr[t_id + 1])
+        pair = first + int(np.searchsorted(self.pair_q[first:last], q_id))
+        if pair < last and self.pair_q[pair] == q_id:
+            return pair
+        return None
+
+    def window(self, t_windows, q_mask):
+        """
+        Get matches which may be inside a window
+
+        :param t_windows: for each target contig id inside the window, the (start, end) local positions of the window
+            on this contig
+        :type t_windows: dict
+        :param q_mask: for each query contig id, True if the contig is inside the window
+        :type q_mask: numpy.ndarray
+        :return: rows of candidate matches in the store (unsorted). Candidates must be filtered on exact coordinates
+        :rtype: numpy.ndarray
+        """
+        slices = []
+        for t, (start, end) in t_windows.items():
+            first = int(self.t_ptr[t])
+            last = int(self.t_ptr[t + 1])
+            for pair in (first + np.flatnonzero(q_mask[self.pair_q[first:last]])).tolist():
+                rows = self._pair_rows(pair, start, end)
+                if len(rows) > 0:
+                    slices.append(rows)
+        if len(slices) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(slices)
+
+    def point(self, t_id, q_id, x):
+        """
+        Get matches of a contig pair which may contain a position on the target contig
+
+        :param t_id: target contig id
+        :type t_id: int
+        :param q_id: query contig id
+        :type q_id: int
+        :param x: position on the target contig (local)
+        :type x: int
+        :return: rows of candidate matches in the store (unsorted). Candidates must be filtered on exact coordinates
+        :rtype: numpy.ndarray
+        """
+        pair = self._find_pair(t_id, q_id)
+        if pair is None:
+            return np.zeros(0, dtype=np.int64)
+        return np.asarray(self._pair_rows(pair, x, x))
+
+    def pair(self, t_id, q_id):
+        """
+        Get all matches between two contigs
+
+        :param t_id: target contig id
+        :type t_id: int
+        :param q_id: query contig id
+        :type q_id: int
+        :return: rows of matches in the store, sorted by start on target
+        :rtype: numpy.ndarray
+        """
+        pair = self._find_pair(t_id, q_id)
+        if pair is None:
+            return np.zeros(0, dtype=np.int64)
+        return np.asarray(self.rows[self.pair_starts[pair]:self.pair_ends[pair]])
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import shutil
+from array import array
+import numpy as np
+
+
+class MatchStore:
+    """
+    Columnar binary copy of a PAF file.
+
+    The store is a directory saved next to the PAF file (``map.paf.store`` for ``map.paf``). It contains one numpy
+    file for each used PAF column and the tables of contig names. Columns are memory-mapped when the store is loaded,
+    so the parse cost is paid once per job and the data is shared between processes through the page cache.
+    The spatial index of matches (see :class:`dgenies.lib.match_index.MatchIndex`) is saved inside the store directory.
+    """
+
+    suffix = ".store"
+    version = 1
+
+    # Column name: (array typecode, numpy dtype)
+    columns = {
+        "q_id": ("i", np.int32),
+        "q_start": ("q", np.int64),
+        "q_end": ("q", np.int64),
+        "strand": ("b", np.int8),
+        "t_id": ("i", np.int32),
+        "t_start": ("q", np.int64),
+        "t_end": ("q", np.int64),
+        "matches": ("q", np.int64),
+        "block_len": ("q", np.int64),
+    }
+
+    def __init__(self, paf: str):
+        """
+
+        :param paf: PAF file path
+        :type paf: str
+        """
+        self.paf = paf
+        self.store_dir = paf + self.suffix
+        self.nb_lines = 0
+        self.q_names = []
+        self.t_names = []
+        self.q_lens = None
+        self.t_lens = None
+        self.data = {}
+
+    def __len__(self):
+        return self.nb_lines
+
+    def __getitem__(self, column):
+        return self.data[column]
+
+    @staticmethod
+    def _source_stamp(paf):
+        """
+        Get the stamp of the PAF file, used to check if the store is up to date
+
+        :param paf: PAF file path
+        :type paf: str
+        :return: size and modification time (ns) of the file
+        :rtype: list
+        """
+        stat = os.stat(paf)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def is_valid(self):
+        """
+        Check if the store exists and matches the current PAF file
+
+        :return: True if the store can be used, else False
+        :rtype: bool
+        """
+        try:
+            with open(os.path.join(self.store_dir, "meta.json"), "r") as meta_f:
+                meta = json.load(meta_f)
+        except (IOError, ValueError):
+            return False
+        return meta.get("version") == self.version and meta.get("source") == self._source_stamp(self.paf)
+
+    @classmethod
+    def build(cls, paf: str):
+        """
+        Build the store of a PAF file. The store is written in a temporary folder, then moved in place.
+
+        :param paf: PAF file path
+        :type paf: str
+        :return: the loaded store
+        :rtype: MatchStore
+        """
+        store = cls(paf)
+        stamp = cls._source_stamp(paf)
+        cols = {name: array(typecode) for name, (typecode, dtype) in cls.columns.items()}
+        q_ids = {}
+        t_ids = {}
+        q_lens = array("q")
+        t_lens = array("q")
+        with open(paf, "r") as paf_file:
+            for line in paf_file:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) < 11:
+                    continue
+                v1 = parts[0]
+                v6 = parts[5]
+                if v1 not in q_ids:
+                    q_ids[v1] = len(q_ids)
+                    q_lens.append(int(parts[1]))
+                if v6 not in t_ids:
+                    t_ids[v6] = len(t_ids)
+                    t_lens.append(int(parts[6]))
+                cols["q_id"].append(q_ids[v1])
+                cols["q_start"].append(int(parts[2]))
+                cols["q_end"].append(int(parts[3]))
+                cols["strand"].append(1 if parts[4] == "+" else -1)
+                cols["t_id"].append(t_ids[v6])
+                cols["t_start"].append(int(parts[7]))
+                cols["t_end"].append(int(parts[8]))
+                cols["matches"].append(int(parts[9]))
+                cols["block_len"].append(int(parts[10]))
+
+        tmp_dir = "%s.tmp.%d" % (store.store_dir, os.getpid())
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        for name, (typecode, dtype) in cls.columns.items():
+            np.save(os.path.join(tmp_dir, name + ".npy"), np.frombuffer(cols[name], dtype=dtype))
+        np.save(os.path.join(tmp_dir, "q_lens.npy"), np.frombuffer(q_lens, dtype=np.int64))
+        np.save(os.path.join(tmp_dir, "t_lens.npy"), np.frombuffer(t_lens, dtype=np.int64))
+        with open(os.path.join(tmp_dir, "names.json"), "w") as names_f:
+            json.dump({"query": list(q_ids), "target": list(t_ids)}, names_f)
+        # Written last: a store without meta file is never considered as valid
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as meta_f:
+            json.dump({"version": cls.version, "source": stamp, "nb_lines": len(cols["q_id"])}, meta_f)
+
+        cls.remove(paf)
+        try:
+            os.rename(tmp_dir, store.store_dir)
+        except OSError:
+            # Another process has built the store at the same time
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        store._load()
+        return store
+
+    @classmethod
+    def load(cls, paf: str, build: bool=True):
+        """
+        Load the store of a PAF file
+
+        :param paf: PAF file path
+        :type paf: str
+        :param build: if True, build the store if it does not exist or is outdated
+        :type build: bool
+        :return: the loaded store, or None if not available and build is False
+        :rtype: MatchStore
+        """
+        store = cls(paf)
+        if store.is_valid():
+            store._load()
+            return store
+        if build:
+            return cls.build(paf)
+        return None
+
+    def _load(self):
+        """
+        Memory-map columns of the store
+        """
+        with open(os.path.join(self.store_dir, "meta.json"), "r") as meta_f:
+            self.nb_lines = json.load(meta_f)["nb_lines"]
+        with open(os.path.join(self.store_dir, "names.json"), "r") as names_f:
+            names = json.load(names_f)
+        self.q_names = names["query"]
+        self.t_names = names["target"]
+        self.q_lens = np.load(os.path.join(self.store_dir, "q_lens.npy"))
+        self.t_lens = np.load(os.path.join(self.store_dir, "t_lens.npy"))
+        for name in self.columns:
+            self.data[name] = np.load(os.path.join(self.store_dir, name + ".npy"), mmap_mode="r")
+
+    @classmethod
+    def remove(cls, paf: str):
+        """
+        Remove the store of a PAF file, if exists
+
+        :param paf: PAF file path
+        :type paf: str
+        """
+        store_dir = paf + cls.suffix
+        if os.path.exists(store_dir):
+            shutil.rmtree(store_dir, ignore_errors=True)
@@ -4,25 +4,122 @@ from dgenies import MODE
 
 import os
 import shutil
-from math import sqrt
-from numpy import mean
+import numpy as np
 from pathlib import Path
 import json
 from dgenies.bin.index import Index
+from dgenies.lib.fasta_extractor import FastaExtractor
 from dgenies.config_reader import AppConfigReader
 from dgenies.lib.functions import Functions
-from intervaltree import IntervalTree
+from dgenies.lib.match_store import MatchStore
+from dgenies.lib.match_index import MatchIndex
 from xopen import xopen
 import traceback
-import matplotlib as mpl
-mpl.use('Agg')
-from matplotlib import pyplot as plt
-from Bio import SeqIO
-from Bio.Seq import Seq
-from Bio.SeqRecord import SeqRecord
+import threading
+from collections import OrderedDict
 from datetime import datetime
 
 
+class PafCache:
+    """
+    In-process LRU cache of parsed Paf objects, bounded by their estimated memory size
+    """
+
+    def __init__(self, max_size: int):
+        """
+
+        :param max_size: max total size of cached objects (bytes), 0 to disable the cache
+        :type max_size: int
+        """
+        self.max_size = max_size
+        self.entries = OrderedDict()  # key: (Paf object, estimated size)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get a cached Paf object
+
+        :param key: cache key
+        :type key: tuple
+        :return: the Paf object, or None if not in cache
+        :rtype: Paf
+        """
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            paf = self.entries[key][0]
+            # Size can grow after insertion (lines built at first access):
+            self._set_entry(key, paf)
+            return paf
+
+    def put(self, key, paf):
+        """
+        Add a parsed Paf object to the cache, and evict the least recently used ones if max size is exceeded
+
+        :param key: cache key
+        :type key: tuple
+        :param paf: parsed Paf object
+        :type paf: Paf
+        """
+        with self.lock:
+            self._set_entry(key, paf)
+
+    def _set_entry(self, key, paf):
+        """
+        Set (or refresh) an entry and its size, then evict entries while the cache is too large. Lock must be held.
+
+        :param key: cache key
+        :type key: tuple
+        :param paf: parsed Paf object
+        :type paf: Paf
+        """
+        if key in self.entries:
+            self.size -= self.entries[key][1]
+        size = paf.get_memory_size()
+        self.entries[key] = (paf, size)
+        self.size += size
+        while self.size > self.max_size and len(self.entries) > 0:
+            old_key, (old_paf, old_size) = self.entries.popitem(last=False)
+            self.size -= old_size
+            if old_key != key:
+                self.evictions += 1
+
+    def invalidate(self, id_job):
+        """
+        Remove all cached objects of a job
+
+        :param id_job: job id
+        :type id_job: str
+        """
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == id_job]:
+                self.size -= self.entries.pop(key)[1]
+
+    def get_stats(self):
+        """
+        Get cache counters
+
+        :return: hits, misses, evictions, number of entries, size and max size (bytes) of the cache
+        :rtype: dict
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "size": self.size,
+                "max_size": self.max_size
+            }
+
+
 class Paf:
     """
     Functions applied to PAF files
@@ -30,6 +127,8 @@ class Paf:
     config = AppConfigReader()
     limit_idy = [0.25, 0.5, 0.75]
     max_nb_lines = config.max_nb_lines
+    cache = PafCache(config.paf_cache_size)
+    line_size = 272  # Estimated memory size of a line of self.lines (list of 7 items)
 
     def __init__(self, paf: str, idx_q: str, idx_t: str, auto_parse: bool=True, mailer=None, id_job=None):
         """
@@ -53,7 +152,7 @@ class Paf:
         self.sorted = False
         self.data_dir = os.path.dirname(paf)
         if os.path.exists(os.path.join(self.data_dir, ".sorted")):
-            self.paf += ".sorted"
+            # Sort and orientation of query contigs are stored in the sorted query index only:
             self.idx_q += ".sorted"
             self.sorted = True
         self.sampled= False
@@ -61,7 +160,16 @@ class Paf:
         self.len_t = None
         self.min_idy = None
         self.max_idy = None
-        self.lines = {}
+        self.matches = {}
+        self._lines = None
+        self._store = None
+        self._index = None
+        self._q_starts = None
+        self._t_starts = None
+        self._q_flip = None
+        self.noise_limit = None
+        self.q_names = np.array([], dtype=object)
+        self.t_names = np.array([], dtype=object)
         self.q_contigs = {}
         self.q_order = []
         self.t_contigs = {}
@@ -79,6 +187,60 @@ class Paf:
         if auto_parse:
             self.parse_paf()
 
+    @classmethod
+    def load(cls, paf: str, idx_q: str, idx_t: str, id_job: str, merge_index: bool=True, noise: bool=True):
+        """
+        Get a parsed Paf object. The object is shared through the cache of the process, so it must not be modified.
+
+        :param paf: PAF file path
+        :type paf: str
+        :param idx_q: query index file path
+        :type idx_q: str
+        :param idx_t: target index file path
+        :type idx_t: str
+        :param id_job: job id
+        :type id_job: str
+        :param merge_index: if True, merge too small contigs in index
+        :type merge_index: bool
+        :param noise: if True, remove noise
+        :type noise: bool
+        :return: Paf object, parsed if no error occurred
+        :rtype: Paf
+        """
+        paf_o = cls(paf, idx_q, idx_t, auto_parse=False, id_job=id_job)
+        mtimes = []
+        for path in (paf_o.paf, paf_o.idx_q, paf_o.idx_t):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        key = (id_job, paf_o.paf, paf_o.idx_q, paf_o.idx_t, tuple(mtimes), noise, merge_index)
+        cached = cls.cache.get(key)
+        if cached is not None:
+            return cached
+        paf_o.parse_paf(merge_index=merge_index, noise=noise)
+        if paf_o.parsed:
+            cls.cache.put(key, paf_o)
+        return paf_o
+
+    def get_memory_size(self):
+        """
+        Estimate memory used by parsed data
+
+        :return: size in bytes
+        :rtype: int
+        """
+        size = sum(column.nbytes for matches in self.matches.values() for column in matches.values())
+        size += 8 * (len(self.q_names) + len(self.t_names))
+        size += 400 * (len(self.q_abs_start) + len(self.t_abs_start))  # Contigs dicts
+        if self._lines is not None:
+            size += self.line_size * sum(len(lines) for lines in self._lines.values())
+        if self._store is not None:
+            size += self._q_starts.nbytes + self._t_starts.nbytes + self._q_flip.nbytes
+        if self._index is not None:
+            size += self._index.get_memory_size()
+        return size
+
     @staticmethod
     def _flush_blocks(index_c, new_index_c, new_index_o, current_block):
         """
@@ -137,34 +299,80 @@ class Paf:
         return new_index_c, new_index_o
 
     @staticmethod
-    def remove_noise(lines, noise_limit):
+    def remove_noise(matches, len_m, noise_limit):
         """
         Remove noise from the dot plot
 
-        :param lines: lines of the dot plot, by class
-        :type lines: dict
+        :param matches: columns of the matches of the dot plot (x1, x2, y1, y2, idy, q_id, t_id)
+        :type matches: dict
+        :param len_m: length of each match
+        :type len_m: numpy.ndarray
         :param noise_limit: line length limit
         :type noise_limit: float
-        :return: kept lines, by class
+        :return: columns of kept matches, and their length
+        :rtype: (dict, numpy.ndarray)
+        """
+        keep = len_m >= noise_limit
+        return {name: column[keep] for name, column in matches.items()}, len_m[keep]
+
+    @staticmethod
+    def _contigs_abs_start(names, abs_start):
+        """
+        Get absolute start of contigs, in the order of the match store names table
+
+        :param names: contigs names
+        :type names: list
+        :param abs_start: absolute start position for each contig
+        :type abs_start: dict
+        :return: absolute start of each contig, -1 if contig is not in the index
+        :rtype: numpy.ndarray
+        """
+        return np.fromiter((abs_start.get(name, -1) for name in names), dtype=np.int64, count=len(names))
+
+    def _matches_columns(self, rows):
+        """
+        Get columns of matches with absolute coordinates, as drawn on the dot plot. Query contigs reversed in the query
+        index are flipped here: the PAF file is never rewritten.
+
+        :param rows: rows of matches to get in the match store (slice or array of indexes)
+        :type rows: slice|numpy.ndarray
+        :return: columns of matches: x1, x2, y1, y2, idy, q_id, t_id
         :rtype: dict
         """
-        keep_lines = {
-            "0": [],
-            "1": [],
-            "2": [],
-            "3": []
+        store = self._store
+        q_id = np.asarray(store["q_id"][rows])
+        t_id = np.asarray(store["t_id"][rows])
+        q_flip = self._q_flip[q_id]
+        q_len = store.q_lens[q_id]
+        q_start = store["q_start"][rows]
+        q_end = store["q_end"][rows]
+        forward = (store["strand"][rows] == 1) != q_flip
+        t_start = store["t_start"][rows]
+        t_end = store["t_end"][rows]
+        t_offset = self._t_starts[t_id]
+        q_offset = self._q_starts[q_id]
+        return {
+            "x1": np.where(forward, t_start, t_end) + t_offset,
+            "x2": np.where(forward, t_end, t_start) + t_offset,
+            "y1": np.where(q_flip, q_len - q_end, q_start) + q_offset,
+            "y2": np.where(q_flip, q_len - q_start, q_end) + q_offset,
+            "idy": store["matches"][rows] / store["block_len"][rows],
+            "q_id": q_id,
+            "t_id": t_id
         }
-        for cls, c_lines in lines.items():
-            for line in c_lines:
-                x1 = line[0]
-                x2 = line[1]
-                y1 = line[2]
-                y2 = line[3]
-                idy = line[4]
-                len_m = sqrt(pow(x2 - x1, 2) + pow(y2 - y1, 2))
-                if len_m >= noise_limit:
-                    keep_lines[cls].append(line)
-        return keep_lines
+
+    @staticmethod
+    def _matches_length(matches):
+        """
+        Get length of matches on the dot plot
+
+        :param matches: columns of matches
+        :type matches: dict
+        :return: length of each match
+        :rtype: numpy.ndarray
+        """
+        return np.sqrt(np.square((matches["x2"] - matches["x1"]).astype(float)) +
+                       np.square((matches["y2"] - matches["y1"]).astype(float)))
 
     def keyerror_message(self, exception, type_f):
         """
@@ -191,14 +399,6 @@ class Paf:
         :param noise: if True, remove noise
         :type noise: bool
         """
-        min_idy = 10000000000
-        max_idy = -10000000000
-        lines = {
-            "0": [],  # idy < 0.25
-            "1": [],  # idy < 0.5
-            "2": [],  # idy < 0.75
-            "3": []  # idy > 0.75
-        }
         try:
             name_q, q_order, q_contigs, q_reversed, q_abs_start, len_q = Index.load(self.idx_q)
             self.q_abs_start = q_abs_start
@@ -217,70 +417,63 @@ class Paf:
             self.error = "Index file does not exist for target!"
             return False
 
-        lines_lens = []
-
         try:
-            with open(self.paf, "r") as paf_file:
-                nb_lines = 0
-                for line in paf_file:
-                    nb_lines += 1
-                    if nb_lines > self.max_nb_lines:
-                        self.sampled = True
-                        break
-                    parts = line.strip("\n").split("\t")
-                    v1 = parts[0]
-                    v6 = parts[5]
-                    strand = 1 if parts[4] == "+" else -1
-                    idy = int(parts[9]) / int(parts[10])
-                    min_idy = min(min_idy, idy)
-                    max_idy = max(max_idy, idy)
-                    # x1, x2, y1, y2, idy
-                    try:
-                        y1 = int(parts[2]) + q_abs_start[v1]
-                        y2 = int(parts[3]) + q_abs_start[v1]
-                    except KeyError as e:
-                        self.error = self.keyerror_message(e, "query")
-                        return False
-                    try:
-                        x1 = int(parts[7 if strand == 1 else 8]) + t_abs_start[v6]
-                        x2 = int(parts[8 if strand == 1 else 7]) + t_abs_start[v6]
-                    except KeyError as e:
-                        self.error = self.keyerror_message(e, "target")
-                        return False
-                    len_m = sqrt(pow(x2 - x1, 2) + pow(y2 - y1, 2))
-                    lines_lens.append(len_m)
-                    if idy < self.limit_idy[0]:
-                        class_idy = "0"
-                    elif idy < self.limit_idy[1]:
-                        class_idy = "1"
-                    elif idy < self.limit_idy[2]:
-                        class_idy = "2"
-                    else:
-                        class_idy = "3"
-                    lines[class_idy].append([x1, x2, y1, y2, idy, v1, v6])
+            store = MatchStore.load(self.paf)
         except IOError:
             self.error = "PAF file does not exist!"
             return False
 
+        nb_matches = len(store)
+        nb_lines = nb_matches
+        if nb_matches > self.max_nb_lines:
+            self.sampled = True
+            nb_matches = self.max_nb_lines
+            nb_lines = nb_matches + 1  # Count the first ignored line, as done when parsing text
+
+        self._store = store
+        self._index = None
+        self._q_starts = self._contigs_abs_start(store.q_names, q_abs_start)
+        self._t_starts = self._contigs_abs_start(store.t_names, t_abs_start)
+        self._q_flip = np.fromiter((q_reversed.get(name, False) for name in store.q_names), dtype=bool,
+                                   count=len(store.q_names))
+        q_id = np.asarray(store["q_id"][:nb_matches])
+        t_id = np.asarray(store["t_id"][:nb_matches])
+        q_starts = self._q_starts[q_id]
+        t_starts = self._t_starts[t_id]
+
+        # Report the first line with a contig which is not in the index:
+        invalid_q = np.flatnonzero(q_starts < 0)
+        invalid_t = np.flatnonzero(t_starts < 0)
+        if len(invalid_q) > 0 and (len(invalid_t) == 0 or invalid_q[0] <= invalid_t[0]):
+            self.error = self.keyerror_message(KeyError(store.q_names[q_id[invalid_q[0]]]), "query")
+            return False
+        if len(invalid_t) > 0:
+            self.error = self.keyerror_message(KeyError(store.t_names[t_id[invalid_t[0]]]), "target")
+            return False
+
+        matches = self._matches_columns(slice(0, nb_matches))
+        len_m = self._matches_length(matches)
+        min_idy = float(matches["idy"].min()) if nb_matches > 0 else 10000000000
+        max_idy = float(matches["idy"].max()) if nb_matches > 0 else -10000000000
+
         if not noise and nb_lines > 1000:
-            counts, bins, bars = plt.hist(lines_lens, bins=nb_lines//10)
-            counts = list(counts)
-            max_value = max(counts)
-            max_index = counts.index(max_value)
-            limit_index = -1
-            for i in range(max_index, len(counts)):
-                if counts[i] < max_value / 50:
-                    limit_index = i
-                    break
-            if limit_index > -1:
-                lines = self.remove_noise(lines, bins[limit_index])
+            counts, bins = np.histogram(len_m, bins=nb_lines//10)
+            max_index = int(np.argmax(counts))
+            limit_index = np.flatnonzero(counts[max_index:] < counts[max_index] / 50)
+            if len(limit_index) > 0:
+                self.noise_limit = bins[max_index + limit_index[0]]
+                matches, len_m = self.remove_noise(matches, len_m, self.noise_limit)
+
+        self.matches = self._split_by_class(matches)
+        self._lines = None
+        self.q_names = np.array(store.q_names, dtype=object)
+        self.t_names = np.array(store.t_names, dtype=object)
 
         self.parsed = True
         self.len_q = len_q
         self.len_t = len_t
         self.min_idy = min_idy
         self.max_idy = max_idy
-        self.lines = lines
         self.q_contigs = q_contigs
         self.q_order = q_order
         self.q_reversed = q_reversed
@@ -289,6 +482,225 @@ class Paf:
         self.name_q = name_q
         self.name_t = name_t
 
+    @property
+    def lines(self):
+        """
+        Matches lines, by class of identity. Each line is a list: [x1, x2, y1, y2, idy, query contig, target contig].
+        Lines are built from parsed matches at first access.
+
+        :rtype: dict
+        """
+        if self._lines is None:
+            self._lines = self._build_lines(self.matches)
+        return self._lines
+
+    def _build_lines(self, matches_by_class):
+        """
+        Build lines from columns of matches
+
+        :param matches_by_class: columns of matches, by class of identity
+        :type matches_by_class: dict
+        :return: lines, by class of identity
+        :rtype: dict
+        """
+        lines = {}
+        for class_idy, matches in matches_by_class.items():
+            lines[class_idy] = list(map(list, zip(matches["x1"].tolist(), matches["x2"].tolist(),
+                                                  matches["y1"].tolist(), matches["y2"].tolist(),
+                                                  matches["idy"].tolist(),
+                                                  self.q_names[matches["q_id"]].tolist(),
+                                                  self.t_names[matches["t_id"]].tolist())))
+        return lines
+
+    def _get_index(self):
+        """
+        Get the spatial index of matches (the PAF file must be parsed)
+
+        :return: spatial index
+        :rtype: MatchIndex
+        """
+        if self._index is None:
+            self._index = MatchIndex.load(self._store)
+        return self._index
+
+    @staticmethod
+    def _contigs_in_window(starts, lens, w_start, w_end):
+        """
+        Get contigs which overlap a window of the dot plot, on one axis
+
+        :param starts: absolute start of each contig (-1 if not in the index)
+        :type starts: numpy.ndarray
+        :param lens: length of each contig
+        :type lens: numpy.ndarray
+        :param w_start: window start (absolute position)
+        :type w_start: int
+        :param w_end: window end (absolute position)
+        :type w_end: int
+        :return: for each contig, True if it overlaps the window
+        :rtype: numpy.ndarray
+        """
+        return (starts >= 0) & (starts <= w_end) & (starts + lens >= w_start)
+
+    def _split_by_class(self, matches):
+        """
+        Split columns of matches by class of identity
+
+        :param matches: columns of matches
+        :type matches: dict
+        :return: columns of matches, by class of identity
+        :rtype: dict
+        """
+        # "0": idy < 0.25, "1": idy < 0.5, "2": idy < 0.75, "3": idy >= 0.75
+        classes = np.digitize(matches["idy"], self.limit_idy)
+        matches_by_class = {}
+        for class_idy in range(len(self.limit_idy) + 1):
+            in_class = classes == class_idy
+            matches_by_class[str(class_idy)] = {name: column[in_class] for name, column in matches.items()}
+        return matches_by_class
+
+    def _get_rows_lines(self, rows, keep_filter=None, max_nb_lines=None):
+        """
+        Get lines of the given rows of the match store, the best ones first
+
+        :param rows: rows of matches in the store
+        :type rows: numpy.ndarray
+        :param keep_filter: function which takes columns of matches and returns a mask of matches to keep
+        :type keep_filter: function
+        :param max_nb_lines: max number of lines to return (None: no limit)
+        :type max_nb_lines: int
+        :return: lines (see lines property) by class of identity, and True if some lines were not returned
+        :rtype: (dict, bool)
+        """
+        rows = np.asarray(rows)
+        matches = self._matches_columns(rows)
+        if keep_filter is not None:
+            keep = keep_filter(matches)
+            rows = rows[keep]
+            matches = {name: column[keep] for name, column in matches.items()}
+
+        # Best matches first (the match store keeps the order of the PAF file, sorted by score):
+        order = np.argsort(rows, kind="stable")
+        sampled = max_nb_lines is not None and len(order) > max_nb_lines
+        if sampled:
+            order = order[:max_nb_lines]
+        matches = {name: column[order] for name, column in matches.items()}
+        return self._build_lines(self._split_by_class(matches)), sampled
+
+    def get_zone_data(self, x_min, x_max, y_min, y_max, nb_pixels):
+        """
+        Get best matches inside a window of the dot plot, to show details when the client zooms in.
+        All matches of the job are searched, not only the ones kept at parse. Matches shorter than half a pixel (for
+        the given drawing size) are ignored, and at most max_nb_lines matches are returned, the best ones first.
+
+        :param x_min: window start on target (absolute position)
+        :type x_min: int
+        :param x_max: window end on target (absolute position)
+        :type x_max: int
+        :param y_min: window start on query (absolute position)
+        :type y_min: int
+        :param y_max: window end on query (absolute position)
+        :type y_max: int
+        :param nb_pixels: size of the drawing area (pixels)
+        :type nb_pixels: int
+        :return: data for d3.js:
+
+            * lines: matches lines inside the window, by class of identity (dict)
+            * sampled: True if some matches of the window were not returned (bool)
+        :rtype: dict
+        """
+        store, index, q_starts, t_starts = self._store, self._get_index(), self._q_starts, self._t_starts
+        t_in = self._contigs_in_window(t_starts, store.t_lens, x_min, x_max)
+        q_in = self._contigs_in_window(q_starts, store.q_lens, y_min, y_max)
+        t_windows = {t: (x_min - t_starts[t], x_max - t_starts[t]) for t in np.flatnonzero(t_in).tolist()}
+        min_len = max(x_max - x_min, y_max - y_min) / max(nb_pixels, 1) / 2
+        if self.noise_limit is not None:
+            min_len = max(min_len, self.noise_limit)
+
+        def keep_filter(matches):
+            return (np.maximum(matches["x1"], matches["x2"]) >= x_min) & \
+                (np.minimum(matches["x1"], matches["x2"]) <= x_max) & \
+                (matches["y2"] >= y_min) & (matches["y1"] <= y_max) & \
+                (self._matches_length(matches) >= min_len)
+
+        lines, sampled = self._get_rows_lines(index.window(t_windows, q_in), keep_filter, self.max_nb_lines)
+        return {
+            "lines": lines,
+            "sampled": sampled
+        }
+
+    def get_matches_at(self, x, y, radius=0):
+        """
+        Get matches which pass near a point of the dot plot: the bounding box of the match must contain the point,
+        with a margin of radius on each side
+
+        :param x: position on target (absolute position)
+        :type x: int
+        :param y: position on query (absolute position)
+        :type y: int
+        :param radius: margin around the point (Bp)
+        :type radius: int
+        :return: lines (see lines property), the best ones first
+        :rtype: list
+        """
+        store, index, q_starts, t_starts = self._store, self._get_index(), self._q_starts, self._t_starts
+        rows = []
+        for t in np.flatnonzero(self._contigs_in_window(t_starts, store.t_lens, x - radius, x + radius)).tolist():
+            for q in np.flatnonzero(self._contigs_in_window(q_starts, store.q_lens, y - radius, y + radius)).tolist():
+                pair = index._find_pair(t, q)
+                if pair is not None:
+                    rows.append(index._pair_rows(pair, x - radius - t_starts[t], x + radius - t_starts[t]))
+        rows = np.concatenate(rows) if len(rows) > 0 else np.zeros(0, dtype=np.int64)
+
+        def keep_filter(matches):
+            return (np.maximum(matches["x1"], matches["x2"]) >= x - radius) & \
+                (np.minimum(matches["x1"], matches["x2"]) <= x + radius) & \
+                (matches["y2"] >= y - radius) & (matches["y1"] <= y + radius)
+
+        lines = self._get_rows_lines(rows, keep_filter)[0]
+        return sorted((line for class_lines in lines.values() for line in class_lines), key=lambda l: -l[4])
+
+    def get_contigs_pair_matches(self, query, target, nb_pixels=None):
+        """
+        Get matches between a query contig and a target contig, to show details when the client selects a zone.
+        If the size of the drawing area is given, matches are filtered as in :func:`get_zone_data`: matches shorter
+        than half a pixel (the zone being the contig pair) are ignored, and at most max_nb_lines matches are returned
+
+        :param query: query contig name
+        :type query: str
+        :param target: target contig name
+        :type target: str
+        :param nb_pixels: size of the drawing area (pixels), None to get all matches
+        :type nb_pixels: int
+        :return: data for d3.js:
+
+            * lines: matches lines between the contigs, by class of identity (dict)
+            * sampled: True if some matches of the contigs were not returned (bool)
+        :rtype: dict
+        """
+        store, index = self._store, self._get_index()
+        try:
+            t_id = store.t_names.index(target)
+            q_id = store.q_names.index(query)
+        except ValueError:  # No match for one of the contigs
+            return {"lines": self._get_rows_lines(np.zeros(0, dtype=np.int64))[0], "sampled": False}
+        rows = index.pair(t_id, q_id)
+        keep_filter = None
+        max_nb_lines = None
+        if nb_pixels is not None:
+            min_len = max(int(store.t_lens[t_id]), int(store.q_lens[q_id])) / max(nb_pixels, 1) / 2
+            if self.noise_limit is not None:
+                min_len = max(min_len, self.noise_limit)
+            max_nb_lines = self.max_nb_lines
+
+            def keep_filter(matches):
+                return self._matches_length(matches) >= min_len
+
+        lines, sampled = self._get_rows_lines(rows, keep_filter, max_nb_lines)
+        return {
+            "lines": lines,
+            "sampled": sampled
+        }
+
     def get_d3js_data(self):
         """
         Build data for D3.js client
@@ -309,12 +721,22 @@ class Paf:
             * limit_idy: limit for each class of identities (list)
         :rtype: dict
         """
+        data = self._get_d3js_metadata()
+        data["lines"] = self.lines
+        return data
+
+    def _get_d3js_metadata(self):
+        """
+        Build data for D3.js client, except lines
+
+        :return: data for d3.js (see :func:`get_d3js_data`)
+        :rtype: dict
+        """
         return {
             'y_len': self.len_q,
             'x_len': self.len_t,
             'min_idy': self.min_idy,
             'max_idy': self.max_idy,
-            'lines': self.lines,
             'y_contigs': self.q_contigs,
             'y_order': self.q_order,
             'x_contigs': self.t_contigs,
@@ -327,6 +749,44 @@ class Paf:
             "max_nb_lines": self.max_nb_lines,
         }
 
+    def get_d3js_binary_data(self):
+        """
+        Build data for D3.js client in a compact binary format. Lines are sent as columns instead of lists, and contigs
+        names are sent once, in tables referenced by ids.
+
+        Format (little-endian):
+
+            * magic bytes: ``DGB1``
+            * header length (uint32)
+            * header: data of :func:`get_d3js_data` without lines, as JSON, plus: success, q_names and t_names (contigs
+              names tables), classes (identity classes, in order of columns) and counts (number of lines of each
+              class). Padded with spaces to a multiple of 8 bytes
+            * for each class: x1, x2, y1, y2 and idy columns (float64), then q_id and t_id columns (int32). Columns
+              are always aligned on their item size
+
+        :return: binary data
+        :rtype: bytes
+        """
+        classes = sorted(self.matches.keys())
+        header = self._get_d3js_metadata()
+        header.update({
+            "success": True,
+            "q_names": self.q_names.tolist(),
+            "t_names": self.t_names.tolist(),
+            "classes": classes,
+            "counts": {class_idy: len(self.matches[class_idy]["idy"]) for class_idy in classes}
+        })
+        header = json.dumps(header).encode("utf-8")
+        header += b" " * (-len(header) % 8)
+        chunks = [b"DGB1", np.array([len(header)], dtype="<u4").tobytes(), header]
+        for class_idy in classes:
+            matches = self.matches[class_idy]
+            for name in ("x1", "x2", "y1", "y2", "idy"):
+                chunks.append(np.asarray(matches[name], dtype="<f8").tobytes())
+            for name in ("q_id", "t_id"):
+                chunks.append(np.asarray(matches[name], dtype="<i4").tobytes())
+        return b"".join(chunks)
+
     def save_json(self, out):
         """
         Save D3.js data to json
@@ -339,95 +799,91 @@ class Paf:
         with open(out, "w") as out_f:
             out_f.write(json.dumps(data))
 
-    def is_contig_well_oriented(self, lines, contig, chrom):
-        """
-        Returns True if the contig is well oriented. A well oriented contig
-        must have y increased when x increased. We check that only for highest matches
-        (small matches must be ignored)
-
-        :param lines: lines inside the contig
-        :type lines: list
-        :param contig: query contig name
-        :type contig: str
-        :param chrom: target chromosome name
-        :type chrom: str
-        :return: True if well oriented, False else
-        :rtype: bool
-        """
-        # recall: a line is a list of tuple where each tuple is such as:
-        #  0. median_on_query,
-        #  1. squared length,
-        #  2. median_on_target,
-        #  3. x1,
-        #  4. x2,
-        #  5. y1,
-        #  6. y2,
-        #  7. length
-        #  (x : on target, y: on query)
-        lines.sort(key=lambda x: -x[-1])
-        max_len = lines[0][-1]
-        i = 0
-
-        # Select samples of tested lines such that:
-        # - a selected line is at least 10% of the longest line
-        # - and a selected line is at least 1% of the length of contig or the length of chrom
-        while i < len(lines) and lines[i][-1] > max_len * 0.1 \
-                and lines[i][-1] >= 0.01 * min(self.q_contigs[contig], self.t_contigs[chrom]):
-            i += 1
-        selected_lines = lines[:i]
-
-        # Check orientation of each line:
-        if len(selected_lines) > 1:
-            selected_lines.sort(key=lambda x: x[0])  # sort lines by median_on_query position
-            orients = []
-            for i in range(1, len(selected_lines)):
-                # Check if two consecutive sorted lines has the same slope direction by using median_on_target position
-                if selected_lines[i][2] > selected_lines[i-1][2]:
-                    same_dir = 1
-                else:
-                    same_dir = -1
-                orients.append(same_dir)
-            if mean(orients) > -0.1:  # We have a good orientation (-0.1 to ignore ambiguous cases)
-                return True
-        elif len(selected_lines) == 1:
-            orient_first = "+" if selected_lines[0][3] < selected_lines[0][4] else "-"  # Get X orientation
-            if selected_lines[0][-2 if orient_first == "+" else -3] > \
-                    selected_lines[0][-3 if orient_first == "+" else -2]:  # Check Y according to X orientation
-                return True
-        elif len(selected_lines) == 0:  # None line were selected: we ignore this block
-            return True
-
-        # In all other cases the orientation is wrong:
-        return False
-
-    def reorient_contigs_in_paf(self, contigs):
-        """
-        Reorient contigs in the PAF file
-
-        :param contigs: contigs to be reoriented
-        """
-        sorted_file = self.paf + ".sorted"
-        contigs = set(contigs)
-        with open(self.paf, "r") as source, open(sorted_file, "w") as target:
+    def are_blocks_well_oriented(self, blocks, selected):
+        """
+        For each selected block, returns True if the contig is well oriented on the chromosome. A well oriented contig
+        must have y increased when x increased. We check that only for highest matches (small matches must be
+        ignored): the ones at least 10% of the longest match of the block, and at least 1% of the length of the contig
+        or of the chromosome.
+        Orientation is voted by consecutive matches (sorted by median on target), for all blocks at once.
+
+        :param blocks: blocks definitions, as returned by :func:`compute_gravity_contigs`
+        :type blocks: dict
+        :param selected: indexes of blocks to check
+        :type selected: numpy.ndarray
+        :return: for each selected block, True if well oriented, False else
+        :rtype: numpy.ndarray
+        """
+        nb_blocks = len(selected)
+        sizes = blocks["ends"][selected] - blocks["starts"][selected]
+        block_of = np.repeat(np.arange(nb_blocks), sizes)
+        positions = np.arange(len(block_of)) - np.repeat(np.cumsum(sizes) - sizes, sizes) + \
+            np.repeat(blocks["starts"][selected], sizes)
+        rows = blocks["order"][positions]
+
+        # Sort matches of each block by length (DESC), then select highest ones:
+        len_m = blocks["len"]
+        by_len = np.lexsort((rows, -len_m[rows], block_of))
+        rows = rows[by_len]
+        block_first = np.cumsum(sizes) - sizes
+        max_len = len_m[rows[block_first[sizes > 0]]]
+        q_sizes = np.fromiter((self.q_contigs.get(name, 0) for name in self.q_names), dtype=np.int64,
+                              count=len(self.q_names))
+        t_sizes = np.fromiter((self.t_contigs.get(name, 0) for name in self.t_names), dtype=np.int64,
+                              count=len(self.t_names))
+        min_len = 0.01 * np.minimum(q_sizes[blocks["q_id_b"][selected]], t_sizes[blocks["t_id_b"][selected]])
+        max_len_b = np.zeros(nb_blocks)
+        max_len_b[sizes > 0] = max_len
+        keep = (len_m[rows] > max_len_b[block_of] * 0.1) & (len_m[rows] >= min_len[block_of])
+        rows = rows[keep]
+        block_of = block_of[keep]
+        nb_selected = np.bincount(block_of, minlength=nb_blocks)
+
+        # Several lines: sort them by median on target, and check if consecutive lines have the same slope direction
+        # by using median on query:
+        by_med = np.lexsort((np.arange(len(rows)), blocks["med_x"][rows], block_of))
+        rows = rows[by_med]
+        block_of = block_of[by_med]
+        med_y = blocks["med_y"][rows]
+        same_block = block_of[1:] == block_of[:-1]
+        same_dir = np.where(med_y[1:] > med_y[:-1], 1, -1)
+        votes = np.bincount(block_of[1:][same_block], weights=same_dir[same_block], minlength=nb_blocks)
+        well_oriented = votes / np.maximum(nb_selected - 1, 1) > -0.1  # -0.1 to ignore ambiguous cases
+
+        # Only one line: check Y according to X orientation:
+        single = np.flatnonzero(nb_selected == 1)
+        single_rows = rows[np.searchsorted(block_of, single)]
+        x1, x2, y1, y2 = (blocks[name][single_rows] for name in ("x1", "x2", "y1", "y2"))
+        well_oriented[single] = np.where(x1 < x2, y2 > y1, y1 > y2)
+
+        # None line were selected: we ignore this block
+        well_oriented[nb_selected == 0] = True
+        return well_oriented
+
+    @staticmethod
+    def iter_oriented_paf(paf, idx_q):
+        """
+        Iterate over lines of a PAF file, with query contigs oriented as defined in a query index
+
+        :param paf: PAF file path
+        :type paf: str
+        :param idx_q: query index file path
+        :type idx_q: str
+        :return: PAF lines
+        :rtype: generator
+        """
+        reversed_c = {contig for contig, is_reversed in Index.load(idx_q)[3].items() if is_reversed}
+        with open(paf, "r") as source:
             for line in source:
                 parts = line.strip("\n").split("\t")
-                if parts[0] in contigs:
+                if parts[0] in reversed_c:
                     len_q = int(parts[1])
                     x1_q = int(parts[2])
                     x2_q = int(parts[3])
-                    if parts[4] == "-":
-                        parts[4] = "+"
-                    else:
-                        parts[4] = "-"
+                    parts[4] = "+" if parts[4] == "-" else "-"
                     parts[2] = str(len_q - x2_q)
                     parts[3] = str(len_q - x1_q)
-                target.write("\t".join(parts) + "\n")
-        if self.paf.endswith(".sorted"):
-            os.remove(self.paf)
-            shutil.move(sorted_file, self.paf)
-        else:
-            self.paf = sorted_file
-        return True
+                yield "\t".join(parts) + "\n"
 
     def _update_query_index(self, contigs_reoriented):
         """
@@ -463,114 +919,97 @@ class Paf:
     def compute_gravity_contigs(self):
         """
         Compute gravity for each contig on each chromosome (how many big matches they have).
-        Will be used to find which chromosome has the highest value for each contig
+        Will be used to find which chromosome has the highest value for each contig.
+        Matches are grouped by block (query contig, target chromosome), and blocks values are computed with numpy.
 
         Note: based on keywords and formulae, Floréal seems to have taken the gravity concept from Gravitational Search Algorithm (GSA)
             https://pg.edu.pl/files/eti/2021-06/TS_lecture4.pdf
         This hypothesis needs to be checked.
 
-        :return:
-            * [0] gravity for each contig and each chromosome:
-                {contig1: {chr1: value, chr2: value, ...}, contig2: ...}
-            * [1] For each block save lines inside:
-                [median_on_query, squared length, median_on_target, x1, x2, y1, y2, length] (x : on target, y: on query)
-        """
-        gravity_contig = {}
-        lines_on_block = {}
-        # Compute size of blocks (in term of how many big match they have), and save median of each match on each one
-        # (for next step)
-        for line in [j for i in list(self.lines.values()) for j in i]:
-            x1 = int(line[0])
-            x2 = int(line[1])
-            y1 = int(line[2])
-            y2 = int(line[3])
-            contig = line[5]
-            chrm = line[6]
-            block = (contig, chrm)
-            # X1 and X2 (in good orientation):
-            x_1 = min(x1, x2)
-            x_2 = max(x2, x1)
-            med_q = x_1 + (abs(x_2 - x_1) / 2)
-            # Y1 and Y2 (in good orientation):
-            y_1 = min(y1, y2)
-            y_2 = max(y2, y1)
-            med_t = y_1 + (abs(y_2 - y_1) / 2)
-            len_m = sqrt(pow(x2 - x1, 2) + pow(y2 - y1, 2))  # Len
-            len_m_2 = pow(1 + len_m, 2) # Pow of len
-            if block not in lines_on_block:
-                lines_on_block[block] = []
-            lines_on_block[block].append((med_q, len_m_2, med_t, x1, x2, y1, y2, len_m))
-
-            if contig not in gravity_contig:
-                gravity_contig[contig] = {}
-            if chrm not in gravity_contig[contig]:
-                gravity_contig[contig][chrm] = 0
-            gravity_contig[contig][chrm] += len_m_2
-        return gravity_contig, lines_on_block
+        :return: matches and blocks definitions (numpy arrays):
+            * x1, x2, y1, y2, q_id, t_id: matches columns, in order of lines (x : on target, y: on query)
+            * len: length of each match
+            * weight: squared (1 + length) of each match
+            * med_x, med_y: median of each match on target and on query
+            * order: matches sorted by block (keeping the order of lines inside a block)
+            * starts, ends: start and end (excluded) of each block in order
+            * q_id_b, t_id_b: query contig and target chromosome of each block
+            * gravity: gravity of each block
+            * center: median on target of the block matches, weighted by matches weight
+            * best: best block (highest gravity, first seen block on ties) of each contig having matches, in order
+              of first match of contigs
+        :rtype: dict
+        """
+        matches = {name: np.concatenate([class_m[name] for class_m in self.matches.values()])
+                   for name in ("x1", "x2", "y1", "y2", "q_id", "t_id")} if len(self.matches) > 0 else \
+            {name: np.zeros(0, dtype=np.int64) for name in ("x1", "x2", "y1", "y2", "q_id", "t_id")}
+        blocks = dict(matches)
+        blocks["len"] = self._matches_length(matches)
+        blocks["weight"] = np.square(1 + blocks["len"])
+        blocks["med_x"] = np.minimum(matches["x1"], matches["x2"]) + np.abs(matches["x2"] - matches["x1"]) / 2
+        blocks["med_y"] = np.minimum(matches["y1"], matches["y2"]) + np.abs(matches["y2"] - matches["y1"]) / 2
+
+        keys = matches["q_id"].astype(np.int64) * max(len(self.t_names), 1) + matches["t_id"]
+        order = np.argsort(keys, kind="stable")
+        starts = np.flatnonzero(np.diff(keys[order])) + 1
+        if len(order) > 0:
+            starts = np.concatenate(([0], starts))
+        blocks["order"] = order
+        blocks["starts"] = starts
+        blocks["ends"] = np.concatenate((starts[1:], [len(order)])).astype(np.int64)
+        blocks["q_id_b"] = matches["q_id"][order[starts]]
+        blocks["t_id_b"] = matches["t_id"][order[starts]]
+        if len(order) > 0:
+            blocks["gravity"] = np.add.reduceat(blocks["weight"][order], starts)
+            blocks["center"] = np.add.reduceat((blocks["med_x"] * blocks["weight"])[order], starts) / \
+                blocks["gravity"]
+        else:
+            blocks["gravity"] = blocks["center"] = np.zeros(0)
+
+        # Best block of each contig:
+        by_contig = np.lexsort((order[starts], -blocks["gravity"], blocks["q_id_b"]))
+        first_of_contig = np.ones(len(by_contig), dtype=bool)
+        first_of_contig[1:] = blocks["q_id_b"][by_contig][1:] != blocks["q_id_b"][by_contig][:-1]
+        best = by_contig[first_of_contig]
+        first_row = np.full(len(self.q_names), len(order))
+        np.minimum.at(first_row, blocks["q_id_b"], order[starts])
+        blocks["best"] = best[np.argsort(first_row[blocks["q_id_b"][best]], kind="stable")]
+        return blocks
 
     def sort(self):
         """
-        Sort contigs according to reference target and reorient them if needed
+        Sort contigs according to reference target and reorient them if needed.
+        Only the query index is written (query.idx.sorted): orientation of contigs is applied when matches are read.
         """
-        self.parse_paf(False)
-        sorted_file = self.paf + ".sorted"
         if not self.sorted:  # Do the sort
-            if not self.paf.endswith(".sorted") and not self.idx_q.endswith(".sorted") and \
-                    (not os.path.exists(self.paf + ".sorted") or not os.path.exists(self.idx_q + ".sorted")):
-                gravity_contig , lines_on_block = self.compute_gravity_contigs()
-
-                # For each contig, find best block, and deduce gravity of contig:
-                gravity_on_contig = {}
-                reorient_contigs = []
-                for contig, chr_blocks in gravity_contig.items():
-                    # Find best block:
-                    max_number = 0
-                    max_chr = None
-                    for chrm, size in chr_blocks.items():
-                        if size > max_number:
-                            max_number = size
-                            max_chr = chrm
-
-                    # Compute gravity of contig:
-                    nb_items = 0
-                    sum_items = 0
-                    lines_on_selected_block = lines_on_block[(contig, max_chr)]
-                    for med in lines_on_selected_block:
-                        sum_items += med[0] * med[1]
-                        nb_items += med[1]
-                    gravity_on_contig[contig] = sum_items / nb_items
-
-                    # Check if contig must be re-oriented:
-                    if len(lines_on_selected_block) > 0:
-                        if not self.is_contig_well_oriented(lines_on_selected_block, contig, max_chr):
-                            reorient_contigs.append(contig)
+            if not os.path.exists(self.idx_q + ".sorted"):
+                self.parse_paf(False)
+                blocks = self.compute_gravity_contigs()
+                best = blocks["best"]
+
+                # Gravity of contig is the one of its best block:
+                contigs = self.q_names[blocks["q_id_b"][best]]
+                gravity_on_contig = dict(zip(contigs.tolist(), blocks["center"][best].tolist()))
+
+                # Check if contigs must be re-oriented:
+                reorient_contigs = contigs[~self.are_blocks_well_oriented(blocks, best)].tolist()
 
                 # Sort contigs:
                 self.q_order.sort(key=lambda x: gravity_on_contig[x] if x in gravity_on_contig else self.len_q + 1000)
 
+                # Write sorted index, with re-oriented contigs:
                 self.idx_q += ".sorted"
-
-                with open(self.idx_q, "w") as idx_q_f:
-                    idx_q_f.write(self.name_q + "\n")
-                    for contig in self.q_order:
-                        idx_q_f.write("\t".join([contig, str(self.q_contigs[contig])]) + "\n")
-
-                # Re-orient contigs:
-                if len(reorient_contigs) > 0:
-                    self.reorient_contigs_in_paf(reorient_contigs)
-                else:
-                    shutil.copyfile(self.paf, sorted_file)
-
-                # Update index:
                 self._update_query_index(reorient_contigs)
 
+                # Save association of queries on targets, used to build the query as reference:
+                self._save_query_on_target_association(
+                    dict(zip(contigs.tolist(), self.t_names[blocks["t_id_b"][best]].tolist())))
+
             else:
                 self.idx_q += ".sorted"
             self.set_sorted(True)
-            self.paf = sorted_file
 
         else:  # Undo the sort
-            self.paf = self.paf.replace(".sorted", "")
             self.idx_q = self.idx_q.replace(".sorted", "")
             self.set_sorted(False)
 
@@ -580,17 +1019,23 @@ class Paf:
 
     def reverse_contig(self, contig_name):
         """
-        Reverse contig
+        Reverse contig. Only the query index is rewritten.
 
         :param contig_name: contig name
         :type contig_name: str
         """
-        self.parse_paf(False)
-        reorient_contigs = [contig_name]
-        self.reorient_contigs_in_paf(reorient_contigs)
+        try:
+            self.name_q, self.q_order, self.q_contigs, self.q_reversed, self.q_abs_start, self.len_q = \
+                Index.load(self.idx_q)
+        except IOError:
+            self.error = "Index file does not exist for query!"
+            return False
+        if contig_name not in self.q_contigs:
+            self.error = self.keyerror_message(KeyError(contig_name), "query")
+            return False
         if not self.idx_q.endswith(".sorted"):
             self.idx_q += ".sorted"
-        self._update_query_index(reorient_contigs)
+        self._update_query_index([contig_name])
         self.set_sorted(True)
         self.parsed = False
         self.parse_paf()
@@ -602,43 +1047,32 @@ class Paf:
         :return: query on target association
         :rtype: dict
         """
-        gravity_contig, lines_on_block = self.compute_gravity_contigs()
-        query_on_target = {}
-        for contig, chr_blocks in gravity_contig.items():
-            # Find best block:
-            max_number = 0
-            max_chr = None
-            min_target = -1
-            max_target = -1
-            min_query = -1
-            max_query = -1
-            for chrm, size in chr_blocks.items():
-                if size > max_number:
-                    max_number = size
-                    max_chr = chrm
-                    min_target = -1
-                    max_target = -1
-                    min_query = -1
-                    max_query = -1
-                    if with_coords:
-                        for line in lines_on_block[(contig, chrm)]:
-                            x1 = min(line[3], line[4]) - self.t_abs_start[chrm]
-                            x2 = max(line[3], line[4]) - self.t_abs_start[chrm]
-                            if x1 < min_target or min_target == -1:
-                                min_target = x1
-                            if x2 > max_target:
-                                max_target = x2
-                            y1 = min(line[5], line[6]) - self.q_abs_start[contig]
-                            y2 = max(line[5], line[6]) - self.q_abs_start[contig]
-                            if y1 < min_query or min_query == -1:
-                                min_query = y1
-                            if y2 > max_query:
-                                max_query = y2
-            if max_chr is not None:
-                query_on_target[contig] = (max_chr, min_query, max_query, min_target, max_target)
-            else:
-                query_on_target[contig] = None
-        return query_on_target
+        blocks = self.compute_gravity_contigs()
+        best = blocks["best"]
+        contigs = self.q_names[blocks["q_id_b"][best]].tolist()
+        chroms = self.t_names[blocks["t_id_b"][best]].tolist()
+        if with_coords and len(best) > 0:
+            order = blocks["order"]
+            starts = blocks["starts"][best]
+            ends = blocks["ends"][best]
+            # Matches of best blocks, grouped by block:
+            sizes = ends - starts
+            positions = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes) + np.repeat(starts, sizes)
+            rows = order[positions]
+            b_starts = np.cumsum(sizes) - sizes
+            t_offset = self._contigs_abs_start(chroms, self.t_abs_start)
+            q_offset = self._contigs_abs_start(contigs, self.q_abs_start)
+            x_lo = np.minimum(blocks["x1"], blocks["x2"])[rows]
+            x_hi = np.maximum(blocks["x1"], blocks["x2"])[rows]
+            y_lo = np.minimum(blocks["y1"], blocks["y2"])[rows]
+            y_hi = np.maximum(blocks["y1"], blocks["y2"])[rows]
+            min_target = (np.minimum.reduceat(x_lo, b_starts) - t_offset).tolist()
+            max_target = (np.maximum.reduceat(x_hi, b_starts) - t_offset).tolist()
+            min_query = (np.minimum.reduceat(y_lo, b_starts) - q_offset).tolist()
+            max_query = (np.maximum.reduceat(y_hi, b_starts) - q_offset).tolist()
+            return {contig: (chrom, min_q, max_q, min_t, max_t) for contig, chrom, min_q, max_q, min_t, max_t in
+                    zip(contigs, chroms, min_query, max_query, min_target, max_target)}
+        return {contig: (chrom, -1, -1, -1, -1) for contig, chrom in zip(contigs, chroms)}
 
     def get_queries_on_target_association(self):
         """
@@ -647,20 +1081,52 @@ class Paf:
         :return: list of queries associated to each target
         :rtype: dict
         """
-        gravity_contig = self.compute_gravity_contigs()[0]
+        blocks = self.compute_gravity_contigs()
+        best = blocks["best"]
         queries_on_target = {}
-        for contig, chr_blocks in gravity_contig.items():
-            # Find best block:
-            max_number = 0
-            max_chr = None
-            for chrm, size in chr_blocks.items():
-                if size > max_number:
-                    max_number = size
-                    max_chr = chrm
-            if max_chr is not None:
-                if max_chr not in queries_on_target:
-                    queries_on_target[max_chr] = []
-                queries_on_target[max_chr].append(contig)
+        for contig, chrom in zip(self.q_names[blocks["q_id_b"][best]].tolist(),
+                                 self.t_names[blocks["t_id_b"][best]].tolist()):
+            if chrom not in queries_on_target:
+                queries_on_target[chrom] = []
+            queries_on_target[chrom].append(contig)
+        return queries_on_target
+
+    def _save_query_on_target_association(self, query_on_target):
+        """
+        Save the target associated to each query (map.paf.assoc), in order of queries. The file is written with a
+        temporary name, then moved in place.
+
+        :param query_on_target: target associated to each query
+        :type query_on_target: dict
+        """
+        assoc_file = self.paf + ".assoc"
+        tmp_file = assoc_file + ".tmp.%d.%d" % (os.getpid(), threading.get_ident())
+        with open(tmp_file, "w") as assoc:
+            for contig in self.q_order:
+                if contig in query_on_target:
+                    assoc.write("%s\t%s\n" % (contig, query_on_target[contig]))
+        os.replace(tmp_file, assoc_file)
+
+    def load_queries_on_target_association(self):
+        """
+        Load the list of queries associated to each target, as saved when contigs were sorted
+
+        :return: list of queries associated to each target, or None if the association was not saved or is outdated
+        :rtype: dict|None
+        """
+        assoc_file = self.paf + ".assoc"
+        queries_on_target = {}
+        try:
+            if os.path.getmtime(assoc_file) < os.path.getmtime(self.paf):
+                return None
+            with open(assoc_file, "r") as assoc:
+                for line in assoc:
+                    query, target = line.rstrip("\n").split("\t")
+                    if target not in queries_on_target:
+                        queries_on_target[target] = []
+                    queries_on_target[target].append(query)
+        except (IOError, ValueError):
+            return None
         return queries_on_target
 
     def build_query_on_target_association_file(self):
@@ -707,202 +1173,97 @@ class Paf:
         """
         index = self.idx_q if to == "query" else self.idx_t
         name, contigs_list, contigs, reversed, abs_start, c_len = Index.load(index)
-        contigs_list = set(contigs_list)
-        with open(self.paf, "r") as paf:
-            for line in paf:
-                c_name = line.strip("\n").split("\t")[0 if to == "query" else 5]
-                if c_name in contigs_list:
-                    contigs_list.remove(c_name)
+        store = MatchStore.load(self.paf)
+        contigs_list = set(contigs_list).difference(store.q_names if to == "query" else store.t_names)
         return "\n".join(contigs_list) + "\n"
 
-    def _add_percents(self, percents, item):
+    @staticmethod
+    def get_identity_coverage(starts, ends, categories, nb_categories):
         """
-        Update percents with interval
-
-        :param percents: initial percents
-        :type percents: dict
-        :param item: interval from IntervalTree
-        :type item: Interval
-        :return: new percents
-        :rtype: dict
+        Get the length covered by each identity category on an axis. When intervals of distinct categories overlap,
+        the overlapping part is counted for the best (highest) category only.
+
+        For each category, the union of the intervals of this category or a better one is computed with a sweep over
+        intervals sorted by start: O(n log n).
+
+        :param starts: start of each interval (included)
+        :type starts: numpy.ndarray
+        :param ends: end of each interval (excluded)
+        :type ends: numpy.ndarray
+        :param categories: identity category of each interval (0 to nb_categories - 1)
+        :type categories: numpy.ndarray
+        :param nb_categories: number of categories
+        :type nb_categories: int
+        :return: length covered by each category
+        :rtype: numpy.ndarray
         """
-        i_count = item.length()
-        percents[str(item.data)] += i_count
-        percents["-1"] -= i_count
-        return percents
-
-    def _remove_overlaps(self, position_idy, percents):
+        order = np.argsort(starts, kind="stable")
+        starts = starts[order]
+        ends = ends[order]
+        categories = categories[order]
+        union_len = np.zeros(nb_categories + 1, dtype=np.int64)
+        for cat in range(nb_categories):
+            in_union = categories >= cat
+            c_starts = starts[in_union]
+            c_ends = ends[in_union]
+            if len(c_starts) == 0:
+                continue
+            # End of covered region before each interval:
+            covered_end = np.maximum.accumulate(c_ends)
+            covered_end = np.concatenate(([c_starts[0]], covered_end[:-1]))
+            union_len[cat] = np.maximum(c_ends - np.maximum(c_starts, covered_end), 0).sum()
+        return union_len[:-1] - union_len[1:]
+
+    def get_identity_percents(self, axis="target"):
         """
-        Remove overlaps between matches on the diagonal.
-        In position_idy:
-        - When intervals from same identity category overlap, they are merged
-        - When intervals from distinct identity categories overlap, the overlapping parts are removed from the
-          intervals of lower identity categories (some intervals can be split in many intervals)
+        Get percent of an axis covered by each identity category (PAF file must be parsed)
 
-        :param position_idy: matches intervals with associated identity category
-        :type position_idy: IntervalTree
-        :param percents: Percent of matches for each identity category
-        :type percents: dict
-        :return: new percents (updated after overlap removing)
+        :param axis: axis to cover: target or query
+        :type axis: str
+        :return: percent for each category ("-1": not covered)
         :rtype: dict
         """
-        while len(position_idy) > 0:
-            item = position_idy.pop()
-            start = item.begin
-            end = item.end
-            cat = item.data
-            # We get overlap with current interval
-            overlaps = position_idy.overlap(start, end)
-            if len(overlaps) > 0:
-                has_overlap = False
-                for overlap in overlaps:
-                    if has_overlap:
-                        break
-                    o_start = overlap.begin
-                    o_end = overlap.end
-                    o_cat = overlap.data
-                    if not position_idy.containsi(o_start, o_end, o_cat):
-                        continue
-                    if start < o_start:
-                        if end <= o_end:
-                            # cccccccccccccc*******
-                            # *****ooooooooo[ooooooo]
-                            if o_cat < cat:
-                                # The current interval category is the best
-                                if end < o_end:
-                                    # No overlap with the current item, we stay has_overlap as False
-                                    position_idy.discard(overlap)
-                                    position_idy[end:o_end] = o_cat
-                                else:
-                                    position_idy.discard(overlap)  # No kept overlap
-                            elif o_cat == cat:
-                                # Same category, we merge intervals
-                                if end < o_end:
-                                    has_overlap = True
-                                    position_idy.discard(overlap)
-                                    position_idy[start:o_end] = cat
-                                else:
-                                    position_idy.discard(overlap)  # No kept overlap
-                            else:
-                                # The overlap part is set to best category
-                                has_overlap = True
-                                position_idy.discard(overlap)
-                                position_idy[start:o_start] = cat
-                                position_idy[o_start:o_end] = o_cat
-                        else:  # end > o_end
-                            # ccccccccccccccccccc
-                            # *****oooooooooo****
-                            if o_cat <= cat:
-                                position_idy.discard(overlap)  # No kept overlap
-                            else:  # o_cat > cat
-                                has_overlap = True
-                                position_idy.discard(overlap)
-                                position_idy[start:o_start] = cat
-                                position_idy[o_start:o_end] = o_cat
-                                position_idy[o_end:end] = cat
-                    elif start == o_start:
-                        if end < o_end:
-                            # cccccccccccc*******
-                            # ooooooooooooooooooo
-                            if o_cat < cat:
-                                # No overlap with the current item, we stay has_overlap as False
-                                position_idy.discard(overlap)
-                                position_idy[end:o_end] = o_cat
-                            elif o_cat == cat:
-                                has_overlap = True
-                                position_idy.discard(overlap)
-                                position_idy[start:o_end] = cat
-                            else:  # o_cat > cat
-                                # The overlap just contains current item
-                                has_overlap = True
-                        elif end == o_end:
-                            # ***cccccccccccccccc***
-                            # ***oooooooooooooooo***
-                            if o_cat <= cat:
-                                position_idy.discard(overlap)  # No kept overlap
-                            else:
-                                # The overlap just contains current item
-                                has_overlap = True
-                        else:  # end > o_end
-                            # ccccccccccccccccccccccccccccc
-                            # oooooooooooooooooooo*********
-                            if o_cat <= cat:
-                                # current item just contains the overlap
-                                position_idy.discard(overlap)
-                            else:
-                                has_overlap = True
-                                position_idy.discard(overlap)
-                                position_idy[o_start:o_end] = o_cat
-                                position_idy[o_end:end] = cat
-                    else:  # start > o_start
-                        if end <= o_end:
-                            # ******ccccccccc*******
-                            # ooooooooooooooo[ooooooo]
-                            if o_cat < cat:
-                                has_overlap = True
-                                position_idy.discard(overlap)
-                                position_idy[o_start:start] = o_cat
-                                position_idy[start:end] = cat
-                                if end < o_end:
-                                    position_idy[end:o_end] = o_cat
-                            else:  # o_cat >= cat
-                                # Overlap just contains the item
-                                has_overlap = True
-                        else: # end > o_end
-                            # ******ccccccccccccccccccccc
-                            # ooooooooooooooooo**********
-                            if o_cat < cat:
-                                has_overlap = True
-                                position_idy.discard(overlap)
-                                position_idy[o_start:start] = o_cat
-                                position_idy[start:end] = cat
-                            elif o_cat == cat:
-                                has_overlap = True
-                                position_idy.discard(overlap)
-                                position_idy[o_start:end] = cat
-                            else:  # o_cat > cat
-                                has_overlap = True
-                                position_idy[o_end:end] = cat
-                if not has_overlap:
-                    percents = self._add_percents(percents, item)
-
-            else:
-                percents = self._add_percents(percents, item)
-
+        c1, c2, total_len = ("x1", "x2", self.len_t) if axis == "target" else ("y1", "y2", self.len_q)
+        cats = sorted(self.matches.keys())
+        starts = np.concatenate([np.minimum(self.matches[cat][c1], self.matches[cat][c2]) for cat in cats])
+        ends = np.concatenate([np.maximum(self.matches[cat][c1], self.matches[cat][c2]) + 1 for cat in cats])
+        categories = np.concatenate([np.full(len(self.matches[cat][c1]), int(cat)) for cat in cats])
+        coverage = self.get_identity_coverage(starts, ends, categories, len(cats))
+
+        percents = {"-1": total_len - int(coverage.sum())}
+        for cat, length in zip(cats, coverage.tolist()):
+            percents[cat] = length
+
+        for cat in percents:
+            percents[cat] = percents[cat] / total_len * 100
         return percents
 
     def build_summary_stats(self, status_file):
         """
-        Get summary of identity
+        Get summary of identity. The status file may already have been removed, if the summary was built at the same
+        time by another thread
 
+        :param status_file: file existing while the summary is built
+        :type status_file: str
         :return: table with percents by category
         """
         summary_file = self.paf + ".summary"
         self.parse_paf(False, False)
         if self.parsed:
-            percents = {"-1": self.len_t}
-            position_idy = IntervalTree()
-
-            cats = sorted(self.lines.keys())
-
-            for cat in cats:
-                percents[cat] = 0
-                for line in self.lines[cat]:
-                    start = min(line[0], line[1])
-                    end = max(line[0], line[1]) + 1
-                    position_idy[start:end] = int(cat)
-
-            percents = self._remove_overlaps(position_idy, percents)
-
-            for cat in percents:
-                percents[cat] = percents[cat] / self.len_t * 100
+            percents = self.get_identity_percents("target")
 
             with open(summary_file, "w") as summary_file:
                 summary_file.write(json.dumps(percents))
 
-            os.remove(status_file)
+            try:
+                os.remove(status_file)
+            except FileNotFoundError:
+                pass
             return percents
-        shutil.move(status_file, status_file + ".fail")
+        try:
+            shutil.move(status_file, status_file + ".fail")
+        except FileNotFoundError:
+            pass
         return None
 
     def get_summary_stats(self):
@@ -940,36 +1301,32 @@ class Paf:
             if o_fasta.endswith(".gz"):
                 o_fasta = o_fasta[:-3]
             if (not compress and not os.path.exists(o_fasta)) or (compress and not os.path.exists(o_fasta + ".gz")):
-                uncompressed_query = False
-                if query_fasta.endswith(".gz"):
-                    uncompressed_query = True
-                    query_fasta = Functions.uncompress(query_fasta)
-                query_f = SeqIO.index(query_fasta, "fasta")
-                contigs_assoc = self.get_queries_on_target_association()
+                contigs_assoc = self.load_queries_on_target_association()
+                if contigs_assoc is None:
+                    if not self.parsed:
+                        self.parse_paf(False)
+                        if not self.parsed:
+                            raise Exception(self.error)
+                    contigs_assoc = self.get_queries_on_target_association()
+                    self._save_query_on_target_association({query: target for target, queries in
+                                                            contigs_assoc.items() for query in queries})
+                elif not self.parsed:
+                    # Only the order and orientation of contigs are required:
+                    self.name_q, self.q_order, self.q_contigs, self.q_reversed, self.q_abs_start, self.len_q = \
+                        Index.load(self.idx_q)
+                    self.t_order = Index.load(self.idx_t)[1]
+                q_positions = {contig: position for position, contig in enumerate(self.q_order)}
                 mapped_queries = set()
-                with open(o_fasta, "w") as out:
+                with FastaExtractor(query_fasta) as query_f, open(o_fasta, "wb") as out:
                     for target in self.t_order:
                         if target in contigs_assoc:
-                            queries = sorted(contigs_assoc[target], key=lambda x: self.q_order.index(x))
-                            seq = SeqRecord(Seq(""))
-                            for query in queries:
-                                mapped_queries.add(query)
-                                new_seq = query_f[query]
-                                if self.q_reversed[query]:
-                                    new_seq = new_seq.reverse_complement()
-                                seq += new_seq
-                                seq += 100 * "N"
-                            seq = seq[:-100]
-                            seq.id = seq.name = seq.description = target
-                            SeqIO.write(seq, out, "fasta")
+                            queries = sorted(contigs_assoc[target], key=q_positions.get)
+                            mapped_queries.update(queries)
+                            query_f.write(out, target, [(query, self.q_reversed[query]) for query in queries],
+                                          spacer=100 * b"N")
                     for contig in self.q_order:
                         if contig not in mapped_queries:
-                            seq = query_f[contig]
-                            seq.id += "_unaligned"
-                            SeqIO.write(seq, out, "fasta")
-                query_f.close()
-                if uncompressed_query:
-                    os.remove(query_fasta)
+                            query_f.write(out, contig + "_unaligned " + query_f.header(contig), [(contig, False)])
             if compress and not os.path.exists(o_fasta + ".gz"):
                 o_fasta = Functions.compress(o_fasta, overwrite=True, remove=True)
             status = "success"
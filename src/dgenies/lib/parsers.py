@@ -6,15 +6,25 @@ Each parser (main function) must have 2 and only 2 arguments:
 - Second argument: finale PAF file
 
 Returns True if parse succeed, else False
+
+A parser which converts lines one by one can also define a "<parser>_lines" function, taking an iterable of lines
+(bytes) and returning a generator of PAF lines: it is then applied while the PAF file is sorted, without writing
+intermediate file (see :class:`dgenies.bin.sort_paf.Sorter`).
 """
 
 import traceback
-from Bio import AlignIO
+import numpy as np
+
+# Max size of alignments of a batch of MAF blocks (matches of a batch are counted at once):
+MAF_BATCH_SIZE = 16 * 1024 * 1024
 
 
 def maf(in_maf, out_paf):
     """
-    Maf parser
+    Maf parser. The first sequence of each block is the target, the second one is the query. Blocks are read as a
+    stream, and matches (same bases, case-insensitive, gaps excluded) are counted with numpy by batches of blocks.
+    A dot in the query means the same base as in the target (as read by Biopython), so it is counted as a match
+    unless the target has a gap
 
     :param in_maf: input maf file path
     :type in_maf: str
@@ -22,62 +32,133 @@ def maf(in_maf, out_paf):
     :type out_paf: str
     :return: True if success, else False
     """
-    maf_f = None
     try:
-        with open(out_paf, "w") as paf:
-            maf_f = AlignIO.parse(in_maf, "maf")
-            for grp in maf_f:
-                seqs = []
-                for seq in grp:
-                    seqs.append(seq)
-                matches = 0
-                for i in range(0, len(seqs[0])):
-                    if seqs[0][i] == seqs[1][i]:
-                        matches += 1
-                tannots = seqs[0].annotations
-                qannots = seqs[1].annotations
-                tlen = tannots["srcSize"]
-                tstart = tannots["start"]
-                tend = tstart + tannots["size"]
-                if tannots["strand"] == -1:
-                    tstart = tlen - tstart
-                    tend = tlen - tend
-                qlen = qannots["srcSize"]
-                qstart = qannots["start"]
-                qend = qannots["start"] + qannots["size"]
-                if qannots["strand"] == -1:
-                    qstart = qlen - qstart
-                    qend = qlen - qend
-                strand = "+" if tannots["strand"] == qannots["strand"] else "-"
-                paf.write("{qname}\t{qlen}\t{qstart}\t{qend}\t{strand}\t{tname}\t{tlen}\t{tstart}\t{tend}\t{matches}\t"
-                          "{block_len}\t255\n".format(
-                            tname=seqs[0].id,
-                            tlen=tlen,
-                            tstart=tstart,
-                            tend=tend,
-                            qname=seqs[1].id,
-                            qlen=qlen,
-                            qstart=qstart if strand == "+" else qend,
-                            qend=qend if strand == "+" else qstart,
-                            strand=strand,
-                            matches=matches,
-                            block_len=tannots["size"]
-                          ))
-    except:
+        with open(in_maf, "rb") as maf_f, open(out_paf, "wb") as paf:
+            batch = []
+            batch_size = 0
+            for rows in _maf_blocks(maf_f):
+                batch.append(rows)
+                batch_size += len(rows[0][6])
+                if batch_size >= MAF_BATCH_SIZE:
+                    paf.write(_maf_batch_to_paf(batch))
+                    batch = []
+                    batch_size = 0
+            if len(batch) > 0:
+                paf.write(_maf_batch_to_paf(batch))
+    except Exception:
         traceback.print_exc()
-        if maf_f is not None:
-            maf_f.close()
         return False
-    else:
-        maf_f.close()
-        return True
+    return True
+
+
+def _maf_blocks(maf_f):
+    """
+    Read alignment blocks of a MAF file
+
+    :param maf_f: MAF file, opened in binary mode
+    :type maf_f: _io.BufferedReader
+    :return: generator of blocks: fields of the "s" lines of each block
+    :rtype: generator
+    """
+    rows = None
+    for line in maf_f:
+        if rows is not None:
+            if line.startswith(b"s"):
+                fields = line.split()
+                if len(fields) != 7:
+                    raise ValueError("Error parsing alignment - 's' line must have 7 fields")
+                rows.append(fields)
+            elif line.strip() == b"":
+                yield _check_maf_block(rows)
+                rows = None
+            elif line[:1] not in (b"i", b"e", b"q", b"#"):
+                raise ValueError("Error parsing alignment - unexpected line:\n%s" % line.decode("utf-8", "replace"))
+        elif line.startswith(b"a"):
+            rows = []
+    if rows is not None:
+        yield _check_maf_block(rows)
+
+
+def _check_maf_block(rows):
+    """
+    Check that a MAF block contains a target and a query sequence of same length
+
+    :param rows: fields of the "s" lines of the block
+    :type rows: list
+    :return: rows
+    :rtype: list
+    """
+    if len(rows) < 2:
+        raise ValueError("Error parsing alignment - block must have at least 2 sequences")
+    if len(rows[0][6]) != len(rows[1][6]):
+        raise ValueError("Error parsing alignment - sequences must all be the same length")
+    return rows
+
+
+def _maf_batch_to_paf(batch):
+    """
+    Convert a batch of MAF blocks to PAF lines
+
+    :param batch: blocks (fields of the "s" lines of each block)
+    :type batch: list
+    :return: PAF lines
+    :rtype: bytes
+    """
+    target = np.frombuffer(b"".join([rows[0][6] for rows in batch]).upper(), dtype=np.uint8)
+    query = np.frombuffer(b"".join([rows[1][6] for rows in batch]).upper(), dtype=np.uint8)
+    # A dot in the query means the same base as in the target (a gap, if the target has one):
+    is_match = ((target == query) | (query == ord("."))) & (target != ord("-"))
+    cum_matches = np.concatenate(([0], np.cumsum(is_match)))
+    ends = np.cumsum([len(rows[0][6]) for rows in batch])
+    starts = np.concatenate(([0], ends[:-1]))
+    matches = (cum_matches[ends] - cum_matches[starts]).tolist()
+
+    lines = []
+    for rows, nb_matches in zip(batch, matches):
+        t_fields, q_fields = rows[0], rows[1]
+        tlen = int(t_fields[5])
+        tstart = int(t_fields[2])
+        tend = tstart + int(t_fields[3])
+        if t_fields[4] == b"-":
+            tstart = tlen - tstart
+            tend = tlen - tend
+        qlen = int(q_fields[5])
+        qstart = int(q_fields[2])
+        qend = qstart + int(q_fields[3])
+        if q_fields[4] == b"-":
+            qstart = qlen - qstart
+            qend = qlen - qend
+        strand = b"+" if (t_fields[4] == b"-") == (q_fields[4] == b"-") else b"-"
+        lines.append(b"%s\t%d\t%d\t%d\t%s\t%s\t%d\t%d\t%d\t%d\t%d\t255\n" % (
+            q_fields[1], qlen, qstart if strand == b"+" else qend, qend if strand == b"+" else qstart, strand,
+            t_fields[1], tlen, tstart, tend, nb_matches, int(t_fields[3])))
+    return b"".join(lines)
 
 
 def mashmap2paf(in_paf, out_paf):
-    with open(in_paf, "r") as in_p, open(out_paf, "w") as out_p:
-        for line in in_p:
-            parts = line.rstrip().split(" ")
-            parts[9] = str(round(float(parts[9]) / 100.0 * 1000.0))
-            parts.append("1000")
-            out_p.write("\t".join(parts) + "\t255" + "\n")
+    """
+    Mashmap parser
 
+    :param in_paf: input mashmap file path
+    :type in_paf: str
+    :param out_paf: output paf file path
+    :type out_paf: str
+    """
+    with open(in_paf, "rb") as in_p, open(out_paf, "wb") as out_p:
+        out_p.writelines(mashmap2paf_lines(in_p))
+
+
+def mashmap2paf_lines(lines):
+    """
+    Convert mashmap lines to PAF
+
+    :param lines: mashmap lines
+    :type lines: iterable
+    :return: generator of PAF lines
+    :rtype: generator
+    """
+    for line in lines:
+        parts = line.rstrip().split(b" ")
+        parts[9] = str(round(float(parts[9]) / 100.0 * 1000.0)).encode("utf-8")
+        parts.append(b"1000")
+        yield b"\t".join(parts) + b"\t255" + b"\n"
@@ -20,6 +20,7 @@ d3.dgenies.min_idy = 0;
 d3.dgenies.max_idy = 0;
 d3.dgenies.zone_selected = false;
 d3.dgenies.query_selected = null;
+d3.dgenies.sampled = false;
 
 //For translations:
 d3.dgenies.translate_start = null;
@@ -109,7 +110,7 @@ d3.dgenies.init = function (id_res=null, from_file=false) {
     $("#form-parameters")[0].reset();
     $("form#select-zone")[0].reset();
     if (!from_file) {
-        dgenies.post("/get_graph",
+        d3.dgenies.request_graph("/get_graph",
             {"id": id_res},
             function (data) {
                 if (data["success"]) {
@@ -119,7 +120,8 @@ d3.dgenies.init = function (id_res=null, from_file=false) {
                     $("#supdraw").html($("<p>").html("message" in data ? data["message"] : "This job does not exist!").css("margin-top", "15px"));
                     dgenies.result.remove_job_from_cookie(dgenies.result.id_res);
                 }
-            }
+            },
+            "GET"
         )
     }
     else {
@@ -166,6 +168,7 @@ d3.dgenies.launch = function(res, update=false, noise_change=false) {
     d3.dgenies.min_idy = res["min_idy"];
     d3.dgenies.max_idy = res["max_idy"];
     d3.dgenies.limit_idy = res["limit_idy"];
+    d3.dgenies.sampled = res["sampled"];
     if (!noise_change) {
         dgenies.noise = true;
     }
@@ -185,6 +188,93 @@ d3.dgenies.launch = function(res, update=false, noise_change=false) {
     d3.dgenies.mousetip.init();
 };
 
+/**
+ * Server call which returns dot plot data. Data is asked in binary format (see d3.dgenies.decode_binary), errors
+ * are still sent as JSON. GET calls can be answered from the browser cache (the server sends an ETag)
+ *
+ * @param {string} url url to call
+ * @param {object} data data to send
+ * @param {function} success success function, called with decoded data
+ * @param {string} method method (GET or POST)
+ */
+d3.dgenies.request_graph = function(url, data, success, method="POST") {
+    let xhr = new XMLHttpRequest();
+    let params = Object.assign({}, data, {"format": "binary"});
+    if (method === "GET") {
+        xhr.open("GET", url + "?" + $.param(params));
+    }
+    else {
+        xhr.open("POST", url);
+    }
+    xhr.responseType = "arraybuffer";
+    xhr.onload = function () {
+        if (xhr.status !== 200) {
+            xhr.onerror();
+        }
+        else if (xhr.getResponseHeader("Content-Type") === "application/octet-stream") {
+            success(d3.dgenies.decode_binary(xhr.response));
+        }
+        else {
+            success(JSON.parse(new TextDecoder("utf-8").decode(xhr.response)));
+        }
+    };
+    xhr.onerror = function () {
+        dgenies.hide_loading();
+        dgenies.notify("An error occurred! Please contact us to report the bug", "danger");
+    };
+    if (method === "GET") {
+        xhr.send();
+    }
+    else {
+        let form = new FormData();
+        for (let key in params) {
+            form.append(key, params[key]);
+        }
+        xhr.send(form);
+    }
+};
+
+/**
+ * Decode dot plot data sent in binary format. Columns of matches are read into typed arrays (kept in the "columns"
+ * field, by class of identity), then lines are built from them
+ *
+ * @param {ArrayBuffer} buffer binary data: magic bytes, header length (uint32), JSON header, then for each class of
+ * identity: x1, x2, y1, y2, idy (float64) and q_id, t_id (int32) columns. All numbers are little-endian
+ * @returns {object} data, as sent in JSON format, plus the columns field
+ */
+d3.dgenies.decode_binary = function(buffer) {
+    let view = new DataView(buffer);
+    let header_len = view.getUint32(4, true);
+    let res = JSON.parse(new TextDecoder("utf-8").decode(new Uint8Array(buffer, 8, header_len)));
+    let offset = 8 + header_len;
+    let q_names = res["q_names"];
+    let t_names = res["t_names"];
+    res["columns"] = {};
+    res["lines"] = {};
+    // Typed arrays use the platform byte order, which is little-endian on all supported browsers
+    for (let c=0; c < res["classes"].length; c++) {
+        let class_idy = res["classes"][c];
+        let nb = res["counts"][class_idy];
+        let columns = {};
+        for (let name of ["x1", "x2", "y1", "y2", "idy"]) {
+            columns[name] = new Float64Array(buffer, offset, nb);
+            offset += 8 * nb;
+        }
+        for (let name of ["q_id", "t_id"]) {
+            columns[name] = new Int32Array(buffer, offset, nb);
+            offset += 4 * nb;
+        }
+        let lines = new Array(nb);
+        for (let i=0; i < nb; i++) {
+            lines[i] = [columns["x1"][i], columns["x2"][i], columns["y1"][i], columns["y2"][i], columns["idy"][i],
+                q_names[columns["q_id"][i]], t_names[columns["t_id"][i]]];
+        }
+        res["columns"][class_idy] = columns;
+        res["lines"][class_idy] = lines;
+    }
+    return res;
+};
+
 /**
  * Find target chromosome where the user click
  *
@@ -274,6 +364,9 @@ d3.dgenies.select_zone = function (x=null, y=null, x_zone=null, y_zone=null, for
             d3.dgenies.draw_right_axis(pseudo_y_zones);
 
             d3.dgenies.zoom_enabled = false;
+
+            //Load best matches between the two contigs, if some matches were not loaded:
+            d3.dgenies.zoom.load_pair_details(x_zone, y_zone);
         }
         $("#restore-all").show();
         dgenies.hide_loading();
@@ -824,9 +917,10 @@ d3.dgenies.__lineFunction = function(d, min_size=0, max_size=null, x_len, y_len)
  * @param {object} lines matches definitions
  * @param {number} x_len total length of target
  * @param {number} y_len total length of query
+ * @param {string} extra_class class to add to drawn paths
  * @private
  */
-d3.dgenies.__draw_idy_lines = function (idy, lines, x_len, y_len) {
+d3.dgenies.__draw_idy_lines = function (idy, lines, x_len, y_len, extra_class="") {
     let min_sizes = d3.dgenies.min_sizes;
     for (let i=0; i<min_sizes.length; i++) {
         let min_size = min_sizes[i];
@@ -834,8 +928,9 @@ d3.dgenies.__draw_idy_lines = function (idy, lines, x_len, y_len) {
         if (lines[idy].length > 0) {
             d3.dgenies.container.append("path")
                 .attr("d", d3.dgenies.__lineFunction(lines[idy], min_size, max_size, x_len, y_len))
-                .attr("class", "content-lines s_" + min_size.toString().replace(".", "_") + " idy_" + idy)
-                .attr("stroke-width", d3.dgenies.content_lines_width + "px")
+                .attr("class", "content-lines s_" + min_size.toString().replace(".", "_") + " idy_" + idy +
+                    (extra_class ? " " + extra_class : ""))
+                .attr("stroke-width", d3.dgenies.content_lines_width / d3.dgenies.zoom_scale_lines + "px")
                 .attr("stroke", d3.dgenies.color_idy[d3.dgenies.color_idy_theme][idy])
                 .attr("stroke-linecap", d3.dgenies.linecap);
         }
@@ -892,6 +987,11 @@ d3.dgenies.draw_lines = function (lines=d3.dgenies.lines, x_len=d3.dgenies.x_len
     for (let i=0; i <4; i++) {
         d3.dgenies.__draw_idy_lines(i.toString(), lines, x_len, y_len)
     }
+    if (d3.dgenies.zoom.details !== null) {
+        for (let i=0; i <4; i++) {
+            d3.dgenies.__draw_idy_lines(i.toString(), d3.dgenies.zoom.details, x_len, y_len, "detail-lines")
+        }
+    }
 
     d3.dgenies.events.filter_size(d3.dgenies.min_size);
 };
@@ -3,6 +3,9 @@ if (!d3 || !d3.dgenies) {
 }
 d3.dgenies.zoom = {};
 d3.dgenies.zoom.help_timeout = null;
+d3.dgenies.zoom.details = null;
+d3.dgenies.zoom.details_timeout = null;
+d3.dgenies.zoom.details_request = 0;
 
 /**
  * Initialize zoom.init module
@@ -113,6 +116,8 @@ d3.dgenies.zoom.translate = function () {
         d3.dgenies.draw_right_axis();
         d3.dgenies.zoom_bottom_axis();
         d3.dgenies.zoom_left_axis();
+
+        d3.dgenies.zoom.load_visible_details();
     }
     else if(d3.dgenies.translate_start !== null) {
         let help_trans = $("#help-trans");
@@ -216,6 +221,8 @@ d3.dgenies.zoom.zoom = function () {
             else {
                 $("#restore-all").show();
             }
+
+            d3.dgenies.zoom.load_visible_details();
         }
     }
     else if (d3.dgenies.zoom_enabled) {
@@ -230,6 +237,110 @@ d3.dgenies.zoom.zoom = function () {
     }
 };
 
+/**
+ * Remove matches loaded for the zoomed window, and cancel pending loads
+ */
+d3.dgenies.zoom.remove_details = function() {
+    window.clearTimeout(d3.dgenies.zoom.details_timeout);
+    d3.dgenies.zoom.details_request++;
+    d3.dgenies.zoom.details = null;
+    $("path.detail-lines").remove();
+};
+
+/**
+ * Load best matches of a window, to show details when zoomed in. Only done if some matches were not loaded with the
+ * whole dot plot. Calls are delayed, so only the last window of a series of zoom/translate events is loaded.
+ *
+ * @param {number} x_min window start on X axis (target, Bp)
+ * @param {number} x_max window end on X axis (target, Bp)
+ * @param {number} y_min window start on Y axis (query, Bp)
+ * @param {number} y_max window end on Y axis (query, Bp)
+ */
+d3.dgenies.zoom.load_details = function(x_min, x_max, y_min, y_max) {
+    d3.dgenies.zoom.__load_details("get_graph_zone", {
+        x_min: Math.floor(x_min),
+        x_max: Math.ceil(x_max),
+        y_min: Math.floor(y_min),
+        y_max: Math.ceil(y_max)
+    });
+};
+
+/**
+ * Load best matches between a target chromosome and a query contig, to show details of a selected zone (see
+ * load_details). Matches are found on the server with the contig pair query of the match index
+ *
+ * @param {string} x_zone target chromosome
+ * @param {string} y_zone query contig
+ */
+d3.dgenies.zoom.load_pair_details = function(x_zone, y_zone) {
+    d3.dgenies.zoom.__load_details("get_graph_pair", {
+        target: x_zone,
+        query: y_zone
+    });
+};
+
+/**
+ * Load best matches from the server and draw them (see load_details)
+ *
+ * @param {string} url url to call (the job id is appended)
+ * @param {object} data data to send, in addition to the size of the drawing area and the noise option
+ */
+d3.dgenies.zoom.__load_details = function(url, data) {
+    if (!d3.dgenies.sampled || dgenies.result === undefined || !dgenies.result.id_res) {
+        return;
+    }
+    window.clearTimeout(d3.dgenies.zoom.details_timeout);
+    let request = ++d3.dgenies.zoom.details_request;
+    d3.dgenies.zoom.details_timeout = window.setTimeout(() => {
+        let rect = d3.dgenies.svgcontainer.node().getBoundingClientRect();
+        dgenies.post(`/${url}/${dgenies.result.id_res}`,
+            Object.assign({}, data, {
+                pixels: Math.round(Math.max(rect.width, rect.height)),
+                noise: dgenies.noise ? 1 : 0
+            }),
+            function (data) {
+                if (data["success"] && request === d3.dgenies.zoom.details_request) {
+                    d3.dgenies.zoom.details = data["lines"];
+                    $("path.detail-lines").remove();
+                    for (let i=0; i <4; i++) {
+                        d3.dgenies.__draw_idy_lines(i.toString(), d3.dgenies.zoom.details, d3.dgenies.x_len,
+                            d3.dgenies.y_len, "detail-lines");
+                    }
+                    d3.dgenies.events.filter_size(d3.dgenies.min_size);
+                }
+            });
+    }, 300);
+};
+
+/**
+ * Load best matches of the visible window (see load_details), based on the current transform of the container
+ */
+d3.dgenies.zoom.load_visible_details = function() {
+    let transform = d3.dgenies.container.attr("transform");
+    let search_tr = transform !== null ? transform.match(/translate\(([-\de.]+),\s*([-\de.]+)\)/) : null;
+    let search_sc = transform !== null ? transform.match(/scale\(([-\de.]+)(,\s*([-\de.]+))?\)/) : null;
+    if (search_tr === null || search_sc === null) {
+        return;
+    }
+    let tr_x = parseFloat(search_tr[1]),
+        tr_y = parseFloat(search_tr[2]),
+        scale_x = parseFloat(search_sc[1]),
+        scale_y = search_sc[3] !== undefined ? parseFloat(search_sc[3]) : scale_x;
+    if (scale_x <= 1 && scale_y <= 1) {
+        d3.dgenies.zoom.remove_details();
+        return;
+    }
+    //Visible part of the container, in container units (Y axis goes down):
+    let x_start = Math.max(-tr_x / scale_x, 0),
+        x_end = Math.min((d3.dgenies.scale - tr_x) / scale_x, d3.dgenies.scale),
+        y_start = Math.max(-tr_y / scale_y, 0),
+        y_end = Math.min((d3.dgenies.scale - tr_y) / scale_y, d3.dgenies.scale);
+    d3.dgenies.zoom.load_details(x_start / d3.dgenies.scale * d3.dgenies.x_len,
+        x_end / d3.dgenies.scale * d3.dgenies.x_len,
+        (d3.dgenies.scale - y_end) / d3.dgenies.scale * d3.dgenies.y_len,
+        (d3.dgenies.scale - y_start) / d3.dgenies.scale * d3.dgenies.y_len);
+};
+
 /**
  * Restore previous scale
  *
@@ -277,6 +388,7 @@ d3.dgenies.zoom.reset_scale = function (temp=false, after=null, force=true) {
             //Reset scale:
             d3.dgenies.container.attr("transform", "scale(1,1)translate(0,0)");
             d3.dgenies.zoom_scale_lines = 1;
+            d3.dgenies.zoom.remove_details();
 
             //Restore lines stroke width:
             d3.selectAll("path.content-lines").attr("stroke-width", d3.dgenies.content_lines_width);
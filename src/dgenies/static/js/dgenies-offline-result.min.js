@@ -97,15 +97,15 @@ dgenies.result.id_res=null;/**
  * Initialise controls of the result page
  */dgenies.result.controls.init=function(){$("#sort-contigs").click(dgenies.result.controls.launch_sort_contigs);$("#reset-sort").click(dgenies.result.controls.reset_sort_contig);$("#hide-noise").click(dgenies.result.controls.launch_hide_noise);$("#summary").click(dgenies.result.controls.summary);$("#delete-job").click(dgenies.result.controls.delete_job);$("form#select-zone input.submit").click(dgenies.result.controls.select_zone);$("form#export select").change(dgenies.result.export.export)};/**
  * Build summary
- */dgenies.result.controls.summary=function(){dgenies.show_loading("Building...");window.setTimeout(()=>{dgenies.post(`/summary/${dgenies.result.id_res}`,{},function(data){dgenies.hide_loading();if(data["success"]){if(data["status"]==="done"){dgenies.result.summary.show(data["percents"])}else if(data["status"]==="waiting"){dgenies.result.controls.summary()}}else{dgenies.notify(data["message"]||"An error occurred! Please contact us to report the bug","danger")}})},0)};/**
+ */dgenies.result.controls.summary=function(){dgenies.show_loading("Building...");window.setTimeout(()=>{dgenies.get(`/summary/${dgenies.result.id_res}`,{},function(data){dgenies.hide_loading();if(data["success"]){if(data["status"]==="done"){dgenies.result.summary.show(data["percents"])}else if(data["status"]==="waiting"){dgenies.result.controls.summary()}}else{dgenies.notify(data["message"]||"An error occurred! Please contact us to report the bug","danger")}})},0)};/**
  * Build contigs sort
- */dgenies.result.controls.launch_sort_contigs=function(){d3.dgenies.zoom.reset_scale();window.setTimeout(()=>{dgenies.show_loading("Building...");window.setTimeout(()=>{dgenies.post(`/sort/${dgenies.result.id_res}`,{},function(data){if(data["success"]){dgenies.reset_loading_message();window.setTimeout(()=>{d3.dgenies.launch(data,true)},0)}else{dgenies.hide_loading();dgenies.notify(data["message"]||"An error occurred! Please contact us to report the bug","danger")}})},0)},0)};/**
+ */dgenies.result.controls.launch_sort_contigs=function(){d3.dgenies.zoom.reset_scale();window.setTimeout(()=>{dgenies.show_loading("Building...");window.setTimeout(()=>{d3.dgenies.request_graph(`/sort/${dgenies.result.id_res}`,{},function(data){if(data["success"]){dgenies.reset_loading_message();window.setTimeout(()=>{d3.dgenies.launch(data,true)},0)}else{dgenies.hide_loading();dgenies.notify(data["message"]||"An error occurred! Please contact us to report the bug","danger")}})},0)},0)};/**
  * Reset contigs sort
- */dgenies.result.controls.reset_sort_contig=function(){d3.dgenies.zoom.reset_scale();window.setTimeout(()=>{dgenies.show_loading("Building...");window.setTimeout(()=>{dgenies.post(`/reset-sort/${dgenies.result.id_res}`,{},function(data){if(data["success"]){dgenies.reset_loading_message();window.setTimeout(()=>{d3.dgenies.launch(data,true)},0)}else{dgenies.hide_loading();dgenies.notify(data["message"]||"An error occurred! Please contact us to report the bug","danger")}})},0)},0)};/**
+ */dgenies.result.controls.reset_sort_contig=function(){d3.dgenies.zoom.reset_scale();window.setTimeout(()=>{dgenies.show_loading("Building...");window.setTimeout(()=>{d3.dgenies.request_graph(`/reset-sort/${dgenies.result.id_res}`,{},function(data){if(data["success"]){dgenies.reset_loading_message();window.setTimeout(()=>{d3.dgenies.launch(data,true)},0)}else{dgenies.hide_loading();dgenies.notify(data["message"]||"An error occurred! Please contact us to report the bug","danger")}})},0)},0)};/**
  * Build reverse of a contig
- */dgenies.result.controls.launch_reverse_contig=function(){if(d3.dgenies.query_selected!==null){d3.dgenies.zoom.reset_scale();window.setTimeout(()=>{dgenies.show_loading("Building...");window.setTimeout(()=>{dgenies.post(`/reverse-contig/${dgenies.result.id_res}`,{"contig":d3.dgenies.query_selected},function(data){if(data["success"]){dgenies.reset_loading_message();window.setTimeout(()=>{d3.dgenies.launch(data,true)},0)}else{dgenies.hide_loading();dgenies.notify(data["message"]||"An error occurred! Please contact us to report the bug","danger")}})},0)},0)}else{dgenies.notify("Error: no query selected. Please contact us to report the bug","danger")}};/**
+ */dgenies.result.controls.launch_reverse_contig=function(){if(d3.dgenies.query_selected!==null){d3.dgenies.zoom.reset_scale();window.setTimeout(()=>{dgenies.show_loading("Building...");window.setTimeout(()=>{d3.dgenies.request_graph(`/reverse-contig/${dgenies.result.id_res}`,{"contig":d3.dgenies.query_selected},function(data){if(data["success"]){dgenies.reset_loading_message();window.setTimeout(()=>{d3.dgenies.launch(data,true)},0)}else{dgenies.hide_loading();dgenies.notify(data["message"]||"An error occurred! Please contact us to report the bug","danger")}})},0)},0)}else{dgenies.notify("Error: no query selected. Please contact us to report the bug","danger")}};/**
  * Hide noise
- */dgenies.result.controls.launch_hide_noise=function(){d3.dgenies.zoom.reset_scale();window.setTimeout(()=>{dgenies.show_loading("Building...");window.setTimeout(()=>{dgenies.post(`/freenoise/${dgenies.result.id_res}`,{noise:dgenies.noise?0:1},function(data){if(data["success"]){dgenies.noise=!dgenies.noise;dgenies.reset_loading_message();window.setTimeout(()=>{d3.dgenies.launch(data,true,true)},0)}else{dgenies.hide_loading();dgenies.notify(data["message"]||"An error occurred! Please contact us to report the bug","danger")}})},0)},0)};/**
+ */dgenies.result.controls.launch_hide_noise=function(){d3.dgenies.zoom.reset_scale();window.setTimeout(()=>{dgenies.show_loading("Building...");window.setTimeout(()=>{d3.dgenies.request_graph(`/freenoise/${dgenies.result.id_res}`,{noise:dgenies.noise?0:1},function(data){if(data["success"]){dgenies.noise=!dgenies.noise;dgenies.reset_loading_message();window.setTimeout(()=>{d3.dgenies.launch(data,true,true)},0)}else{dgenies.hide_loading();dgenies.notify(data["message"]||"An error occurred! Please contact us to report the bug","danger")}})},0)},0)};/**
  * Select zone with select boxes
  */dgenies.result.controls.select_zone=function(){let contig_select=$("#select-contig").find(":selected");let target_select=$("#select-target").find(":selected");if(contig_select.val()!=="###NONE###"&&target_select.val()!=="###NONE###"){d3.dgenies.select_zone(null,null,target_select.val(),contig_select.val(),true)}else{dgenies.notify("Please select zones into zoom!","danger",2000)}};/**
  * Delete current job (confirmed)
@@ -151,7 +151,7 @@ dgenies.result.export.save_file(blob,"svg")},0)};/**
  * Export query like reference fasta file (standalone mode)
  */dgenies.result.export.export_query_as_reference_fasta_standalone=function(){dgenies.show_loading("Building file...",180);window.setTimeout(()=>{dgenies.post(`/build-query-as-reference/${dgenies.result.id_res}`,{},function(data,success){if(data["success"]){let export_div=$("div#export-pict");export_div.html("");export_div.append($("<a>").attr("href",`/get-query-as-reference/${dgenies.result.id_res}`).attr("download",`as_reference_${d3.dgenies.name_y}.fasta`).attr("id","my-download").text("download"));document.getElementById("my-download").click();dgenies.hide_loading()}else{dgenies.notify(`An error has occurred. Please contact the support`,"danger")}})},0)};/**
  * Download offline viewer
- */dgenies.result.export.export_offline_viewer=function(){dgenies.show_loading("Building file...",180);window.setTimeout(()=>{dgenies.post(`/summary/${dgenies.result.id_res}`,{},function(data){dgenies.hide_loading();if(data["success"]){if(data["status"]==="done"){let export_div=$("div#export-pict");export_div.html("");export_div.append($("<a>").attr("href",`/viewer/${dgenies.result.id_res}`).attr("download",d3.dgenies.name_y+"_"+d3.dgenies.name_x+"_"+dgenies.result.id_res+".html").attr("id","my-download").text("download"));dgenies.hide_loading();document.getElementById("my-download").click()}else if(data["status"]==="waiting"){dgenies.result.export.export_offline_viewer()}}else{dgenies.notify(data["message"]||"An error occurred! Please contact us to report the bug","danger")}})},0)};/**
+ */dgenies.result.export.export_offline_viewer=function(){dgenies.show_loading("Building file...",180);window.setTimeout(()=>{dgenies.get(`/summary/${dgenies.result.id_res}`,{},function(data){dgenies.hide_loading();if(data["success"]){if(data["status"]==="done"){let export_div=$("div#export-pict");export_div.html("");export_div.append($("<a>").attr("href",`/viewer/${dgenies.result.id_res}`).attr("download",d3.dgenies.name_y+"_"+d3.dgenies.name_x+"_"+dgenies.result.id_res+".html").attr("id","my-download").text("download"));dgenies.hide_loading();document.getElementById("my-download").click()}else if(data["status"]==="waiting"){dgenies.result.export.export_offline_viewer()}}else{dgenies.notify(data["message"]||"An error occurred! Please contact us to report the bug","danger")}})},0)};/**
  * Manage exports
  */dgenies.result.export.export=function(){let select=$("form#export select");let selection=parseInt(select.val());window.setTimeout(()=>{if(selection>0){let async=false;if(selection===1){dgenies.result.export.export_svg();async=true}else if(selection===2){dgenies.result.export.export_png();async=true}else if(selection===3)dgenies.result.export.export_paf();else if(selection===4){dgenies.result.export.ask_export_fasta();async=true}else if(selection===5){dgenies.result.export.export_association_table()}else if(selection===6){dgenies.result.export.export_no_association_file("query");async=true}else if(selection===7){dgenies.result.export.export_no_association_file("target");async=true}else if(selection===8){if(dgenies.mode==="webserver"){dgenies.result.export.export_query_as_reference_fasta_webserver()}else{dgenies.result.export.export_query_as_reference_fasta_standalone();async=true}}else if(selection===9){dgenies.result.export.export_backup_file();async=true}else if(selection===10){dgenies.result.export.export_offline_viewer();async=true}else if(selection===11){dgenies.result.export.dl_logs();async=true}else dgenies.notify("Not supported yet!","danger",2000);if(!async)dgenies.hide_loading();select.val("0")}},0)};if(!dgenies||!dgenies.result){throw"dgenies.result wasn't included!"}dgenies.result.summary={};dgenies.result.summary.percents={};/**
  * Show summary window
@@ -178,7 +178,7 @@ dgenies.result.export.save_file(blob,"svg")},0)};/**
  */dgenies.result.summary.export_svg=function(){let svg="<?xml version=\"1.0\" encoding=\"utf-8\"?>\n<!DOCTYPE svg PUBLIC \"-//W3C//DTD SVG 1.1//EN\" "+"\"http://www.w3.org/Graphics/SVG/1.1/DTD/svg11.dtd\">";svg+=dgenies.result.summary.get_svg();let blob=new Blob([svg],{type:"image/svg+xml"});dgenies.result.summary.save_file(blob,"svg")};/**
  * Export summary to png
  */dgenies.result.summary.export_png=function(){let export_div=$("div#export-pict");export_div.html("").append($("<canvas>"));canvg(export_div.find("canvas")[0],dgenies.result.summary.get_svg());let canvas=export_div.find("canvas")[0];canvas.toBlob(function(blob){dgenies.result.summary.save_file(blob,"png");export_div.html("")},"image/png")};if(!d3){throw"d3 wasn't included!"}d3.dgenies={};//GLOBAL VARIABLES:
-d3.dgenies.svgcontainer=null;d3.dgenies.container=null;d3.dgenies.svgsupercontainer=null;d3.dgenies.name_x=null;d3.dgenies.name_y=null;d3.dgenies.lines=null;d3.dgenies.x_len=null;d3.dgenies.y_len=null;d3.dgenies.x_zones=null;d3.dgenies.y_zones=null;d3.dgenies.zoom_enabled=true;d3.dgenies.all_disabled=false;d3.dgenies.min_idy=0;d3.dgenies.max_idy=0;d3.dgenies.zone_selected=false;d3.dgenies.query_selected=null;//For translations:
+d3.dgenies.svgcontainer=null;d3.dgenies.container=null;d3.dgenies.svgsupercontainer=null;d3.dgenies.name_x=null;d3.dgenies.name_y=null;d3.dgenies.lines=null;d3.dgenies.x_len=null;d3.dgenies.y_len=null;d3.dgenies.x_zones=null;d3.dgenies.y_zones=null;d3.dgenies.zoom_enabled=true;d3.dgenies.all_disabled=false;d3.dgenies.min_idy=0;d3.dgenies.max_idy=0;d3.dgenies.zone_selected=false;d3.dgenies.query_selected=null;d3.dgenies.sampled=false;//For translations:
 d3.dgenies.translate_start=null;d3.dgenies.posX=null;d3.dgenies.posY=null;d3.dgenies.old_translate=null;//Graphical parameters:
 d3.dgenies.scale=1000;d3.dgenies.content_lines_width=d3.dgenies.scale/400;d3.dgenies.break_lines_width=d3.dgenies.scale/1500;d3.dgenies.color_idy_theme="default";d3.dgenies.color_idy_themes=["default","colorblind","black&white","r_default","r_colorblind","allblack"];d3.dgenies.color_idy={"default":{"3":"#094b09","2":"#2ebd40","1":"#d5670b","0":"#ffd84b","-1":"#fff"},"colorblind":{"3":"#000","2":"#006DDB","1":"#DB6E00","0":"#FFB677","-1":"#fff"},"black&white":{"3":"#000","2":"#626262","1":"#9c9c9c","0":"#DDDCDC","-1":"#fff"},"r_default":{"3":"#7fff65","2":"#238d31","1":"#78410d","0":"#3b080a","-1":"#fff"},"r_colorblind":{"3":"#8c8c8c","2":"#006DDB","1":"#783c00","0":"#312515","-1":"#fff"},"allblack":{"3":"#000","2":"#000","1":"#000","0":"#000","-1":"#fff"}};d3.dgenies.limit_idy=null;d3.dgenies.min_idy_draw=0;d3.dgenies.min_size=0;d3.dgenies.linecap="round";d3.dgenies.background_axis="#f4f4f4";d3.dgenies.break_lines_color="#7c7c7c";d3.dgenies.break_lines_dash="3, 3";d3.dgenies.break_lines_show=true;d3.dgenies.zoom_scale_lines=1;// Zoom scale used for lines width
 d3.dgenies.tick_width=0.5;d3.dgenies.color_mixes="#969696";//Filter sizes:
@@ -188,13 +188,29 @@ d3.dgenies.help_zoom="/static/images/ctrl_plus_mouse.png";d3.dgenies.help_trans=
  *
  * @param {string} id_res job id
  * @param {boolean} from_file true to load data from a file (default: false, load from server)
- */d3.dgenies.init=function(id_res=null,from_file=false){if(id_res===null){id_res=dgenies.result.id_res}$("#form-parameters")[0].reset();$("form#select-zone")[0].reset();if(!from_file){dgenies.post("/get_graph",{"id":id_res},function(data){if(data["success"]){d3.dgenies.launch(data)}else{$("#supdraw").html($("<p>").html("message"in data?data["message"]:"This job does not exist!").css("margin-top","15px"));dgenies.result.remove_job_from_cookie(dgenies.result.id_res)}})}else{dgenies.get(id_res,{},function(data){d3.dgenies.launch(data)})}};/**
+ */d3.dgenies.init=function(id_res=null,from_file=false){if(id_res===null){id_res=dgenies.result.id_res}$("#form-parameters")[0].reset();$("form#select-zone")[0].reset();if(!from_file){d3.dgenies.request_graph("/get_graph",{"id":id_res},function(data){if(data["success"]){d3.dgenies.launch(data)}else{$("#supdraw").html($("<p>").html("message"in data?data["message"]:"This job does not exist!").css("margin-top","15px"));dgenies.result.remove_job_from_cookie(dgenies.result.id_res)}},"GET")}else{dgenies.get(id_res,{},function(data){d3.dgenies.launch(data)})}};/**
  * Launch draw of dot plot
  *
  * @param {string} res
  * @param {boolean} update if true, just update the existing dot plot (don't initialize events)
  * @param {boolean} noise_change if false, set noise to true
- */d3.dgenies.launch=function(res,update=false,noise_change=false){dgenies.fill_select_zones(res["x_order"],res["y_order"]);if(res["sorted"]){$("button#sort-contigs").text("Undo sort");$("#export").find("select option[value=4]").show();$("#export").find("select option[value=8]").show()}else{$("button#sort-contigs").text("Sort contigs");$("#export").find("select option[value=4]").hide();$("#export").find("select option[value=8]").hide()}d3.dgenies.name_x=res["name_x"];d3.dgenies.name_y=res["name_y"];if(d3.dgenies.name_x===d3.dgenies.name_y){$("button#sort-contigs").parent().hide()}else{$("button#sort-contigs").parent().show()}d3.dgenies.lines=res["lines"];d3.dgenies.x_len=res["x_len"];d3.dgenies.y_len=res["y_len"];d3.dgenies.min_idy=res["min_idy"];d3.dgenies.max_idy=res["max_idy"];d3.dgenies.limit_idy=res["limit_idy"];if(!noise_change){dgenies.noise=true}$("#hide-noise").val(dgenies.noise?"Hide noise":"Show noise");d3.dgenies.draw(res["x_contigs"],res["x_order"],res["y_contigs"],res["y_order"]);if(!update){$("div#draw").resizable({aspectRatio:true});d3.dgenies.events.init();dgenies.result.controls.init()}if(res["sampled"]){let max_nb_lines=dgenies.numberWithCommas(res["max_nb_lines"].toString());dgenies.notify(`<div style="text-align: center"><b>There are too much matches.\nOnly the ${max_nb_lines} best matches are displayed</b></div>`)}d3.dgenies.mousetip.init()};/**
+ */d3.dgenies.launch=function(res,update=false,noise_change=false){dgenies.fill_select_zones(res["x_order"],res["y_order"]);if(res["sorted"]){$("button#sort-contigs").text("Undo sort");$("#export").find("select option[value=4]").show();$("#export").find("select option[value=8]").show()}else{$("button#sort-contigs").text("Sort contigs");$("#export").find("select option[value=4]").hide();$("#export").find("select option[value=8]").hide()}d3.dgenies.name_x=res["name_x"];d3.dgenies.name_y=res["name_y"];if(d3.dgenies.name_x===d3.dgenies.name_y){$("button#sort-contigs").parent().hide()}else{$("button#sort-contigs").parent().show()}d3.dgenies.lines=res["lines"];d3.dgenies.x_len=res["x_len"];d3.dgenies.y_len=res["y_len"];d3.dgenies.min_idy=res["min_idy"];d3.dgenies.max_idy=res["max_idy"];d3.dgenies.limit_idy=res["limit_idy"];d3.dgenies.sampled=res["sampled"];if(!noise_change){dgenies.noise=true}$("#hide-noise").val(dgenies.noise?"Hide noise":"Show noise");d3.dgenies.draw(res["x_contigs"],res["x_order"],res["y_contigs"],res["y_order"]);if(!update){$("div#draw").resizable({aspectRatio:true});d3.dgenies.events.init();dgenies.result.controls.init()}if(res["sampled"]){let max_nb_lines=dgenies.numberWithCommas(res["max_nb_lines"].toString());dgenies.notify(`<div style="text-align: center"><b>There are too much matches.\nOnly the ${max_nb_lines} best matches are displayed</b></div>`)}d3.dgenies.mousetip.init()};/**
+ * Server call which returns dot plot data. Data is asked in binary format (see d3.dgenies.decode_binary), errors
+ * are still sent as JSON. GET calls can be answered from the browser cache (the server sends an ETag)
+ *
+ * @param {string} url url to call
+ * @param {object} data data to send
+ * @param {function} success success function, called with decoded data
+ * @param {string} method method (GET or POST)
+ */d3.dgenies.request_graph=function(url,data,success,method="POST"){let xhr=new XMLHttpRequest;let params=Object.assign({},data,{"format":"binary"});if(method==="GET"){xhr.open("GET",url+"?"+$.param(params))}else{xhr.open("POST",url)}xhr.responseType="arraybuffer";xhr.onload=function(){if(xhr.status!==200){xhr.onerror()}else if(xhr.getResponseHeader("Content-Type")==="application/octet-stream"){success(d3.dgenies.decode_binary(xhr.response))}else{success(JSON.parse(new TextDecoder("utf-8").decode(xhr.response)))}};xhr.onerror=function(){dgenies.hide_loading();dgenies.notify("An error occurred! Please contact us to report the bug","danger")};if(method==="GET"){xhr.send()}else{let form=new FormData;for(let key in params){form.append(key,params[key])}xhr.send(form)}};/**
+ * Decode dot plot data sent in binary format. Columns of matches are read into typed arrays (kept in the "columns"
+ * field, by class of identity), then lines are built from them
+ *
+ * @param {ArrayBuffer} buffer binary data: magic bytes, header length (uint32), JSON header, then for each class of
+ * identity: x1, x2, y1, y2, idy (float64) and q_id, t_id (int32) columns. All numbers are little-endian
+ * @returns {object} data, as sent in JSON format, plus the columns field
+ */d3.dgenies.decode_binary=function(buffer){let view=new DataView(buffer);let header_len=view.getUint32(4,true);let res=JSON.parse(new TextDecoder("utf-8").decode(new Uint8Array(buffer,8,header_len)));let offset=8+header_len;let q_names=res["q_names"];let t_names=res["t_names"];res["columns"]={};res["lines"]={};// Typed arrays use the platform byte order, which is little-endian on all supported browsers
+for(let c=0;c<res["classes"].length;c++){let class_idy=res["classes"][c];let nb=res["counts"][class_idy];let columns={};for(let name of["x1","x2","y1","y2","idy"]){columns[name]=new Float64Array(buffer,offset,nb);offset+=8*nb}for(let name of["q_id","t_id"]){columns[name]=new Int32Array(buffer,offset,nb);offset+=4*nb}let lines=new Array(nb);for(let i=0;i<nb;i++){lines[i]=[columns["x1"][i],columns["x2"][i],columns["y1"][i],columns["y2"][i],columns["idy"][i],q_names[columns["q_id"][i]],t_names[columns["t_id"][i]]]}res["columns"][class_idy]=columns;res["lines"][class_idy]=lines}return res};/**
  * Find target chromosome where the user click
  *
  * @param {float} x coordinate on X axis
@@ -219,7 +235,8 @@ let x_len_zone=d3.dgenies.x_zones[x_zone][1]-d3.dgenies.x_zones[x_zone][0];let y
 d3.dgenies.container.attr("transform","scale("+scale_x+","+scale_y+")"+"translate(-"+d3.dgenies.x_zones[x_zone][0]+",-"+(d3.dgenies.scale-d3.dgenies.y_zones[y_zone][1])+")");// Correct lines stroke width to be not impacted by the zoom:
 d3.selectAll(".content-lines").attr("stroke-width",d3.dgenies.content_lines_width/Math.min(scale_x,scale_y));d3.dgenies.zoom_scale_lines=Math.min(scale_x,scale_y);d3.selectAll("line.break-lines").style("visibility","hidden");//Update left and bottom axis:
 let y_max=d3.dgenies.y_zones[y_zone][1]/d3.dgenies.scale*d3.dgenies.y_len;let y_min=d3.dgenies.y_zones[y_zone][0]/d3.dgenies.scale*d3.dgenies.y_len;d3.dgenies.draw_left_axis(y_max-y_min,0);let x_max=d3.dgenies.x_zones[x_zone][1]/d3.dgenies.scale*d3.dgenies.x_len;let x_min=d3.dgenies.x_zones[x_zone][0]/d3.dgenies.scale*d3.dgenies.x_len;d3.dgenies.draw_bottom_axis(x_max-x_min,0);//Update top and right axis:
-let pseudo_x_zones={};pseudo_x_zones[x_zone]=[0,d3.dgenies.x_len];d3.dgenies.draw_top_axis(pseudo_x_zones);let pseudo_y_zones={};pseudo_y_zones[y_zone]=[0,d3.dgenies.y_len];d3.dgenies.draw_right_axis(pseudo_y_zones);d3.dgenies.zoom_enabled=false}$("#restore-all").show();dgenies.hide_loading()},0)};/**
+let pseudo_x_zones={};pseudo_x_zones[x_zone]=[0,d3.dgenies.x_len];d3.dgenies.draw_top_axis(pseudo_x_zones);let pseudo_y_zones={};pseudo_y_zones[y_zone]=[0,d3.dgenies.y_len];d3.dgenies.draw_right_axis(pseudo_y_zones);d3.dgenies.zoom_enabled=false;//Load best matches between the two contigs, if some matches were not loaded:
+d3.dgenies.zoom.load_pair_details(x_zone,y_zone)}$("#restore-all").show();dgenies.hide_loading()},0)};/**
  * Get human readable size in Kb or Mb for a number in bases
  *
  * @param {int} nbases size in bases
@@ -309,8 +326,9 @@ let color_idy=d3.dgenies.color_idy[d3.dgenies.color_idy_theme];let color_idy_len
  * @param {object} lines matches definitions
  * @param {number} x_len total length of target
  * @param {number} y_len total length of query
+ * @param {string} extra_class class to add to drawn paths
  * @private
- */d3.dgenies.__draw_idy_lines=function(idy,lines,x_len,y_len){let min_sizes=d3.dgenies.min_sizes;for(let i=0;i<min_sizes.length;i++){let min_size=min_sizes[i];let max_size=i+1<min_sizes.length?min_sizes[i+1]:null;if(lines[idy].length>0){d3.dgenies.container.append("path").attr("d",d3.dgenies.__lineFunction(lines[idy],min_size,max_size,x_len,y_len)).attr("class","content-lines s_"+min_size.toString().replace(".","_")+" idy_"+idy).attr("stroke-width",d3.dgenies.content_lines_width+"px").attr("stroke",d3.dgenies.color_idy[d3.dgenies.color_idy_theme][idy]).attr("stroke-linecap",d3.dgenies.linecap)}}};/**
+ */d3.dgenies.__draw_idy_lines=function(idy,lines,x_len,y_len,extra_class=""){let min_sizes=d3.dgenies.min_sizes;for(let i=0;i<min_sizes.length;i++){let min_size=min_sizes[i];let max_size=i+1<min_sizes.length?min_sizes[i+1]:null;if(lines[idy].length>0){d3.dgenies.container.append("path").attr("d",d3.dgenies.__lineFunction(lines[idy],min_size,max_size,x_len,y_len)).attr("class","content-lines s_"+min_size.toString().replace(".","_")+" idy_"+idy+(extra_class?" "+extra_class:"")).attr("stroke-width",d3.dgenies.content_lines_width/d3.dgenies.zoom_scale_lines+"px").attr("stroke",d3.dgenies.color_idy[d3.dgenies.color_idy_theme][idy]).attr("stroke-linecap",d3.dgenies.linecap)}}};/**
  * Switch to next color theme
  */d3.dgenies.switch_color_theme=function(){if(!d3.dgenies.all_disabled){let current_theme=d3.dgenies.color_idy_theme;let idx=d3.dgenies.color_idy_themes.indexOf(current_theme);if(idx<d3.dgenies.color_idy_themes.length-1){idx++}else{idx=0}d3.dgenies.change_color_theme(d3.dgenies.color_idy_themes[idx])}};/**
  * Change color theme to the given one
@@ -324,7 +342,7 @@ let color_idy=d3.dgenies.color_idy[d3.dgenies.color_idy_theme];let color_idy_len
  * @param {number} y_len total len of query
  */d3.dgenies.draw_lines=function(lines=d3.dgenies.lines,x_len=d3.dgenies.x_len,y_len=d3.dgenies.y_len){//Remove old lines (if any):
 $("path.content-lines").remove();//lines = lines.sort(d3.dgenies._sort_lines);
-for(let i=0;i<4;i++){d3.dgenies.__draw_idy_lines(i.toString(),lines,x_len,y_len)}d3.dgenies.events.filter_size(d3.dgenies.min_size)};/**
+for(let i=0;i<4;i++){d3.dgenies.__draw_idy_lines(i.toString(),lines,x_len,y_len)}if(d3.dgenies.zoom.details!==null){for(let i=0;i<4;i++){d3.dgenies.__draw_idy_lines(i.toString(),d3.dgenies.zoom.details,x_len,y_len,"detail-lines")}}d3.dgenies.events.filter_size(d3.dgenies.min_size)};/**
  * Draw dot plot
  *
  * @param {object} x_contigs length associated to each contig of the query
@@ -395,7 +413,7 @@ d3.dgenies.draw_lines();$("#restore-all").click(function(){if(d3.dgenies.zoom.re
  * @returns {{x_zone: string, y_zone: string, x_match: float[], y_match: float[], idy: float}}
  */d3.dgenies.mousetip.get_match=function(e){let rect=$("g.container")[0].getBoundingClientRect();let posX=rect.left+window.scrollX,posY=rect.top+window.scrollY,width_c=rect.width,height_c=rect.height;let c_x=(e.pageX-posX)/width_c*d3.dgenies.scale,c_y=d3.dgenies.scale-(e.pageY-posY)/height_c*d3.dgenies.scale;c_x=c_x/d3.dgenies.scale*d3.dgenies.x_len;c_y=c_y/d3.dgenies.scale*d3.dgenies.y_len;let error_x=d3.dgenies.content_lines_width/d3.dgenies.scale*d3.dgenies.x_len;let error_y=d3.dgenies.content_lines_width/d3.dgenies.scale*d3.dgenies.y_len;// let error_x = 0,
 //     error_y = 0;
-let match=null;let found=false;for(let i=3;i>=0;i--){let j=0;while(!found&&j<d3.dgenies.lines[i].length){let line=d3.dgenies.lines[i][j];let x_a=Math.min(line[0],line[1]);let x_b=Math.max(line[0],line[1]);let y_a=Math.min(line[2],line[3]);let y_b=Math.max(line[2],line[3]);if(x_a<=c_x&&c_x<=x_b&&y_a<=c_y&&c_y<=y_b){let m=(y_b-y_a)/(x_b-x_a);let p=y_a-m*x_a;let y_xmouse=m*c_x+p;if(y_xmouse-error_y<=c_y&&c_y<=y_xmouse+error_y){match=line;found=true}}j++}}if(match!==null){let y_zone=match[5];let x_zone=match[6];let y_min=null;let y_max=null;if(y_zone in d3.dgenies.y_zones){let cy_min=d3.dgenies.y_zones[y_zone][0]/d3.dgenies.scale*d3.dgenies.y_len;y_min=d3.dgenies.get_human_readable_size(match[2]-cy_min,3,"&nbsp;");y_max=d3.dgenies.get_human_readable_size(match[3]-cy_min,3,"&nbsp;")}let x_min=null;let x_max=null;if(x_zone in d3.dgenies.x_zones){let cx_min=d3.dgenies.x_zones[x_zone][0]/d3.dgenies.scale*d3.dgenies.x_len;x_min=d3.dgenies.get_human_readable_size(match[0]-cx_min,3,"&nbsp;");x_max=d3.dgenies.get_human_readable_size(match[1]-cx_min,3,"&nbsp;")}return{x_zone:x_zone,y_zone:y_zone,x_match:[x_min,x_max],y_match:[y_min,y_max],idy:match[4]}}return null};if(!d3||!d3.dgenies){throw"d3.dgenies wasn't included!"}d3.dgenies.zoom={};d3.dgenies.zoom.help_timeout=null;/**
+let match=null;let found=false;for(let i=3;i>=0;i--){let j=0;while(!found&&j<d3.dgenies.lines[i].length){let line=d3.dgenies.lines[i][j];let x_a=Math.min(line[0],line[1]);let x_b=Math.max(line[0],line[1]);let y_a=Math.min(line[2],line[3]);let y_b=Math.max(line[2],line[3]);if(x_a<=c_x&&c_x<=x_b&&y_a<=c_y&&c_y<=y_b){let m=(y_b-y_a)/(x_b-x_a);let p=y_a-m*x_a;let y_xmouse=m*c_x+p;if(y_xmouse-error_y<=c_y&&c_y<=y_xmouse+error_y){match=line;found=true}}j++}}if(match!==null){let y_zone=match[5];let x_zone=match[6];let y_min=null;let y_max=null;if(y_zone in d3.dgenies.y_zones){let cy_min=d3.dgenies.y_zones[y_zone][0]/d3.dgenies.scale*d3.dgenies.y_len;y_min=d3.dgenies.get_human_readable_size(match[2]-cy_min,3,"&nbsp;");y_max=d3.dgenies.get_human_readable_size(match[3]-cy_min,3,"&nbsp;")}let x_min=null;let x_max=null;if(x_zone in d3.dgenies.x_zones){let cx_min=d3.dgenies.x_zones[x_zone][0]/d3.dgenies.scale*d3.dgenies.x_len;x_min=d3.dgenies.get_human_readable_size(match[0]-cx_min,3,"&nbsp;");x_max=d3.dgenies.get_human_readable_size(match[1]-cx_min,3,"&nbsp;")}return{x_zone:x_zone,y_zone:y_zone,x_match:[x_min,x_max],y_match:[y_min,y_max],idy:match[4]}}return null};if(!d3||!d3.dgenies){throw"d3.dgenies wasn't included!"}d3.dgenies.zoom={};d3.dgenies.zoom.help_timeout=null;d3.dgenies.zoom.details=null;d3.dgenies.zoom.details_timeout=null;d3.dgenies.zoom.details_request=0;/**
  * Initialize zoom.init module
  */d3.dgenies.zoom.init=function(){d3.dgenies.svgcontainer.on("click",d3.dgenies.zoom.click);d3.select(".drawcontainer").on("mousedown",d3.dgenies.zoom.mousedown).on("mouseup",d3.dgenies.zoom.mouseup).on("mousemove",d3.dgenies.zoom.translate);d3.dgenies.svgcontainer.on("wheel",d3.dgenies.zoom.zoom)};/**
  * Click event action
@@ -407,7 +425,7 @@ let match=null;let found=false;for(let i=3;i>=0;i--){let j=0;while(!found&&j<d3.
  * Translate event action
  */d3.dgenies.zoom.translate=function(){let rect=$("g.container")[0].getBoundingClientRect();let posX=d3.dgenies.posX,posY=d3.dgenies.posY,width_c=rect.width,height_c=rect.height;let cursor_x=(d3.event.pageX-posX)/width_c*d3.dgenies.scale,cursor_y=(d3.event.pageY-posY)/height_c*d3.dgenies.scale;if(d3.dgenies.translate_start!==null&&d3.event.ctrlKey){let old_transform=d3.dgenies.container.attr("transform");//let scale = 1;
 let scale_x=1;let scale_y=1;if(old_transform){let scale=old_transform.match(/scale\(([-\d.]+)(,\s*([-\d.]+))?\)/);scale_x=scale[1];scale_y=scale[1];if(scale[3]!==undefined)scale_y=scale[3]}let translate=[d3.dgenies.old_translate[0]+(cursor_x-d3.dgenies.translate_start[0])*scale_x,d3.dgenies.old_translate[1]+(cursor_y-d3.dgenies.translate_start[1])*scale_y];let min_tr=[d3.dgenies.scale-0.2*d3.dgenies.scale,d3.dgenies.scale-0.2*d3.dgenies.scale];let max_tr=[-d3.dgenies.scale*scale_x+200,-d3.dgenies.scale*scale_x+200];if(translate[0]<max_tr[0]){translate[0]=max_tr[0]}else if(translate[0]>min_tr[0]){translate[0]=min_tr[0]}if(translate[1]<max_tr[1]){translate[1]=max_tr[1]}else if(translate[1]>min_tr[1]){translate[1]=min_tr[1]}let new_transform=`translate(${translate[0]}, ${translate[1]}) scale(${scale_x}, ${scale_y})`;d3.dgenies.container.attr("transform",new_transform);if(translate[0]!==0||translate[1]!==0){$("#restore-all").show()}else{$("#restore-all").hide()}//Update axis:
-d3.dgenies.draw_top_axis();d3.dgenies.draw_right_axis();d3.dgenies.zoom_bottom_axis();d3.dgenies.zoom_left_axis()}else if(d3.dgenies.translate_start!==null){let help_trans=$("#help-trans");help_trans.fadeIn("slow")}};/**
+d3.dgenies.draw_top_axis();d3.dgenies.draw_right_axis();d3.dgenies.zoom_bottom_axis();d3.dgenies.zoom_left_axis();d3.dgenies.zoom.load_visible_details()}else if(d3.dgenies.translate_start!==null){let help_trans=$("#help-trans");help_trans.fadeIn("slow")}};/**
  * Get cursor position
  *
  * @param {DOMRect} rect if given, dont get it from DOM
@@ -417,7 +435,31 @@ d3.dgenies.draw_top_axis();d3.dgenies.draw_right_axis();d3.dgenies.zoom_bottom_a
  * Zoom staff
  */d3.dgenies.zoom.zoom=function(){if(d3.event.ctrlKey){d3.event.preventDefault();d3.dgenies.mousetip.hide();if(d3.dgenies.zoom_enabled){let cursor=d3.dgenies.zoom._cursor_pos();let zoom_f=1.2;let old_transform=d3.dgenies.container.attr("transform");if(old_transform!==null){let search_tr=old_transform.match(/translate\(([-\de.]+),\s*([-\de.]+)\)/);let search_sc=old_transform.match(/scale\(([-\de.]+)(,\s*[-\de.]+)?\)/);old_transform={"scale":parseFloat(search_sc[1]),"translate":[parseFloat(search_tr[1]),parseFloat(search_tr[2])]}}else{old_transform={"scale":1,"translate":[0,0]}}let new_scale;let new_rect=cursor[2];if(d3.event.deltaY<0){new_scale=old_transform["scale"]*zoom_f;new_rect["width"]*=zoom_f;new_rect["height"]*=zoom_f}else{new_scale=old_transform["scale"]/zoom_f;let scale_ratio=zoom_f;if(new_scale<1){new_scale=1;scale_ratio=old_transform["scale"]}new_rect["width"]/=scale_ratio;new_rect["height"]/=scale_ratio}new_rect["bottom"]=new_rect["y"]+new_rect["height"];new_rect["right"]=new_rect["x"]+new_rect["width"];let new_cursor=d3.dgenies.zoom._cursor_pos(new_rect);let x_trans=(new_cursor[0]-cursor[0])*new_scale;let y_trans=(new_cursor[1]-cursor[1])*new_scale;let translate_x=old_transform["translate"][0]+x_trans;let translate_y=old_transform["translate"][1]-y_trans;let new_transform=`translate(${translate_x},${translate_y}) scale(${new_scale})`;d3.dgenies.container.attr("transform",new_transform);d3.dgenies.zoom_scale_lines=new_scale;d3.dgenies.zoom._cursor_pos();//Correct lines stroke width to be not impacted by the zoom:
 d3.selectAll("path.content-lines").attr("stroke-width",d3.dgenies.content_lines_width/new_scale);d3.selectAll("line.break-lines").attr("stroke-width",d3.dgenies.break_lines_width/new_scale);//Update axis:
-d3.dgenies.draw_top_axis();d3.dgenies.draw_right_axis();d3.dgenies.zoom_bottom_axis();d3.dgenies.zoom_left_axis();if(translate_x<=0.00001&&translate_x>=-0.00001&&translate_y<=0.00001&&translate_y>=-0.00001&&new_scale===1){$("#restore-all").hide()}else{$("#restore-all").show()}}}else if(d3.dgenies.zoom_enabled){let help_zoom=$("#help-zoom");help_zoom.fadeIn("slow");if(d3.dgenies.zoom.help_timeout!==null){window.clearTimeout(d3.dgenies.zoom.help_timeout)}d3.dgenies.zoom.help_timeout=window.setTimeout(()=>{help_zoom.fadeOut("slow")},700)}};/**
+d3.dgenies.draw_top_axis();d3.dgenies.draw_right_axis();d3.dgenies.zoom_bottom_axis();d3.dgenies.zoom_left_axis();if(translate_x<=0.00001&&translate_x>=-0.00001&&translate_y<=0.00001&&translate_y>=-0.00001&&new_scale===1){$("#restore-all").hide()}else{$("#restore-all").show()}d3.dgenies.zoom.load_visible_details()}}else if(d3.dgenies.zoom_enabled){let help_zoom=$("#help-zoom");help_zoom.fadeIn("slow");if(d3.dgenies.zoom.help_timeout!==null){window.clearTimeout(d3.dgenies.zoom.help_timeout)}d3.dgenies.zoom.help_timeout=window.setTimeout(()=>{help_zoom.fadeOut("slow")},700)}};/**
+ * Remove matches loaded for the zoomed window, and cancel pending loads
+ */d3.dgenies.zoom.remove_details=function(){window.clearTimeout(d3.dgenies.zoom.details_timeout);d3.dgenies.zoom.details_request++;d3.dgenies.zoom.details=null;$("path.detail-lines").remove()};/**
+ * Load best matches of a window, to show details when zoomed in. Only done if some matches were not loaded with the
+ * whole dot plot. Calls are delayed, so only the last window of a series of zoom/translate events is loaded.
+ *
+ * @param {number} x_min window start on X axis (target, Bp)
+ * @param {number} x_max window end on X axis (target, Bp)
+ * @param {number} y_min window start on Y axis (query, Bp)
+ * @param {number} y_max window end on Y axis (query, Bp)
+ */d3.dgenies.zoom.load_details=function(x_min,x_max,y_min,y_max){d3.dgenies.zoom.__load_details("get_graph_zone",{x_min:Math.floor(x_min),x_max:Math.ceil(x_max),y_min:Math.floor(y_min),y_max:Math.ceil(y_max)})};/**
+ * Load best matches between a target chromosome and a query contig, to show details of a selected zone (see
+ * load_details). Matches are found on the server with the contig pair query of the match index
+ *
+ * @param {string} x_zone target chromosome
+ * @param {string} y_zone query contig
+ */d3.dgenies.zoom.load_pair_details=function(x_zone,y_zone){d3.dgenies.zoom.__load_details("get_graph_pair",{target:x_zone,query:y_zone})};/**
+ * Load best matches from the server and draw them (see load_details)
+ *
+ * @param {string} url url to call (the job id is appended)
+ * @param {object} data data to send, in addition to the size of the drawing area and the noise option
+ */d3.dgenies.zoom.__load_details=function(url,data){if(!d3.dgenies.sampled||dgenies.result===undefined||!dgenies.result.id_res){return}window.clearTimeout(d3.dgenies.zoom.details_timeout);let request=++d3.dgenies.zoom.details_request;d3.dgenies.zoom.details_timeout=window.setTimeout(()=>{let rect=d3.dgenies.svgcontainer.node().getBoundingClientRect();dgenies.post(`/${url}/${dgenies.result.id_res}`,Object.assign({},data,{pixels:Math.round(Math.max(rect.width,rect.height)),noise:dgenies.noise?1:0}),function(data){if(data["success"]&&request===d3.dgenies.zoom.details_request){d3.dgenies.zoom.details=data["lines"];$("path.detail-lines").remove();for(let i=0;i<4;i++){d3.dgenies.__draw_idy_lines(i.toString(),d3.dgenies.zoom.details,d3.dgenies.x_len,d3.dgenies.y_len,"detail-lines")}d3.dgenies.events.filter_size(d3.dgenies.min_size)}})},300)};/**
+ * Load best matches of the visible window (see load_details), based on the current transform of the container
+ */d3.dgenies.zoom.load_visible_details=function(){let transform=d3.dgenies.container.attr("transform");let search_tr=transform!==null?transform.match(/translate\(([-\de.]+),\s*([-\de.]+)\)/):null;let search_sc=transform!==null?transform.match(/scale\(([-\de.]+)(,\s*([-\de.]+))?\)/):null;if(search_tr===null||search_sc===null){return}let tr_x=parseFloat(search_tr[1]),tr_y=parseFloat(search_tr[2]),scale_x=parseFloat(search_sc[1]),scale_y=search_sc[3]!==undefined?parseFloat(search_sc[3]):scale_x;if(scale_x<=1&&scale_y<=1){d3.dgenies.zoom.remove_details();return}//Visible part of the container, in container units (Y axis goes down):
+let x_start=Math.max(-tr_x/scale_x,0),x_end=Math.min((d3.dgenies.scale-tr_x)/scale_x,d3.dgenies.scale),y_start=Math.max(-tr_y/scale_y,0),y_end=Math.min((d3.dgenies.scale-tr_y)/scale_y,d3.dgenies.scale);d3.dgenies.zoom.load_details(x_start/d3.dgenies.scale*d3.dgenies.x_len,x_end/d3.dgenies.scale*d3.dgenies.x_len,(d3.dgenies.scale-y_end)/d3.dgenies.scale*d3.dgenies.y_len,(d3.dgenies.scale-y_start)/d3.dgenies.scale*d3.dgenies.y_len)};/**
  * Restore previous scale
  *
  * @param transform: transform object
@@ -429,7 +471,7 @@ d3.dgenies.draw_top_axis();d3.dgenies.draw_right_axis();d3.dgenies.zoom_bottom_a
  * @param {boolean} force do it even if events are disabled
  * @returns {boolean} true if done, else false
  */d3.dgenies.zoom.reset_scale=function(temp=false,after=null,force=true){if(!d3.dgenies.all_disabled||force){dgenies.show_loading();window.setTimeout(()=>{//Reset scale:
-d3.dgenies.container.attr("transform","scale(1,1)translate(0,0)");d3.dgenies.zoom_scale_lines=1;//Restore lines stroke width:
+d3.dgenies.container.attr("transform","scale(1,1)translate(0,0)");d3.dgenies.zoom_scale_lines=1;d3.dgenies.zoom.remove_details();//Restore lines stroke width:
 d3.selectAll("path.content-lines").attr("stroke-width",d3.dgenies.content_lines_width);if(d3.dgenies.break_lines_show){d3.selectAll("line.break-lines").style("visibility","visible");d3.selectAll("line.break-lines").attr("stroke-width",d3.dgenies.break_lines_width)}//Update left and bottom axis:
 d3.dgenies.draw_left_axis(d3.dgenies.y_len);d3.dgenies.draw_bottom_axis(d3.dgenies.x_len);//Update top and right axis:
 d3.dgenies.draw_top_axis();d3.dgenies.draw_right_axis();if(!temp)d3.dgenies.zone_selected=false;dgenies.hide_loading();//Re-enable zoom:
@@ -22,7 +22,7 @@ dgenies.result.controls.init = function () {
 dgenies.result.controls.summary = function () {
     dgenies.show_loading("Building...");
     window.setTimeout(() => {
-        dgenies.post(`/summary/${dgenies.result.id_res}`,
+        dgenies.get(`/summary/${dgenies.result.id_res}`,
             {},
             function (data) {
                 dgenies.hide_loading();
@@ -49,7 +49,7 @@ dgenies.result.controls.launch_sort_contigs = function () {
     window.setTimeout(() => {
         dgenies.show_loading("Building...");
         window.setTimeout(() => {
-            dgenies.post(`/sort/${dgenies.result.id_res}`,
+            d3.dgenies.request_graph(`/sort/${dgenies.result.id_res}`,
                 {},
                 function (data) {
                     if (data["success"]) {
@@ -77,7 +77,7 @@ dgenies.result.controls.reset_sort_contig = function () {
     window.setTimeout(() => {
         dgenies.show_loading("Building...");
         window.setTimeout(() => {
-            dgenies.post(`/reset-sort/${dgenies.result.id_res}`,
+            d3.dgenies.request_graph(`/reset-sort/${dgenies.result.id_res}`,
                 {},
                 function (data) {
                     if (data["success"]) {
@@ -105,7 +105,7 @@ dgenies.result.controls.launch_reverse_contig = function () {
         window.setTimeout(() => {
             dgenies.show_loading("Building...");
             window.setTimeout(() => {
-                dgenies.post(`/reverse-contig/${dgenies.result.id_res}`,
+                d3.dgenies.request_graph(`/reverse-contig/${dgenies.result.id_res}`,
                     {"contig": d3.dgenies.query_selected},
                     function (data) {
                         if (data["success"]) {
@@ -136,7 +136,7 @@ dgenies.result.controls.launch_hide_noise = function () {
     window.setTimeout(() => {
         dgenies.show_loading("Building...");
         window.setTimeout(() => {
-            dgenies.post(`/freenoise/${dgenies.result.id_res}`,
+            d3.dgenies.request_graph(`/freenoise/${dgenies.result.id_res}`,
                 {noise: dgenies.noise ? 0 : 1},
                 function (data) {
                     if (data["success"]) {
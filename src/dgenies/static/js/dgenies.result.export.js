@@ -265,7 +265,7 @@ dgenies.result.export.export_query_as_reference_fasta_standalone = function () {
 dgenies.result.export.export_offline_viewer = function() {
     dgenies.show_loading("Building file...", 180);
     window.setTimeout(() => {
-        dgenies.post(`/summary/${dgenies.result.id_res}`,
+        dgenies.get(`/summary/${dgenies.result.id_res}`,
             {},
             function (data) {
                 dgenies.hide_loading();
@@ -15,6 +15,8 @@ from markupsafe import Markup
 from werkzeug.utils import secure_filename
 from pathlib import Path
 from dgenies.lib.paf import Paf
+from dgenies.lib.match_store import MatchStore
+from dgenies.lib.artifacts import Artifacts
 from dgenies.lib.job_manager import JobManager
 from dgenies.lib.functions import Functions
 from dgenies.allowed_extensions import AllowedExtensions
@@ -714,38 +716,164 @@ def download_paf(id_res):
     :param id_res: job id
     :type id_res: str
     """
-    map_file = os.path.join(APP_DATA, id_res, "map.paf.sorted")
-    if not os.path.exists(map_file):
-        map_file = os.path.join(APP_DATA, id_res, "map.paf")
+    map_file = os.path.join(APP_DATA, id_res, "map.paf")
     if not os.path.exists(map_file):
         abort(404)
+    idx_sorted = os.path.join(APP_DATA, id_res, "query.idx.sorted")
+    if os.path.exists(os.path.join(APP_DATA, id_res, ".sorted")) and os.path.exists(idx_sorted):
+        # Orientation of query contigs is only stored in the sorted index:
+        return Response(Paf.iter_oriented_paf(map_file, idx_sorted), mimetype="text/plain")
     content = get_file(map_file)
     return Response(content, mimetype="text/plain")
 
 
+def artifact_response(artifacts, name, meta):
+    """
+    Build response from a pre-computed artifact of a job. Answer 304 if the client already has it (If-None-Match),
+    else send it with the best content encoding accepted by the client. Each encoding is a different representation,
+    so it has its own ETag: the hash of the content, followed by the encoding (none for the identity)
+
+    :param artifacts: artifacts of the job
+    :type artifacts: Artifacts
+    :param name: artifact name
+    :type name: str
+    :param meta: meta data of the artifact (see :func:`dgenies.lib.artifacts.Artifacts.get`)
+    :type meta: dict
+    :return: flask response
+    :rtype: Response
+    """
+    etags = [meta["etag"]] + ["%s-%s" % (meta["etag"], encoding) for encoding in meta["encodings"]]
+    cached = [etag for etag in etags if request.if_none_match.contains(etag)]
+    if len(cached) > 0:
+        response = Response(status=304)
+        response.set_etag(cached[0])
+    else:
+        encoding = request.accept_encodings.best_match(meta["encodings"])
+        response = Response(artifacts.read(name, encoding), mimetype=meta["mimetype"])
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+            response.set_etag("%s-%s" % (meta["etag"], encoding))
+        else:
+            response.set_etag(meta["etag"])
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
 # Get graph (ajax request)
-@app.route('/get_graph', methods=['POST'])
+def dot_plot_response(paf):
+    """
+    Build response with dot plot data of a parsed PAF: JSON, or binary if asked by the client (format=binary)
+
+    :param paf: parsed PAF object
+    :type paf: Paf
+    :return: flask response
+    :rtype: Response
+    """
+    if request.values.get("format") == "binary":
+        return Response(paf.get_d3js_binary_data(), mimetype="application/octet-stream")
+    res = paf.get_d3js_data()
+    res["success"] = True
+    return jsonify(res)
+
+
+@app.route('/get_graph', methods=['GET', 'POST'])
 def get_graph():
     """
-    Get dot plot data for a job
+    Get dot plot data for a job. Served from the pre-computed artifact of the job if it is up to date, else the
+    artifact is built
     """
-    id_f = request.form["id"]
+    id_f = request.values["id"]
     paf = os.path.join(APP_DATA, id_f, "map.paf")
     idx1 = os.path.join(APP_DATA, id_f, "query.idx")
     idx2 = os.path.join(APP_DATA, id_f, "target.idx")
 
-    paf = Paf(paf, idx1, idx2)
+    artifacts = Artifacts(os.path.join(APP_DATA, id_f))
+    if request.values.get("format") == "binary":
+        name, mimetype = "graph.bin", "application/octet-stream"
+    else:
+        name, mimetype = "graph", "application/json"
+    meta = artifacts.get(name)
+    if meta is None:
+        paf = Paf.load(paf, idx1, idx2, id_f)
+        if not paf.parsed:
+            return jsonify({"success": False, "message": paf.error})
+        if name == "graph.bin":
+            content = paf.get_d3js_binary_data()
+        else:
+            res = paf.get_d3js_data()
+            res["success"] = True
+            content = json.dumps(res).encode("utf-8")
+        artifacts.save(name, content, mimetype)
+        meta = artifacts.get(name)
+        if meta is None:  # Job files changed in the meantime
+            return Response(content, mimetype=mimetype)
+
+    valid = os.path.join(APP_DATA, id_f, ".valid")
+    if not os.path.exists(valid):
+        Path(valid).touch()
+    return artifact_response(artifacts, name, meta)
+
 
+@app.route('/get_graph_zone/<id_res>', methods=['POST'])
+def get_graph_zone(id_res):
+    """
+    Get best matches inside a window of the dot plot (zoom details)
+
+    :param id_res: job id
+    :type id_res: str
+    """
+    paf_file = os.path.join(APP_DATA, id_res, "map.paf")
+    idx1 = os.path.join(APP_DATA, id_res, "query.idx")
+    idx2 = os.path.join(APP_DATA, id_res, "target.idx")
+    try:
+        x_min, x_max, y_min, y_max = (float(request.form[k]) for k in ("x_min", "x_max", "y_min", "y_max"))
+        pixels = int(request.form["pixels"])
+    except (KeyError, ValueError):
+        return jsonify({"success": False, "message": "Invalid window"})
+    paf = Paf.load(paf_file, idx1, idx2, id_res, noise=request.form.get("noise", "1") == "1")
     if paf.parsed:
-        valid = os.path.join(APP_DATA, id_f, ".valid")
-        if not os.path.exists(valid):
-            Path(valid).touch()
-        res = paf.get_d3js_data()
+        res = paf.get_zone_data(x_min, x_max, y_min, y_max, pixels)
+        res["success"] = True
+        return jsonify(res)
+    return jsonify({"success": False, "message": paf.error})
+
+
+@app.route('/get_graph_pair/<id_res>', methods=['POST'])
+def get_graph_pair(id_res):
+    """
+    Get best matches between a query contig and a target contig (details of a selected zone)
+
+    :param id_res: job id
+    :type id_res: str
+    """
+    paf_file = os.path.join(APP_DATA, id_res, "map.paf")
+    idx1 = os.path.join(APP_DATA, id_res, "query.idx")
+    idx2 = os.path.join(APP_DATA, id_res, "target.idx")
+    try:
+        query = request.form["query"]
+        target = request.form["target"]
+        pixels = int(request.form["pixels"])
+    except (KeyError, ValueError):
+        return jsonify({"success": False, "message": "Invalid contigs pair"})
+    paf = Paf.load(paf_file, idx1, idx2, id_res, noise=request.form.get("noise", "1") == "1")
+    if paf.parsed:
+        res = paf.get_contigs_pair_matches(query, target, pixels)
         res["success"] = True
         return jsonify(res)
     return jsonify({"success": False, "message": paf.error})
 
 
+@app.route('/stats/paf-cache', methods=['GET'])
+def paf_cache_stats():
+    """
+    Get counters of the parsed PAF cache of this process. Only served to IPs allowed in config (paf_cache_stats_ips)
+    """
+    if request.remote_addr not in config_reader.paf_cache_stats_ips:
+        abort(404)
+    return jsonify(Paf.cache.get_stats())
+
+
 @app.route('/sort/<id_res>', methods=['POST'])
 def sort_graph(id_res):
     """
@@ -758,12 +886,11 @@ def sort_graph(id_res):
         paf_file = os.path.join(APP_DATA, id_res, "map.paf")
         idx1 = os.path.join(APP_DATA, id_res, "query.idx")
         idx2 = os.path.join(APP_DATA, id_res, "target.idx")
+        Paf.cache.invalidate(id_res)
         paf = Paf(paf_file, idx1, idx2, False)
         paf.sort()
         if paf.parsed:
-            res = paf.get_d3js_data()
-            res["success"] = True
-            return jsonify(res)
+            return dot_plot_response(paf)
         return jsonify({"success": False, "message": paf.error})
     return jsonify({"success": False, "message": "Sort is not available for All-vs-All mode"})
 
@@ -776,23 +903,23 @@ def reset_sort(id_res):
     :param id_res: job id
     :type id_res: str
     """
-    to_remove = [".sorted", "map.paf.sorted", "query.idx.sorted"]
+    to_remove = [".sorted", "map.paf.sorted", "query.idx.sorted", "map.paf.assoc"]
     for f in to_remove:
         if os.path.exists(os.path.join(APP_DATA, id_res, f)):
             os.remove(os.path.join(APP_DATA, id_res, f))
+    MatchStore.remove(os.path.join(APP_DATA, id_res, "map.paf.sorted"))
+    Paf.cache.invalidate(id_res)
 
     paf = os.path.join(APP_DATA, id_res, "map.paf")
     idx1 = os.path.join(APP_DATA, id_res, "query.idx")
     idx2 = os.path.join(APP_DATA, id_res, "target.idx")
 
-    paf = Paf(paf, idx1, idx2)
+    paf = Paf.load(paf, idx1, idx2, id_res)
     # Force refresh the sorted query file.
     Path(os.path.join(APP_DATA, id_res, ".new-reversals")).touch()
 
     if paf.parsed:
-        res = paf.get_d3js_data()
-        res["success"] = True
-        return jsonify(res)
+        return dot_plot_response(paf)
     return jsonify({"success": False, "message": paf.error})
 
 
@@ -809,13 +936,12 @@ def reverse_contig(id_res):
         paf_file = os.path.join(APP_DATA, id_res, "map.paf")
         idx1 = os.path.join(APP_DATA, id_res, "query.idx")
         idx2 = os.path.join(APP_DATA, id_res, "target.idx")
+        Paf.cache.invalidate(id_res)
         paf = Paf(paf_file, idx1, idx2, False)
         Path(os.path.join(APP_DATA, id_res, ".new-reversals")).touch()
         paf.reverse_contig(contig_name)
         if paf.parsed:
-            res = paf.get_d3js_data()
-            res["success"] = True
-            return jsonify(res)
+            return dot_plot_response(paf)
         return jsonify({"success": False, "message": paf.error})
     return jsonify({"success": False, "message": "Sort is not available for All-vs-All mode"})
 
@@ -831,12 +957,9 @@ def free_noise(id_res):
     paf_file = os.path.join(APP_DATA, id_res, "map.paf")
     idx1 = os.path.join(APP_DATA, id_res, "query.idx")
     idx2 = os.path.join(APP_DATA, id_res, "target.idx")
-    paf = Paf(paf_file, idx1, idx2, False)
-    paf.parse_paf(noise=request.form["noise"] == "1")
+    paf = Paf.load(paf_file, idx1, idx2, id_res, noise=request.form["noise"] == "1")
     if paf.parsed:
-        res = paf.get_d3js_data()
-        res["success"] = True
-        return jsonify(res)
+        return dot_plot_response(paf)
     return jsonify({"success": False, "message": paf.error})
 
 
@@ -939,8 +1062,8 @@ def build_query_as_reference(id_res):
     paf_file = os.path.join(APP_DATA, id_res, "map.paf")
     idx1 = os.path.join(APP_DATA, id_res, "query.idx")
     idx2 = os.path.join(APP_DATA, id_res, "target.idx")
+    # PAF file is parsed only if the query/target association was not saved when contigs were sorted:
     paf = Paf(paf_file, idx1, idx2, False, mailer=mailer, id_job=id_res)
-    paf.parse_paf(False, True)
     if MODE == "webserver":
         thread = threading.Timer(0, paf.build_query_chr_as_reference, kwargs={"compress": True})
         thread.start()
@@ -1036,17 +1159,25 @@ def qt_assoc(id_res):
     """
     res_dir = os.path.join(APP_DATA, id_res)
     if os.path.exists(res_dir) and os.path.isdir(res_dir):
+        artifacts = Artifacts(res_dir)
+        meta = artifacts.get("qt-assoc")
+        if meta is not None:
+            return artifact_response(artifacts, "qt-assoc", meta)
         paf_file = os.path.join(APP_DATA, id_res, "map.paf")
         idx1 = os.path.join(APP_DATA, id_res, "query.idx")
         idx2 = os.path.join(APP_DATA, id_res, "target.idx")
         try:
-            paf = Paf(paf_file, idx1, idx2, False)
-            paf.parse_paf(False)
+            paf = Paf.load(paf_file, idx1, idx2, id_res, merge_index=False)
         except FileNotFoundError:
             print("Unable to load data!")
             abort(404)
             return False
         csv_content = paf.build_query_on_target_association_file()
+        if paf.parsed:
+            artifacts.save("qt-assoc", csv_content.encode("utf-8"), "text/plain")
+            meta = artifacts.get("qt-assoc")
+            if meta is not None:
+                return artifact_response(artifacts, "qt-assoc", meta)
         return Response(csv_content, mimetype="text/plain")
     abort(404)
 
@@ -1079,7 +1210,7 @@ def no_assoc(id_res):
     abort(404)
 
 
-@app.route('/summary/<id_res>', methods=['POST'])
+@app.route('/summary/<id_res>', methods=['GET', 'POST'])
 def summary(id_res):
     """
     Get Dot plot summary data
@@ -1087,6 +1218,10 @@ def summary(id_res):
     :param id_res: job id
     :type id_res: str
     """
+    artifacts = Artifacts(os.path.join(APP_DATA, id_res))
+    meta = artifacts.get("summary")
+    if meta is not None:
+        return artifact_response(artifacts, "summary", meta)
     paf_file = os.path.join(APP_DATA, id_res, "map.paf")
     idx1 = os.path.join(APP_DATA, id_res, "query.idx")
     idx2 = os.path.join(APP_DATA, id_res, "target.idx")
@@ -1105,9 +1240,13 @@ def summary(id_res):
         if not os.path.exists(fail_file):  # The job has not started yet or has successfully ended
             percents = paf.get_summary_stats()
             if percents is None:  # The job has not started yet
-                Path(status_file).touch()
-                thread = threading.Timer(0, paf.build_summary_stats, kwargs={"status_file": status_file})
-                thread.start()
+                try:
+                    open(status_file, "x").close()
+                except FileExistsError:  # Built at the same time by the job (see Artifacts.build)
+                    pass
+                else:
+                    thread = threading.Timer(0, paf.build_summary_stats, kwargs={"status_file": status_file})
+                    thread.start()
             else:  # The job has successfully ended
                 s_status = "done"
         else:  # The job has failed
@@ -1131,6 +1270,12 @@ def summary(id_res):
             "success": False,
             "message": "Build of summary failed. Please contact us to report the bug"
         })
+    if s_status == "done":
+        artifacts.save("summary", json.dumps({"success": True, "percents": percents, "status": s_status})
+                       .encode("utf-8"), "application/json")
+        meta = artifacts.get("summary")
+        if meta is not None:
+            return artifact_response(artifacts, "summary", meta)
     return jsonify({
         "success": True,
         "percents": percents,
@@ -1228,7 +1373,7 @@ def get_viewer_html(id_res):
     idx1 = os.path.join(APP_DATA, id_res, "query.idx")
     idx2 = os.path.join(APP_DATA, id_res, "target.idx")
 
-    paf = Paf(paf, idx1, idx2)
+    paf = Paf.load(paf, idx1, idx2, id_res)
 
     if paf.parsed:
         res = paf.get_d3js_data()
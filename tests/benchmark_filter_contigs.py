@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark the choice of contigs to filter out (Filter.check_filter) on synthetic indexes of highly fragmented
+assemblies
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from dgenies.bin.filter_contigs import Filter
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the filter of contigs on synthetic indexes")
+    parser.add_argument('-n', '--nb-contigs', type=int, required=False, default=1000000,
+                        help="Number of contigs of the largest index")
+    parser.add_argument('-r', '--runs', type=int, required=False, default=4,
+                        help="Number of index sizes to test (the number of contigs is halved at each run)")
+    parser.add_argument('-s', '--seed', type=int, required=False, default=42, help="Random seed")
+
+    return parser.parse_args()
+
+
+def write_index(index_file, nb_contigs, split, rng):
+    """
+    Write a synthetic index: a few large scaffolds and a long tail of small contigs. In split mode, large scaffolds
+    are split in parts of 10 Mb
+
+    :param index_file: index file path
+    :param nb_contigs: number of contigs
+    :param split: if True, split large scaffolds
+    :param rng: random generator
+    """
+    with open(index_file, "w") as idx:
+        idx.write("synthetic\n")
+        for i in range(nb_contigs):
+            if i < nb_contigs // 1000:
+                length = rng.randint(20000000, 60000000)
+            else:
+                length = rng.randint(200, 20000)
+            if split and length > 10000000:
+                part = 1
+                while length > 0:
+                    idx.write("scaffold%d_###_%d\t%d\n" % (i, part, min(length, 10000000)))
+                    length -= 10000000
+                    part += 1
+            else:
+                idx.write("scaffold%d\t%d\n" % (i, length))
+
+
+def run(nb_contigs, split, rng):
+    """
+    Run the filter of contigs on a synthetic index
+
+    :param nb_contigs: number of contigs
+    :param split: if True, contigs are split
+    :param rng: random generator
+    :return: time of the filter (seconds), number of contigs filtered out
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_file = os.path.join(tmp_dir, "query.idx")
+        write_index(index_file, nb_contigs, split, rng)
+        filter_f = Filter(fasta=os.path.join(tmp_dir, "query.fasta"),
+                          index_file=index_file,
+                          type_f="query",
+                          min_filtered=round(nb_contigs / 4),
+                          split=split)
+        start = time.time()
+        f_outs = filter_f.check_filter()
+        return time.time() - start, len(f_outs)
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    sizes = sorted(max(args.nb_contigs >> i, 1) for i in range(args.runs))
+    print("%-8s %10s %10s %14s %10s" % ("mode", "contigs", "time (s)", "us / contig", "removed"))
+    for split in (False, True):
+        for nb_contigs in sizes:
+            duration, nb_removed = run(nb_contigs, split, rng)
+            print("%-8s %10d %10.2f %14.2f %10d" % ("split" if split else "default", nb_contigs, duration,
+                                                     duration / nb_contigs * 1000000, nb_removed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Check the MAF parser (parsers.maf) against the former Biopython converter on a synthetic MAF file with lowercase
+bases, gaps and dots, and time both of them
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from dgenies.lib import parsers
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check and benchmark the MAF parser on a synthetic MAF file")
+    parser.add_argument('-n', '--nb-blocks', type=int, required=False, default=5000,
+                        help="Number of alignment blocks")
+    parser.add_argument('-l', '--max-length', type=int, required=False, default=2000,
+                        help="Max length of alignment blocks")
+    parser.add_argument('-s', '--seed', type=int, required=False, default=42, help="Random seed")
+
+    return parser.parse_args()
+
+
+def random_block(length, rng):
+    """
+    Build a random pair of aligned sequences: lowercase and uppercase bases, gaps in both sequences, and dots (same
+    base as the target) in the query
+
+    :param length: alignment length
+    :param rng: random generator
+    :return: target and query aligned sequences
+    """
+    target = []
+    query = []
+    for _ in range(length):
+        t_base = rng.choice("ACGTacgtN")
+        q_base = t_base if rng.random() < 0.7 else rng.choice("ACGTacgtN")
+        if rng.random() < 0.2:
+            q_base = q_base.swapcase()
+        draw = rng.random()
+        if draw < 0.05:
+            t_base = "-"
+        elif draw < 0.1:
+            q_base = "-"
+        elif draw < 0.12:
+            t_base = q_base = "-"
+        elif draw < 0.2:
+            q_base = "."
+        target.append(t_base)
+        query.append(q_base)
+    return "".join(target), "".join(query)
+
+
+def write_maf(raw_maf, normalized_maf, nb_blocks, max_length, rng):
+    """
+    Write a synthetic MAF file, and the same file normalized for the former converter: dots replaced by the target
+    base, bases uppercased and columns with a gap in both sequences removed (the former converter compared bases
+    case-sensitively and counted gap/gap columns as matches)
+
+    :param raw_maf: raw MAF file path
+    :param normalized_maf: normalized MAF file path
+    :param nb_blocks: number of blocks
+    :param max_length: max length of blocks
+    :param rng: random generator
+    """
+    with open(raw_maf, "w") as raw, open(normalized_maf, "w") as norm:
+        for out in raw, norm:
+            out.write("##maf version=1 scoring=synthetic\n\n")
+        for i in range(nb_blocks):
+            target, query = random_block(rng.randint(1, max_length), rng)
+            columns = [(t, t if q == "." else q) for t, q in zip(target, query)]
+            columns = [(t.upper(), q.upper()) for t, q in columns if t != "-" or q != "-"]
+            n_target = "".join([t for t, q in columns])
+            n_query = "".join([q for t, q in columns])
+            t_size = len(target) - target.count("-")
+            q_size = len(query) - query.count("-")
+            t_len = t_size + rng.randint(0, 100000)
+            q_len = q_size + rng.randint(0, 100000)
+            t_start = rng.randint(0, t_len - t_size)
+            q_start = rng.randint(0, q_len - q_size)
+            t_strand = rng.choice("+-")
+            q_strand = rng.choice("+-")
+            for out, (t_seq, q_seq) in ((raw, (target, query)), (norm, (n_target, n_query))):
+                out.write("a score=%d\n" % i)
+                out.write("s target%d %d %d %s %d %s\n" % (i % 10, t_start, t_size, t_strand, t_len, t_seq))
+                out.write("s query%d %d %d %s %d %s\n" % (i % 7, q_start, q_size, q_strand, q_len, q_seq))
+                out.write("\n")
+
+
+def former_maf(in_maf, out_paf):
+    """
+    Former MAF converter, based on Biopython
+
+    :param in_maf: input maf file path
+    :param out_paf: output paf file path
+    """
+    from Bio import AlignIO
+
+    with open(out_paf, "w") as paf:
+        for grp in AlignIO.parse(in_maf, "maf"):
+            seqs = [seq for seq in grp]
+            matches = 0
+            for i in range(0, len(seqs[0])):
+                if seqs[0][i] == seqs[1][i]:
+                    matches += 1
+            tannots = seqs[0].annotations
+            qannots = seqs[1].annotations
+            tlen = tannots["srcSize"]
+            tstart = tannots["start"]
+            tend = tstart + tannots["size"]
+            if tannots["strand"] == -1:
+                tstart = tlen - tstart
+                tend = tlen - tend
+            qlen = qannots["srcSize"]
+            qstart = qannots["start"]
+            qend = qannots["start"] + qannots["size"]
+            if qannots["strand"] == -1:
+                qstart = qlen - qstart
+                qend = qlen - qend
+            strand = "+" if tannots["strand"] == qannots["strand"] else "-"
+            paf.write("{qname}\t{qlen}\t{qstart}\t{qend}\t{strand}\t{tname}\t{tlen}\t{tstart}\t{tend}\t{matches}\t"
+                      "{block_len}\t255\n".format(
+                        tname=seqs[0].id,
+                        tlen=tlen,
+                        tstart=tstart,
+                        tend=tend,
+                        qname=seqs[1].id,
+                        qlen=qlen,
+                        qstart=qstart if strand == "+" else qend,
+                        qend=qend if strand == "+" else qstart,
+                        strand=strand,
+                        matches=matches,
+                        block_len=tannots["size"]
+                      ))
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    tmp_dir = tempfile.mkdtemp(prefix="benchmark_maf_")
+    try:
+        raw_maf = os.path.join(tmp_dir, "raw.maf")
+        normalized_maf = os.path.join(tmp_dir, "normalized.maf")
+        write_maf(raw_maf, normalized_maf, args.nb_blocks, args.max_length, rng)
+
+        former_paf = os.path.join(tmp_dir, "former.paf")
+        start = time.time()
+        former_maf(normalized_maf, former_paf)
+        former_time = time.time() - start
+
+        new_paf = os.path.join(tmp_dir, "new.paf")
+        start = time.time()
+        if not parsers.maf(raw_maf, new_paf):
+            print("MAF parser failed", file=sys.stderr)
+            return 1
+        new_time = time.time() - start
+
+        with open(former_paf) as former, open(new_paf) as new:
+            former_lines = former.readlines()
+            new_lines = new.readlines()
+
+        print("%-10s %-16s %-16s %-10s" % ("blocks", "former (s)", "new (s)", "identical"))
+        print("%-10d %-16.3f %-16.3f %-10s" % (args.nb_blocks, former_time, new_time, former_lines == new_lines))
+        if former_lines != new_lines:
+            for i, (former_line, new_line) in enumerate(zip(former_lines, new_lines)):
+                if former_line != new_line:
+                    print("First difference, block %d:\n  former: %s  new:    %s" % (i, former_line, new_line),
+                          file=sys.stderr)
+                    break
+            else:
+                print("Number of lines differ: %d vs %d" % (len(former_lines), len(new_lines)), file=sys.stderr)
+            return 1
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
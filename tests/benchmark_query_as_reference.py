@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark the build of the query as reference (Paf.build_query_chr_as_reference) on a synthetic job with a highly
+fragmented query
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import dgenies.lib.paf
+from dgenies.lib.paf import Paf
+from dgenies.lib.match_store import MatchStore
+from dgenies.lib.fasta_extractor import FastaExtractor
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the build of the query as reference on a synthetic job")
+    parser.add_argument('-n', '--nb-contigs', type=int, required=False, default=100000,
+                        help="Number of contigs of the query")
+    parser.add_argument('-t', '--nb-targets', type=int, required=False, default=30,
+                        help="Number of chromosomes of the target")
+    parser.add_argument('-l', '--max-length', type=int, required=False, default=1000,
+                        help="Max length of query contigs")
+    parser.add_argument('--with-index', action='store_const', const=True, default=False,
+                        help="Also time the former ordering of queries (q_order.index, quadratic)")
+    parser.add_argument('-s', '--seed', type=int, required=False, default=42, help="Random seed")
+
+    return parser.parse_args()
+
+
+def write_job(job_dir, nb_contigs, nb_targets, max_length, rng):
+    """
+    Write a synthetic job: query fasta and index, target index and PAF file. Each query contig has one or two matches
+    on random chromosomes, 10% of contigs have no match
+
+    :param job_dir: job folder
+    :param nb_contigs: number of query contigs
+    :param nb_targets: number of target chromosomes
+    :param max_length: max length of query contigs
+    :param rng: random generator
+    """
+    targets = [("chr%d" % i, rng.randint(50000000, 200000000)) for i in range(nb_targets)]
+    with open(os.path.join(job_dir, "target.idx"), "w") as idx:
+        idx.write("target\n")
+        for target in targets:
+            idx.write("%s\t%d\n" % target)
+    query_fasta = os.path.join(job_dir, "query.fasta")
+    with open(query_fasta, "w") as fasta, open(os.path.join(job_dir, "query.idx"), "w") as idx, \
+            open(os.path.join(job_dir, "map.paf"), "w") as paf:
+        idx.write("query\n")
+        for i in range(nb_contigs):
+            name = "contig%d" % i
+            length = rng.randint(100, max_length)
+            idx.write("%s\t%d\n" % (name, length))
+            sequence = "".join(rng.choice("ACGT") for _ in range(length))
+            fasta.write(">%s\n%s\n" % (name, "\n".join(sequence[j:j + 60] for j in range(0, length, 60))))
+            if rng.random() < 0.1:
+                continue
+            for _ in range(rng.randint(1, 2)):
+                t_name, t_len = rng.choice(targets)
+                q_start = rng.randint(0, length // 2)
+                q_end = rng.randint(q_start + 1, length)
+                t_start = rng.randint(0, t_len - length)
+                paf.write("\t".join(map(str, (name, length, q_start, q_end, rng.choice("+-"), t_name, t_len, t_start,
+                                              t_start + q_end - q_start, q_end - q_start, q_end - q_start, 60)))
+                          + "\n")
+    with open(os.path.join(job_dir, ".query"), "w") as query_file:
+        query_file.write(query_fasta)
+
+
+def timed(function, *args, **kwargs):
+    """
+    Run a function
+
+    :return: time of the run (seconds)
+    """
+    start = time.time()
+    function(*args, **kwargs)
+    return time.time() - start
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    dgenies.lib.paf.MODE = "standalone"  # No mail
+    with tempfile.TemporaryDirectory() as job_dir:
+        write_job(job_dir, args.nb_contigs, args.nb_targets, args.max_length, rng)
+        paf_file = os.path.join(job_dir, "map.paf")
+        idx_q = os.path.join(job_dir, "query.idx")
+        idx_t = os.path.join(job_dir, "target.idx")
+        MatchStore.build(paf_file)
+        # Samtools index of the query is built once, by the first extraction:
+        print("%-42s %8.2f s" % ("Index of query fasta",
+                                 timed(lambda: FastaExtractor(os.path.join(job_dir, "query.fasta")).close())))
+
+        paf = Paf(paf_file, idx_q, idx_t, auto_parse=False)
+        print("%-42s %8.2f s" % ("Sort of contigs", timed(paf.sort)))
+
+        paf = Paf(paf_file, idx_q, idx_t, auto_parse=False)
+        print("%-42s %8.2f s" % ("Query as reference (saved association)",
+                                 timed(paf.build_query_chr_as_reference, compress=False)))
+
+        for f in os.listdir(job_dir):
+            if "_as_reference_" in f:
+                os.remove(os.path.join(job_dir, f))
+        os.remove(paf_file + ".assoc")
+        paf = Paf(paf_file, idx_q, idx_t, auto_parse=False)
+        print("%-42s %8.2f s" % ("Query as reference (association computed)",
+                                 timed(paf.build_query_chr_as_reference, compress=False)))
+
+        contigs_assoc = paf.load_queries_on_target_association()
+        q_positions = {contig: position for position, contig in enumerate(paf.q_order)}
+        print("%-42s %8.2f s" % ("Ordering of queries (positions map)",
+                                 timed(lambda: [sorted(queries, key=q_positions.get)
+                                                for queries in contigs_assoc.values()])))
+        if args.with_index:
+            print("%-42s %8.2f s" % ("Ordering of queries (q_order.index)",
+                                     timed(lambda: [sorted(queries, key=paf.q_order.index)
+                                                    for queries in contigs_assoc.values()])))
+
+
+if __name__ == '__main__':
+    main()
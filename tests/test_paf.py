@@ -0,0 +1,97 @@
+"""
+Check outputs of the Paf class (dot plot data, sort, reverse of a contig, summary) on a small job. Expected outputs
+(data/paf/expected.json) were produced by the former implementation of Paf, based on lists of lines and interval trees
+"""
+
+import os
+import sys
+import json
+import shutil
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from dgenies.lib.paf import Paf
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "paf")
+
+
+@pytest.fixture(scope="module")
+def expected():
+    with open(os.path.join(DATA_DIR, "expected.json")) as expected_f:
+        return json.load(expected_f)
+
+
+@pytest.fixture
+def job(tmp_path):
+    """
+    Copy the job files (PAF and indexes) in a temporary folder
+
+    :return: PAF file path, query index file path, target index file path
+    """
+    files = []
+    for name in ("map.paf", "query.idx", "target.idx"):
+        shutil.copy(os.path.join(DATA_DIR, name), str(tmp_path))
+        files.append(str(tmp_path / name))
+    return files
+
+
+def assert_same(actual, expected, path="data"):
+    """
+    Check that two JSON-like objects are equal. Floats are compared with a relative tolerance
+
+    :param actual: actual object
+    :param expected: expected object
+    :param path: path of the objects in the compared data, for error messages
+    """
+    if isinstance(expected, dict):
+        assert isinstance(actual, dict), path
+        assert sorted(actual) == sorted(expected), path
+        for key in expected:
+            assert_same(actual[key], expected[key], "%s[%r]" % (path, key))
+    elif isinstance(expected, list):
+        assert isinstance(actual, list), path
+        assert len(actual) == len(expected), path
+        for i, (actual_item, expected_item) in enumerate(zip(actual, expected)):
+            assert_same(actual_item, expected_item, "%s[%d]" % (path, i))
+    elif isinstance(expected, float):
+        assert actual == pytest.approx(expected, rel=1e-9), path
+    else:
+        assert actual == expected, path
+
+
+def d3js_data(paf, idx_q, idx_t):
+    """
+    Get dot plot data of a job, as sent to the client (JSON)
+    """
+    paf_o = Paf(paf, idx_q, idx_t)
+    assert paf_o.parsed, paf_o.error
+    return json.loads(json.dumps(paf_o.get_d3js_data()))
+
+
+def test_get_d3js_data(job, expected):
+    assert_same(d3js_data(*job), expected["graph"])
+
+
+def test_get_d3js_data_sampled(job, expected, monkeypatch):
+    monkeypatch.setattr(Paf, "max_nb_lines", 60)
+    assert_same(d3js_data(*job), expected["sampled"])
+
+
+def test_summary(job, expected):
+    status_file = os.path.join(os.path.dirname(job[0]), ".summarize")
+    open(status_file, "w").close()
+    percents = Paf(*job, auto_parse=False).build_summary_stats(status_file=status_file)
+    assert not os.path.exists(status_file)
+    assert_same(json.loads(json.dumps(percents)), expected["summary"])
+
+
+def test_sort(job, expected):
+    Paf(*job, auto_parse=False).sort()
+    assert_same(d3js_data(*job), expected["sorted"])
+
+
+def test_reverse_contig(job, expected):
+    Paf(*job, auto_parse=False).reverse_contig("ctg3")
+    assert_same(d3js_data(*job), expected["reversed"])